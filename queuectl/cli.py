@@ -1,49 +1,85 @@
 #!/usr/bin/env python3
 import click
-import os
 import importlib
+from queuectl.core import connection, records
+
+# Every subcommand: name -> (module, attribute, short help). Kept static so
+# that resolving one command imports only its own module, and `--help` lists
+# them all without importing any. Add new commands here.
+COMMANDS = {
+    "bench": ("queuectl.commands.bench", "bench", "Benchmark queue throughput and latency against the configured Redis."),
+    "config": ("queuectl.commands.config", "config", "Manage global queue configuration"),
+    "dlq": ("queuectl.commands.dlq", "dlq", "Manage the Dead Letter Queue (DLQ)"),
+    "enqueue": ("queuectl.commands.enqueue", "enqueue", "Enqueue a new shell command as a job to the queue."),
+    "list": ("queuectl.commands.list", "list", "List jobs in the queue."),
+    "logs": ("queuectl.commands.logs", "view_logs", "View the logs for a specific job."),
+    "metrics": ("queuectl.commands.metrics", "metrics", "Print job timing metrics in the Prometheus text format."),
+    "migrate": ("queuectl.commands.migrate", "migrate", "Convert stored jobs to the compact record format."),
+    "schedule": ("queuectl.commands.schedule", "schedule", "Manage scheduled and recurring jobs"),
+    "status": ("queuectl.commands.status", "status", "Show a summary of job statuses and active workers."),
+    "worker": ("queuectl.commands.worker", "worker", "Manage background worker(s)."),
+    "workflow": ("queuectl.commands.workflow", "workflow", "Submit and inspect workflows of dependent jobs"),
+}
 
-CMD_FOLDER = os.path.join(os.path.dirname(__file__), "commands")
 
 class CLIGroup(click.Group):
-    """Dynamically loads subcommands from the 'commands' folder."""
+    """Loads subcommands from the COMMANDS registry on first use."""
 
     def list_commands(self, ctx):
-        rv = []
-        for filename in os.listdir(CMD_FOLDER):
-            if filename.endswith(".py") and filename != "__init__.py":
-                rv.append(filename[:-3])
-        rv.sort()
-        return rv
+        return sorted(COMMANDS)
 
     def get_command(self, ctx, cmd_name):
+        entry = COMMANDS.get(cmd_name)
+        if entry is None:
+            return None
+        mod_path, attr, _ = entry
         try:
-            mod_path = f"queuectl.commands.{cmd_name}"
             mod = importlib.import_module(mod_path)
-
-            # ✅ Try to get a Click Group or Command named exactly as the file
-            cmd_obj = getattr(mod, cmd_name, None)
-            if isinstance(cmd_obj, (click.Group, click.Command)):
-                return cmd_obj
-
-            # ✅ Fallback: first Click object found
-            for attr in dir(mod):
-                obj = getattr(mod, attr)
-                if isinstance(obj, (click.Group, click.Command)):
-                    return obj
-
-            click.echo(f"⚠️ No valid click command found in {mod_path}")
-            return None
-
         except ImportError as e:
             click.echo(f"⚠️ Error loading command '{cmd_name}': {e}")
             return None
 
+        cmd_obj = getattr(mod, attr, None)
+        if isinstance(cmd_obj, (click.Group, click.Command)):
+            return cmd_obj
+        click.echo(f"⚠️ No valid click command found in {mod_path}")
+        return None
+
+    def format_commands(self, ctx, formatter):
+        # Use the registry's help text instead of importing every module
+        rows = [(name, COMMANDS[name][2]) for name in self.list_commands(ctx)]
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
 
 @click.group(cls=CLIGroup)
-def cli():
+@click.option(
+    "--redis-url",
+    envvar="QUEUECTL_REDIS_URL",
+    default=None,
+    help="Redis server, e.g. redis://host:6379/0 or unix:///run/redis.sock "
+         "(default: redis://localhost:6379/0, env: QUEUECTL_REDIS_URL).",
+)
+@click.option(
+    "--redis-max-connections",
+    envvar="QUEUECTL_REDIS_MAX_CONNECTIONS",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Size of the shared Redis connection pool (env: QUEUECTL_REDIS_MAX_CONNECTIONS).",
+)
+@click.option(
+    "--payload-codec",
+    envvar="QUEUECTL_PAYLOAD_CODEC",
+    type=click.Choice(records.CODECS),
+    default=None,
+    help="Encoding for stored job data and results; msgpack needs the msgpack "
+         "package (default: json, env: QUEUECTL_PAYLOAD_CODEC).",
+)
+def cli(redis_url, redis_max_connections, payload_codec):
     """QueueCTL — Background Job Queue CLI."""
-    pass
+    connection.configure(url=redis_url, max_connections=redis_max_connections)
+    records.configure(payload_codec=payload_codec)
 
 
 if __name__ == "__main__":
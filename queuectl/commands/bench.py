@@ -0,0 +1,108 @@
+import click
+import json
+from queuectl.core import bench as benchmarks
+from queuectl.core.storage import RedisStorage
+
+storage = RedisStorage()
+
+
+def parse_counts(ctx, param, value):
+    """Comma-separated positive integers, e.g. 1,4,16."""
+    if value is None:
+        return None
+    try:
+        counts = tuple(int(item) for item in value.split(","))
+    except ValueError:
+        raise click.BadParameter(f"Expected comma-separated numbers, got {value!r}")
+    if any(count < 1 for count in counts):
+        raise click.BadParameter("Counts must be at least 1")
+    return counts
+
+
+def print_results(results):
+    for metric, value in benchmarks.flatten(results["results"]).items():
+        click.echo(f"  {metric:<45} {value}")
+
+
+def print_comparison(rows, max_regression):
+    """Print baseline vs current; returns the metrics that regressed past `max_regression` %."""
+    regressed = []
+    click.echo("\n📊 Compared with baseline (before -> after, change):")
+    for metric, before, after, change in rows:
+        flag = ""
+        if max_regression is not None and change * 100 < -max_regression:
+            regressed.append(metric)
+            flag = "  ❌"
+        click.echo(f"  {metric:<45} {before} -> {after}  ({change:+.1%}){flag}")
+    return regressed
+
+
+@click.command("bench")
+@click.option(
+    "--only",
+    type=click.Choice(benchmarks.BENCHMARKS),
+    multiple=True,
+    help="Run only this benchmark (repeatable). Runs all of them by default.",
+)
+@click.option("--jobs", type=click.IntRange(min=1), default=None,
+              help=f"Jobs to enqueue for the enqueue benchmark [default: {benchmarks.DEFAULTS['jobs']}].")
+@click.option("--latency-samples", type=click.IntRange(min=1), default=None,
+              help=f"Jobs to time pickup latency over [default: {benchmarks.DEFAULTS['latency_samples']}].")
+@click.option("--workers", default=None, callback=parse_counts,
+              help="Comma-separated worker thread counts for the throughput benchmark [default: 1,4,16].")
+@click.option("--throughput-jobs", type=click.IntRange(min=1), default=None,
+              help=f"No-op jobs per throughput run [default: {benchmarks.DEFAULTS['throughput_jobs']}].")
+@click.option("--sizes", default=None, callback=parse_counts,
+              help="Comma-separated job counts to time list/status at [default: 10000,100000,1000000].")
+@click.option("--output", "-o", type=click.Path(dir_okay=False, writable=True), default=None,
+              help="Write the results as JSON to this file.")
+@click.option("--compare", "baseline", type=click.File("r"), default=None,
+              help="JSON results of an earlier run to compare against.")
+@click.option("--max-regression", type=click.FloatRange(min=0), default=None,
+              help="With --compare, exit with status 1 if any metric is this many percent worse.")
+def bench(only, jobs, latency_samples, workers, throughput_jobs, sizes, output, baseline,
+          max_regression):
+    """
+    Benchmark queue throughput and latency against the configured Redis.
+
+    Measures enqueue rate (single and bulk), pickup latency p50/p99,
+    end-to-end no-op job throughput per worker count, and list/status time
+    at growing job counts. The database must be empty and is flushed
+    afterwards, so point --redis-url at one reserved for benchmarks, e.g.
+    redis://localhost:6379/15.
+    """
+    try:
+        results = benchmarks.run(
+            storage,
+            only=only or benchmarks.BENCHMARKS,
+            progress=lambda name: click.echo(f"⏱️ Running {name} benchmark...", err=True),
+            jobs=jobs,
+            latency_samples=latency_samples,
+            workers=workers,
+            throughput_jobs=throughput_jobs,
+            sizes=sizes,
+        )
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+    click.echo("🏁 Benchmark results:")
+    print_results(results)
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        click.echo(f"💾 Results written to {output}")
+
+    if baseline:
+        try:
+            rows = benchmarks.compare(json.load(baseline), results)
+        except (ValueError, KeyError) as e:
+            raise click.ClickException(f"Invalid baseline results: {e}")
+        regressed = print_comparison(rows, max_regression)
+        if regressed:
+            raise click.ClickException(
+                f"{len(regressed)} metric(s) regressed by more than {max_regression}%."
+            )
+
+
+if __name__ == "__main__":
+    bench()
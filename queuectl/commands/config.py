@@ -1,5 +1,14 @@
 import click
-from queuectl.core.storage import RedisStorage
+from queuectl.core.storage import (
+    ARCHIVE,
+    MAX_RETAINED,
+    PRIORITY_MODE,
+    PRIORITY_MODES,
+    PRIORITY_WEIGHTS,
+    RETENTION_TTLS,
+    RedisStorage,
+    parse_weights,
+)
 
 storage = RedisStorage()
 CONFIG_KEY = "queuectl:config"
@@ -14,6 +23,8 @@ def show_config():
     if not config_data:
         click.echo("⚠️ No configuration found. Using defaults:")
         click.echo("   max_retries=3, backoff_base=2, backoff_factor=2")
+        click.echo("   finished jobs are kept forever")
+        click.echo("   priority lanes shared by weight (weight = level)")
         return
 
     click.echo("⚙️ Current Queue Configuration:")
@@ -23,12 +34,43 @@ def show_config():
         click.echo(f"{k} = {v}")
     click.echo("-" * 40)
 
-@config.command("set", help="Set global retry/backoff settings")
+@config.command("set", help="Set global retry/backoff and retention settings")
 @click.option("--max-retries", type=int)
 @click.option("--backoff-base", type=int)
 @click.option("--backoff-factor", type=int)
+@click.option(
+    "--completed-ttl",
+    type=click.IntRange(min=0),
+    help="Seconds to keep completed jobs after they finish (0 = forever).",
+)
+@click.option(
+    "--dead-ttl",
+    type=click.IntRange(min=0),
+    help="Seconds to keep dead (DLQ) jobs after they fail (0 = forever).",
+)
+@click.option(
+    "--max-retained",
+    type=click.IntRange(min=0),
+    help="Keep at most this many completed, and this many dead, jobs (0 = no limit).",
+)
+@click.option(
+    "--archive/--no-archive",
+    default=None,
+    help="Archive expired jobs to compressed JSONL files instead of just deleting them.",
+)
+@click.option(
+    "--priority-mode",
+    type=click.Choice(PRIORITY_MODES),
+    help="Share workers between priority lanes by weight, or always serve the highest first.",
+)
+@click.option(
+    "--priority-weights",
+    help="Lane weights for weighted mode, e.g. 'high=8,normal=4,low=1' (default: weight = level).",
+)
 @click.pass_context  # <-- 1. Add this decorator
-def set_config(ctx, max_retries, backoff_base, backoff_factor): # <-- 2. Add ctx
+def set_config(ctx, max_retries, backoff_base, backoff_factor,
+               completed_ttl, dead_ttl, max_retained, archive,
+               priority_mode, priority_weights): # <-- 2. Add ctx
     updates = {}
     if max_retries is not None:
         updates["max_retries"] = max_retries
@@ -36,6 +78,21 @@ def set_config(ctx, max_retries, backoff_base, backoff_factor): # <-- 2. Add ctx
         updates["backoff_base"] = backoff_base
     if backoff_factor is not None:
         updates["backoff_factor"] = backoff_factor
+    if completed_ttl is not None:
+        updates[RETENTION_TTLS["completed"]] = completed_ttl
+    if dead_ttl is not None:
+        updates[RETENTION_TTLS["dead"]] = dead_ttl
+    if max_retained is not None:
+        updates[MAX_RETAINED] = max_retained
+    if archive is not None:
+        updates[ARCHIVE] = int(archive)
+    if priority_mode is not None:
+        updates[PRIORITY_MODE] = priority_mode
+    if priority_weights is not None:
+        try:
+            updates[PRIORITY_WEIGHTS] = parse_weights(priority_weights)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--priority-weights")
 
     if not updates:
         click.echo("⚠️ No options provided.")
@@ -50,6 +107,9 @@ def set_config(ctx, max_retries, backoff_base, backoff_factor): # <-- 2. Add ctx
 def reset_config(ctx):  # <-- 2. Add ctx
     default = {"max_retries": 3, "backoff_base": 2, "backoff_factor": 2}
     storage.r.hset(CONFIG_KEY, mapping=default)
+    storage.r.hdel(
+        CONFIG_KEY, *RETENTION_TTLS.values(), MAX_RETAINED, ARCHIVE, PRIORITY_MODE, PRIORITY_WEIGHTS
+    )
     click.echo("♻️ Configuration reset to defaults:")
     ctx.invoke(show_config)  # <-- 3. Use ctx.invoke()
 
@@ -1,6 +1,7 @@
 import click
 import json
-from queuectl.core.storage import RedisStorage
+from queuectl.core.options import validate_with
+from queuectl.core.storage import RedisStorage, parse_queue_name
 
 storage = RedisStorage()
 
@@ -13,10 +14,13 @@ def dlq():
 # 🪦 LIST DLQ JOBS (uses job_keys pattern)
 # -----------------------------------------------------------
 @dlq.command("list", help="List all jobs in the Dead Letter Queue")
-def list_dlq():
-    dlq_job_ids = storage.r.lrange("queuectl:dead_letter", 0, -1)
+@click.option(
+    "--queue", default=None, callback=validate_with(parse_queue_name), help="Only list this queue's DLQ."
+)
+def list_dlq(queue):
+    dlq_jobs = storage.list_dlq(queue)
 
-    if not dlq_job_ids:
+    if not dlq_jobs:
         click.echo("✅ DLQ is empty.")
         return
 
@@ -24,13 +28,8 @@ def list_dlq():
     click.echo("=" * 60)
 
     count = 0
-    for job_id in dlq_job_ids:
-        job_key = f"queuectl:jobs:{job_id}"
-        job = storage.r.hgetall(job_key)
-
-        if not job:
-            continue
-
+    for job in dlq_jobs:
+        job_id = job["id"]
         status = job.get("status", "dead")
         reason = job.get("reason", "No reason provided")
         failed_at = job.get("failed_at", "?")
@@ -44,7 +43,8 @@ def list_dlq():
         except Exception:
             command = str(data_raw)
 
-        click.echo(f"[{job_id}] {command} - {status} ({date_added})")
+        queue_label = f" [queue: {job['queue']}]" if job.get("queue", "default") != "default" else ""
+        click.echo(f"[{job_id}] {command} - {status} ({date_added}){queue_label}")
         click.echo(f"   └─ Reason: {reason}")
         click.echo(f"   └─ Failed at: {failed_at}")
         click.echo("-" * 60)
@@ -59,34 +59,17 @@ def list_dlq():
 @dlq.command("retry", help="Retry a specific DLQ job by ID")
 @click.argument("job_id")
 def retry_dlq(job_id):
-    job_key = f"queuectl:jobs:{job_id}"
-    job = storage.r.hgetall(job_key)
+    status = storage.retry_dead_job(job_id)
 
-    if not job:
+    if status is None:
         click.echo(f"❌ Job {job_id} not found.")
         return
 
-    if job.get("status") != "dead":
-        click.echo(f"⚠️ Job {job_id} is not in DLQ (status: {job.get('status')}).")
+    if status != "dead":
+        click.echo(f"⚠️ Job {job_id} is not in DLQ (status: {status}).")
         return
 
-    # Remove from DLQ list
-    storage.r.lrem("queuectl:dead_letter", 0, job_id)
-
-    # Reset job metadata
-    storage.r.hset(job_key, mapping={
-        "status": "pending",
-        "reason": "",
-        "failed_at": "",
-        "attempts": 0,
-        "last_error": "",
-        "next_retry_at": ""
-    })
-
-    # Push back to main queue
-    storage.r.lpush("queuectl:jobs", job_id)
-
-    click.echo(f"♻️ Job {job_id} requeued successfully from DLQ → main queue.")
+    click.echo(f"♻️ Job {job_id} requeued successfully from DLQ → its queue.")
 
 
 if __name__ == "__main__":
@@ -1,32 +1,200 @@
 import click
+import json
+import sys
 # Assuming 'queuectl.core.queue_manager' is in your project's PYTHONPATH
-from queuectl.core.queue_manager import enqueue_job
+from queuectl.core.queue_manager import enqueue_job, enqueue_many, storage
+from queuectl.core.options import validate_with
+from queuectl.core.records import format_timestamp
+from queuectl.core.schedules import parse_duration, parse_run_at
+from queuectl.core.storage import parse_limit_name, parse_priority, parse_queue_name, parse_rate
+
+
+def read_jobs(stream, timeout):
+    """
+    Yield job data dicts from a line-oriented stream. Each line is either a
+    JSON object (e.g. {"command": "echo hi", "timeout": 5}) or a plain shell
+    command. Blank lines are skipped.
+    """
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                job_data = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise click.ClickException(f"Invalid JSON on line {line_no}: {e}")
+            if not job_data.get("command"):
+                raise click.ClickException(f"Missing 'command' on line {line_no}")
+            job_data.setdefault("timeout", timeout)
+        else:
+            job_data = {"command": line, "timeout": timeout}
+        yield job_data
+
+
+def split_ids(ctx, param, value):
+    """Job ids from repeated and/or comma-separated option values."""
+    return [job_id for item in value for job_id in item.replace(",", " ").split()]
+
 
 @click.command()
-@click.argument("command")
+@click.argument("command", required=False)
 @click.option(
     "--timeout",
     default=None,
     type=int,
     help="Job execution timeout in seconds. (Default: No limit)",
 )
-def enqueue(command, timeout):
+@click.option(
+    "--from-file",
+    "from_file",
+    type=click.File("r"),
+    default=None,
+    help="Bulk-enqueue one job per line (JSON object or plain command) from a file.",
+)
+@click.option(
+    "--stdin",
+    "from_stdin",
+    is_flag=True,
+    help="Bulk-enqueue one job per line read from standard input.",
+)
+@click.option(
+    "--batch-size",
+    default=1000,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Jobs per pipelined write when bulk-enqueueing.",
+)
+@click.option(
+    "--priority",
+    default=None,
+    callback=validate_with(parse_priority),
+    help="high, normal (default) or low, or a level from 1 (lowest) to 9 (highest).",
+)
+@click.option(
+    "--queue",
+    default=None,
+    callback=validate_with(parse_queue_name),
+    help="Named queue to add the job to (default: the default queue).",
+)
+@click.option(
+    "--run-at",
+    default=None,
+    callback=validate_with(parse_run_at),
+    help="Hold the job until this time (epoch seconds, or ISO 8601 like '2025-01-31 09:30').",
+)
+@click.option(
+    "--delay",
+    default=None,
+    callback=validate_with(parse_duration),
+    help="Hold the job for this long first, e.g. 30s, 5m, 2h.",
+)
+@click.option(
+    "--after",
+    multiple=True,
+    callback=split_ids,
+    metavar="JOB_ID",
+    help="Only run once this job has completed (repeatable, or comma-separated). "
+         "If it ends up dead, so does this job.",
+)
+@click.option(
+    "--idempotency-key",
+    default=None,
+    help="Skip the enqueue if a job with this key was added in the last 24 hours.",
+)
+@click.option(
+    "--cache-ttl",
+    default=None,
+    callback=validate_with(parse_duration),
+    help="Reuse the result of an identical job (same command and timeout) completed "
+         "within this long instead of running it again, e.g. 10m, 1h.",
+)
+@click.option(
+    "--concurrency-key",
+    default=None,
+    callback=validate_with(parse_limit_name),
+    help="Limit class shared with other jobs (e.g. a database they all use); "
+         "--concurrency and --rate apply to every job with this key.",
+)
+@click.option(
+    "--concurrency",
+    default=None,
+    type=click.IntRange(min=0),
+    help="Run at most this many jobs with the concurrency key at once, across all workers (0: no cap).",
+)
+@click.option(
+    "--rate",
+    default=None,
+    callback=validate_with(parse_rate),
+    help="Start at most this many jobs with the concurrency key per period, e.g. 100/s, 5/m (0: no cap).",
+)
+def enqueue(command, timeout, from_file, from_stdin, batch_size, priority, queue, run_at, delay,
+            after, idempotency_key, cache_ttl, concurrency_key, concurrency, rate):
     """
     Enqueue a new shell command as a job to the queue.
 
     Example:
       python cli.py enqueue "echo hello world"
       python cli.py enqueue --timeout 30 "ls -la"
+      python cli.py enqueue --priority high "make deploy"
+      python cli.py enqueue --queue reports "python build_report.py"
+      python cli.py enqueue --delay 30s "echo later"
+      python cli.py enqueue --after <job_id> --after <job_id> "python merge.py"
+      python cli.py enqueue --idempotency-key order-1234 "python charge.py 1234"
+      python cli.py enqueue --cache-ttl 1h "python render.py report.md"
+      python cli.py enqueue --concurrency-key db --concurrency 20 --rate 100/s "python load.py"
       python cli.py enqueue "cat missingfile.txt"
+      python cli.py enqueue --from-file jobs.jsonl
+      cat jobs.txt | python cli.py enqueue --stdin
     """
+    sources = [command is not None, from_file is not None, from_stdin]
+    if sum(sources) != 1:
+        raise click.UsageError("Provide exactly one of COMMAND, --from-file or --stdin.")
+    if run_at is not None and delay is not None:
+        raise click.UsageError("--run-at and --delay are mutually exclusive.")
+    if idempotency_key is not None and command is None:
+        raise click.UsageError("--idempotency-key applies to a single COMMAND.")
+    if (concurrency is not None or rate is not None) and concurrency_key is None:
+        raise click.UsageError("--concurrency and --rate need a --concurrency-key.")
+    if concurrency is not None or rate is not None:
+        storage.set_limit(concurrency_key, concurrency=concurrency, rate=rate)
+    if delay is not None:
+        run_at = storage.server_time() + delay
+
+    if command is None:
+        stream = from_file if from_file is not None else sys.stdin
+        try:
+            count, elapsed = enqueue_many(
+                read_jobs(stream, timeout), batch_size=batch_size, priority=priority, queue=queue,
+                run_at=run_at, after=after, cache_ttl=cache_ttl,
+                concurrency_key=concurrency_key,
+            )
+        except click.ClickException:
+            raise
+        except Exception as e:
+            click.echo(f"❌ Error enqueueing jobs: {e}", err=True)
+            return
+        rate = count / elapsed if elapsed > 0 else float(count)
+        click.echo(f"✅ Enqueued {count} jobs in {elapsed:.2f}s ({rate:,.0f} jobs/s)")
+        return
+
     # Pass the timeout to your job data dictionary
     job_data = {"command": command, "timeout": timeout}
 
     try:
         # Assuming enqueue_job now accepts this new structure
-        enqueue_job(job_data)
+        _, added = enqueue_job(
+            job_data, priority=priority, queue=queue, run_at=run_at, after=after,
+            idempotency_key=idempotency_key, cache_ttl=cache_ttl, concurrency_key=concurrency_key,
+        )
+        if not added:
+            return
         timeout_msg = f"with timeout {timeout}s" if timeout is not None else "with no timeout"
         click.echo(f"✅ Job enqueued {timeout_msg}: {command}")
+        if run_at is not None and run_at > storage.server_time():
+            click.echo(f"⏰ Scheduled to run at {format_timestamp(run_at)}")
+        if after:
+            click.echo(f"⛓  Waits for {len(after)} job(s) to complete first")
     except Exception as e:
         click.echo(f"❌ Error enqueueing job: {e}", err=True)
 
@@ -1,37 +1,97 @@
+import os
+import sys
 import click
-from queuectl.core.queue_manager import list_jobs  # <-- We'll rename this
+from queuectl.core.queue_manager import list_jobs
+from queuectl.core.storage import decode_cursor
+
+
+def validate_cursor(ctx, param, value):
+    if value is not None:
+        try:
+            decode_cursor(value)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    return value
+
 
 @click.command()
 @click.option(
     "--state",
     type=click.Choice(
-        ['pending', 'processing', 'completed', 'failed', 'dead'], 
+        ['scheduled', 'waiting', 'pending', 'processing', 'completed', 'failed', 'dead'],
         case_sensitive=False
     ),
     default=None,  # This will be None if the option is not used
     help="Filter by job state. Lists all jobs if omitted."
 )
-def list(state):
+@click.option("--limit", type=click.IntRange(min=1), default=None, help="Show at most this many jobs.")
+@click.option(
+    "--cursor",
+    default=None,
+    callback=validate_cursor,
+    help="Continue after the last job of a previous --limit page (its cursor is printed to stderr).",
+)
+@click.option(
+    "--sort",
+    type=click.Choice(["date_added", "-date_added"]),
+    default="date_added",
+    show_default=True,
+    help="Order by enqueue time; '-date_added' lists newest first.",
+)
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(["table", "jsonl"]),
+    default="table",
+    show_default=True,
+    help="Aligned table, or one JSON object per line (for jq and scripts).",
+)
+@click.option(
+    "--archived",
+    is_flag=True,
+    help="List jobs that retention moved to the local archive (oldest first).",
+)
+def list(state, limit, cursor, sort, fmt, archived):
     """
     List jobs in the queue.
-    
+
     By default, lists all known jobs.
     Use --state to filter by a specific status:
+    - 'scheduled': Jobs waiting for their run time.
+    - 'waiting': Jobs waiting for the jobs they depend on to complete.
     - 'pending': Jobs waiting to be run.
     - 'processing': Jobs currently being run.
     - 'completed': Jobs that finished successfully.
     - 'failed': Jobs in the retry queue.
     - 'dead': Jobs in the Dead Letter Queue (DLQ).
+
+    Use --archived for finished jobs that have been expired by retention.
+
+    Rows are streamed as they are fetched, so piping into `head` or `jq`
+    starts producing output immediately.
     """
+    if archived and (cursor or sort != "date_added"):
+        raise click.UsageError("--archived lists in archive order and does not support --cursor or --sort.")
+
     try:
-        if state:
-            click.echo(f"📋 Inspecting '{state}' jobs...")
-        else:
-            click.echo("📋 Inspecting all jobs...")
+        if fmt == "table":
+            if state:
+                click.echo(f"📋 Inspecting '{state}' {'archived ' if archived else ''}jobs...")
+            else:
+                click.echo(f"📋 Inspecting all {'archived ' if archived else ''}jobs...")
 
-        # We pass the state filter (e.g., 'pending' or None) 
+        # We pass the state filter (e.g., 'pending' or None)
         # to the backend function.
-        list_jobs(state_filter=state)
+        next_cursor = list_jobs(
+            state_filter=state, limit=limit, cursor=cursor, sort=sort, fmt=fmt, archived=archived
+        )
+        if next_cursor:
+            click.echo(f"Next cursor: {next_cursor}", err=True)
+
+    except BrokenPipeError:
+        # The reader (e.g. `head`) went away; stop quietly, and keep Python
+        # from failing again when it flushes stdout on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
 
     except Exception as e:
-        click.echo(f"Error connecting to Redis: {e}", err=True)
\ No newline at end of file
+        click.echo(f"Error connecting to Redis: {e}", err=True)
@@ -1,30 +1,81 @@
+import codecs
 import os
+import time
 import click
+from queuectl.core.archive import find_job
+from queuectl.core.job_log import LOG_DIR, log_exists, read_chunks, tail_offset
 from queuectl.core.storage import RedisStorage
 
 storage = RedisStorage()
 
-LOG_DIR = os.path.join(os.path.dirname(__file__), "..", "logs")
+# How often --follow checks the log for new output.
+FOLLOW_INTERVAL = 0.5
+
+# States after which a job's log stops growing (failed jobs are retried).
+FINISHED_STATES = ("completed", "dead")
+
+
+def echo_from(log_path, offset, decoder):
+    """Print the log from `offset` onwards and return the offset reached."""
+    for chunk in read_chunks(log_path, offset):
+        offset += len(chunk)
+        click.echo(decoder.decode(chunk), nl=False)
+    return offset
 
 
 @click.command("logs")
 @click.argument("job_id")
-def view_logs(job_id):
+@click.option("--tail", "-n", type=click.IntRange(min=0), help="Only show the last N lines.")
+@click.option(
+    "--since-offset",
+    type=click.IntRange(min=0),
+    help="Only show output after this byte offset (the offset reached is printed to stderr).",
+)
+@click.option("--follow", "-f", is_flag=True, help="Keep printing new output until the job finishes.")
+def view_logs(job_id, tail, since_offset, follow):
     """
     View the logs for a specific job.
-    Usage: queuectl logs <job_id>
+    Usage: queuectl logs <job_id> [--tail N] [--since-offset N] [--follow]
     """
     log_path = os.path.join(LOG_DIR, f"{job_id}.log")
+    job_key = f"queuectl:jobs:{job_id}"
 
-    # Check Redis if file path is stored (optional fallback)
-    redis_log_path = storage.r.hget(f"queuectl:jobs:{job_id}", "log_file")
-    if redis_log_path and os.path.exists(redis_log_path):
-        log_path = redis_log_path
+    # Records from older versions name their log file; check Redis, then
+    # the retention archive
+    if not log_exists(log_path):
+        job = storage.get_job(job_id) or find_job(job_id)
+        if job and job.get("log_file") and log_exists(job["log_file"]):
+            log_path = job["log_file"]
 
-    if not os.path.exists(log_path):
+    if not log_exists(log_path) and not (follow and storage.r.exists(job_key)):
         click.echo(f"❌ No logs found for job {job_id}")
         return
 
+    offset = since_offset or 0
+    if tail is not None and log_exists(log_path):
+        offset = max(offset, tail_offset(log_path, tail))
+
     click.echo(f"📄 Logs for job {job_id}:\n" + "-" * 50)
-    with open(log_path, "r") as f:
-        click.echo(f.read())
+    # Read a chunk at a time, so memory use does not grow with the log
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    offset = echo_from(log_path, offset, decoder)
+
+    if follow:
+        try:
+            finished = False
+            while True:
+                time.sleep(FOLLOW_INTERVAL)
+                new_offset = echo_from(log_path, offset, decoder)
+                # Stop once a poll after the job finished brings nothing new,
+                # so the worker's closing lines are not cut off
+                if new_offset == offset and finished:
+                    break
+                offset = new_offset
+                status = storage.get_status(job_id)
+                finished = status is None or status in FINISHED_STATES
+        except KeyboardInterrupt:
+            pass
+
+    click.echo(decoder.decode(b"", final=True))
+    if since_offset is not None:
+        click.echo(f"Next offset: {offset}", err=True)
@@ -0,0 +1,24 @@
+import click
+from queuectl.core.storage import RedisStorage
+
+storage = RedisStorage()
+
+
+@click.command("metrics")
+@click.option("--reset", is_flag=True, help="Clear the recorded histograms and counters.")
+def metrics(reset):
+    """
+    Print job timing metrics in the Prometheus text format.
+
+    Includes queue wait, run time and Redis latency histograms, job counters
+    per queue and outcome, and current job and queue counts.
+    """
+    if reset:
+        storage.reset_metrics()
+        click.echo("🧹 Metrics reset.")
+        return
+    click.echo(storage.metrics_text(), nl=False)
+
+
+if __name__ == "__main__":
+    metrics()
@@ -0,0 +1,24 @@
+import click
+from queuectl.core.storage import RedisStorage
+
+storage = RedisStorage()
+
+@click.command()
+def migrate():
+    """
+    Convert stored jobs to the compact record format.
+
+    Rewrites job hashes written by older versions (long field names,
+    formatted timestamps, per-job copies of the default settings). Safe to
+    run repeatedly; run it once after upgrading, before starting workers.
+    """
+    click.echo("🔄 Migrating job records to the compact format...")
+    try:
+        migrated, skipped = storage.migrate_records()
+    except Exception as e:
+        click.echo(f"Error connecting to Redis: {e}", err=True)
+        return
+
+    click.echo(f"✅ Migrated {migrated} job(s).")
+    if skipped:
+        click.echo(f"⚠️ {skipped} job(s) changed while migrating; run 'queuectl migrate' again.")
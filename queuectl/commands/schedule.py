@@ -0,0 +1,78 @@
+import click
+import json
+from queuectl.core.options import validate_with
+from queuectl.core.records import format_timestamp
+from queuectl.core.storage import RedisStorage, parse_priority, parse_queue_name
+
+storage = RedisStorage()
+
+
+@click.group(help="Manage scheduled and recurring jobs")
+def schedule():
+    pass
+
+
+@schedule.command("add", help="Enqueue a command on a recurring cron schedule")
+@click.argument("command")
+@click.option(
+    "--cron",
+    required=True,
+    help="Five-field cron expression in local time, e.g. '*/5 * * * *'.",
+)
+@click.option("--timeout", default=None, type=int, help="Timeout in seconds for each run.")
+@click.option(
+    "--priority",
+    default=None,
+    callback=validate_with(parse_priority),
+    help="Priority of each run's job: high, normal, low or 1-9.",
+)
+@click.option("--queue", default=None, callback=validate_with(parse_queue_name), help="Named queue for each run's job.")
+def add_schedule(command, cron, timeout, priority, queue):
+    try:
+        schedule_id, next_run = storage.add_schedule(
+            cron, {"command": command, "timeout": timeout}, priority=priority, queue=queue
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--cron")
+    click.echo(f"✅ Schedule {schedule_id} added: {command}")
+    click.echo(f"   next run: {format_timestamp(next_run)}")
+
+
+@schedule.command("list", help="List recurring schedules and jobs waiting for their run time")
+@click.option("--queue", default=None, callback=validate_with(parse_queue_name), help="Only list this queue's jobs.")
+def list_schedules(queue):
+    schedules = [s for s in storage.list_schedules() if not queue or (s["queue"] or "default") == queue]
+    click.echo("🔁 Recurring schedules:")
+    if not schedules:
+        click.echo("  (none)")
+    for entry in schedules:
+        click.echo(
+            f"  [{entry['id']}] '{entry['cron']}' → {entry['data'].get('command')}"
+            f" (next: {format_timestamp(entry['next_run'])}, queue: {entry['queue'] or 'default'})"
+        )
+
+    jobs = storage.list_scheduled_jobs(queue)
+    click.echo("\n⏰ Scheduled jobs:")
+    if not jobs:
+        click.echo("  (none)")
+    for job in jobs:
+        try:
+            command = json.loads(job.get("data", "{}")).get("command", "N/A")
+        except (ValueError, AttributeError):
+            command = job.get("data")
+        click.echo(f"  [{job['id']}] {command} (runs at: {job.get('run_at', '?')}, queue: {job['queue']})")
+
+
+@schedule.command("cancel", help="Cancel a recurring schedule or a job that has not run yet")
+@click.argument("schedule_or_job_id")
+def cancel(schedule_or_job_id):
+    if storage.remove_schedule(schedule_or_job_id):
+        click.echo(f"🗑️ Schedule {schedule_or_job_id} removed.")
+    elif storage.cancel_scheduled_job(schedule_or_job_id):
+        click.echo(f"🗑️ Scheduled job {schedule_or_job_id} cancelled.")
+    else:
+        click.echo(f"❌ No schedule or scheduled job {schedule_or_job_id} found.")
+
+
+if __name__ == "__main__":
+    schedule()
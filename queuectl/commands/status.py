@@ -1,13 +1,16 @@
 import click
-import json
-from collections import Counter
-from queuectl.core.storage import RedisStorage
+from queuectl.core.storage import DEFAULT_PRIORITY, PRIORITY_NAMES, RedisStorage
 from queuectl.core.queue_manager import get_active_workers
 
 storage = RedisStorage()
 
 @click.command()
-def status():
+@click.option(
+    "--recount",
+    is_flag=True,
+    help="Rebuild the job counters from the stored jobs before printing.",
+)
+def status(recount):
     """
     Show a summary of job statuses and active workers.
     """
@@ -17,21 +20,68 @@ def status():
     # === JOB STATUS SUMMARY ===
     click.echo("\n🧱 Jobs Summary:")
     try:
-        job_keys = storage.r.keys("queuectl:jobs:*")
-        if not job_keys:
-            click.echo("No jobs found.")
+        if recount:
+            click.echo("🔄 Recounting jobs from stored data...")
+            stats = storage.recount_stats()
         else:
-            status_counts = Counter()
-            for key in job_keys:
-                job = storage.r.hgetall(key)
-                status = job.get("status", "unknown")
-                status_counts[status] += 1
+            stats = storage.get_stats()
 
-            total_jobs = sum(status_counts.values())
+        status_counts = stats["states"]
+        total_jobs = sum(status_counts.values())
+        if not total_jobs:
+            click.echo("No jobs found.")
+        else:
             for state, count in sorted(status_counts.items()):
-                click.echo(f"  {state}: {count}")
+                if count:
+                    click.echo(f"  {state}: {count}")
             click.echo(f"  total: {total_jobs}")
 
+        queues = stats["queues"]
+        click.echo("\n📦 Queues:")
+        click.echo(f"  main queue: {queues['queued']}")
+        # Break the main queue down by priority once anything is off normal
+        lanes = stats["lanes"]
+        if any(depth for level, depth in lanes.items() if level != DEFAULT_PRIORITY):
+            names = {level: name for name, level in PRIORITY_NAMES.items()}
+            for level, depth in lanes.items():
+                if depth:
+                    label = f"{level} ({names[level]})" if level in names else str(level)
+                    click.echo(f"    priority {label}: {depth}")
+        click.echo(f"  retry queue: {queues['retry']}")
+        click.echo(f"  dead letter: {queues['dead_letter']}")
+        click.echo(f"  scheduled: {queues['scheduled']} (recurring schedules: {stats['schedules']})")
+        # Then per named queue, once there are any
+        by_queue = stats["by_queue"]
+        if len(by_queue) > 1:
+            click.echo("  per queue (pending / retry / dead):")
+            width = max(len(name) for name in by_queue)
+            for name, depths in by_queue.items():
+                click.echo(
+                    f"    {name:<{width}}  {depths['queued']} / {depths['retry']} / {depths['dead_letter']}"
+                )
+
+        click.echo("\n📈 Lifetime Totals:")
+        for name, count in stats["totals"].items():
+            click.echo(f"  {name.replace('_total', '')}: {count}")
+        cache = stats["cache"]
+        lookups = cache["cache_hits"] + cache["cache_misses"]
+        if lookups:
+            click.echo(
+                f"  result cache: {cache['cache_hits']} hits, {cache['cache_misses']} misses"
+                f" ({cache['cache_hits'] / lookups:.0%} hit rate)"
+            )
+
+        limits = storage.get_limits()
+        if limits:
+            click.echo("\n🚦 Limits:")
+            for limit in limits:
+                caps = [f"running {limit['running']}/{limit['concurrency'] or '∞'}"]
+                if limit["rate"]:
+                    count, period = limit["rate"]
+                    caps.append(f"rate {count}/{period:g}s")
+                caps.append(f"parked {limit['parked']}")
+                click.echo(f"  {limit['key']}: " + ", ".join(caps))
+
     except Exception as e:
         click.echo(f"⚠️ Error fetching job status: {e}")
 
@@ -42,9 +92,15 @@ def status():
         if not active_workers:
             click.echo("No active workers running.")
         else:
-            for worker_name, info in active_workers.items():
+            pids = {info.get("pid") for info in active_workers.values()}
+            click.echo(f"  {len(active_workers)} worker(s) across {len(pids)} process(es)")
+            for worker_name, info in sorted(active_workers.items()):
                 status = info.get("status", "unknown")
                 current_job = info.get("current_job", "—")
-                click.echo(f"  {worker_name} → {status} (job: {current_job})")
+                queues = info.get("queues", "default")
+                pid = info.get("pid", "?")
+                click.echo(
+                    f"  {worker_name} [pid {pid}] → {status} (job: {current_job}, queues: {queues})"
+                )
     except Exception as e:
         click.echo(f"⚠️ Unable to retrieve worker status: {e}")
@@ -1,52 +1,125 @@
 import click
+import contextlib
+import multiprocessing
+import os
+import signal
 import threading
 import time
+from collections import deque
 from queuectl.core.queue_manager import (
-    process_next_job,
-    should_stop,
+    process_job,
     clear_stop_signal,
     set_stop_signal,
+    watch_stop_signal,
+)
+from queuectl.core import connection, job_log, metrics, profiling
+from queuectl.core.scheduler import RetryScheduler
+from queuectl.core.storage import (
+    DEFAULT_QUEUE,
+    WORKER_LEASE_TTL,
+    RedisStorage,
+    parse_queue_name,
+    worker_owner,
 )
-from queuectl.core.storage import RedisStorage
 
 storage = RedisStorage()
 
+# How long an idle worker blocks waiting for a job before re-checking the
+# (pub/sub driven) stop flag.
+IDLE_TIMEOUT = 1
 
-def run_worker(worker_name):
-    """
-    Worker thread: runs continuously until a stop signal is received.
-    """
-    worker_key = f"queuectl:worker:{worker_name}"
+# Pooled connections needed beyond one per worker thread (control channel
+# listener, retry scheduler, registry updates).
+RESERVED_CONNECTIONS = 8
 
-    storage.r.hset(worker_key, mapping={
-        "status": "active",
-        "current_job": "idle"
-    })
+# How often the supervisor checks on its child processes.
+SUPERVISE_INTERVAL = 0.5
 
-    click.echo(f"🚀 {worker_name} started and waiting for jobs...")
 
+def parse_queues(ctx, param, value):
+    """Comma-separated queue names, in order of preference, without duplicates."""
     try:
-        while True:
-            if should_stop():
-                storage.r.hset(worker_key, mapping={
-                    "status": "stopped",
-                    "current_job": "-"
-                })
-                click.echo(f"🛑 {worker_name} stopping gracefully (received stop signal).")
-                break
+        names = [parse_queue_name(name) for name in value.split(",")]
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    return tuple(dict.fromkeys(names))
+
+
+@contextlib.contextmanager
+def worker_lease(owner):
+    """
+    Hold `owner`'s worker lease while the block runs. It is renewed from a
+    background thread, so a long job does not let it lapse and get its
+    claims requeued by the scheduler.
+    """
+    done = threading.Event()
 
+    def renew():
+        while not done.wait(WORKER_LEASE_TTL / 3):
             try:
-                storage.process_retry_queue()
-                process_next_job(worker_name=worker_name)
+                storage.hold_worker_lease(owner)
             except Exception as e:
-                click.echo(f"⚠️ Error in {worker_name}: {e}. Retrying in 5s...", err=True)
-                time.sleep(5)
-
-            time.sleep(1)
+                click.echo(f"⚠️ Could not renew the lease of {owner}: {e}", err=True)
 
+    storage.hold_worker_lease(owner)
+    thread = threading.Thread(target=renew, name=f"{owner}-lease", daemon=True)
+    thread.start()
+    try:
+        yield
     finally:
-        storage.r.delete(worker_key)
-        click.echo(f"🧹 {worker_name} removed from worker registry.")
+        done.set()
+        thread.join()
+        storage.drop_worker_lease(owner)
+
+
+def run_worker(worker_name, stop_event, prefetch=1, queues=(DEFAULT_QUEUE,)):
+    """
+    Worker thread: runs continuously until a stop signal is received.
+
+    Claims up to `prefetch` jobs at a time from `queues` into a local
+    buffer and drains it back-to-back; only blocks (for at most
+    IDLE_TIMEOUT) when all its queues are empty. Jobs are claimed under an
+    owner id unique to this process, leased for as long as the worker runs.
+    """
+    worker_key = f"queuectl:worker:{worker_name}"
+    owner = worker_owner(worker_name)
+
+    with worker_lease(owner):
+        storage.r.hset(worker_key, mapping={
+            "status": "active",
+            "current_job": "idle",
+            "pid": os.getpid(),
+            "queues": ",".join(queues),
+        })
+
+        click.echo(f"🚀 {worker_name} started and waiting for jobs on {', '.join(queues)}...")
+
+        buffer = deque()
+        try:
+            while not stop_event.is_set():
+                try:
+                    if not buffer:
+                        buffer.extend(
+                            storage.claim_jobs(owner, prefetch, timeout=IDLE_TIMEOUT, queues=queues)
+                        )
+                        continue
+                    job_id, data = buffer.popleft()
+                    process_job(job_id, data, worker_name=worker_name, owner=owner)
+                except Exception as e:
+                    click.echo(f"⚠️ Error in {worker_name}: {e}. Retrying in 5s...", err=True)
+                    stop_event.wait(5)
+
+            if buffer:
+                storage.release_jobs(owner, [job_id for job_id, _ in buffer])
+            storage.r.hset(worker_key, mapping={
+                "status": "stopped",
+                "current_job": "-"
+            })
+            click.echo(f"🛑 {worker_name} stopping gracefully (received stop signal).")
+
+        finally:
+            storage.r.delete(worker_key)
+            click.echo(f"🧹 {worker_name} removed from worker registry.")
 
 
 @click.group()
@@ -55,36 +128,284 @@ def worker():
     pass
 
 @worker.command()
-@click.option("--count", "-c", default=1, help="Number of concurrent workers.")
-def start(count):
+@click.option("--count", "--threads", "-c", "count", default=1, help="Number of concurrent workers (per process).")
+@click.option(
+    "--prefetch",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Jobs each worker claims per dequeue and buffers locally.",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(["threads", "asyncio"]),
+    default="threads",
+    show_default=True,
+    help="Run jobs on worker threads, or as subprocesses on one asyncio event loop.",
+)
+@click.option(
+    "--concurrency",
+    default=100,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Maximum jobs running at once with --engine asyncio.",
+)
+@click.option(
+    "--processes",
+    "-p",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Supervised worker processes to run, each with --threads workers.",
+)
+@click.option(
+    "--compress-logs/--no-compress-logs",
+    default=None,
+    help="Write job logs as gzip segments (env: QUEUECTL_LOG_COMPRESS).",
+)
+@click.option(
+    "--queues",
+    "-q",
+    default=DEFAULT_QUEUE,
+    show_default=True,
+    callback=parse_queues,
+    help="Comma-separated queues to take jobs from, most preferred first.",
+)
+@click.option(
+    "--metrics-port",
+    default=None,
+    type=click.IntRange(min=1, max=65535),
+    help="Serve metrics for Prometheus at http://<host>:<port>/metrics.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Time each phase of job handling and print a summary periodically; "
+         "SIGUSR1 then dumps thread stacks and a stack-sampling profile.",
+)
+@click.option(
+    "--profile-interval",
+    default=profiling.DEFAULT_INTERVAL,
+    type=click.FloatRange(min=1),
+    show_default=True,
+    help="Seconds between --profile summaries.",
+)
+@click.option(
+    "--profile-dir",
+    default=".",
+    type=click.Path(file_okay=False, writable=True),
+    show_default=True,
+    help="Directory SIGUSR1 profile dumps are written to.",
+)
+def start(count, prefetch, engine, concurrency, processes, compress_logs, queues, metrics_port,
+          profile, profile_interval, profile_dir):
     """
     Start worker(s) to process jobs from the queue continuously
     until a stop signal or keyboard interrupt is received.
     """
-    clear_stop_signal()
+    # Workers only read compact records; claiming an old-format job would
+    # leave it stuck in processing
+    if not storage.records_compact():
+        raise click.ClickException(
+            "Some jobs are stored in the old record format; run 'queuectl migrate' first."
+        )
+
+    # Each worker thread can hold a pooled connection while it waits on the
+    # queue; make sure the pool is big enough before anything connects.
+    needed = count + RESERVED_CONNECTIONS
+    if connection.settings()["max_connections"] < needed:
+        connection.configure(max_connections=needed)
 
-    click.echo(f"🚀 Starting {count} worker thread(s)...")
+    job_log.configure(compress=compress_logs)
+
+    clear_stop_signal()
+    wake_event = threading.Event()
+    stop_event, listener = watch_stop_signal(wake_event)
     click.echo("Press Ctrl+C to stop manually, or run 'queuectl worker stop' in another terminal.")
 
-    # Launch the specified number of worker threads
-    for i in range(count):
-        worker_name = f"Worker-{i+1}"
-        t = threading.Thread(target=run_worker, args=(worker_name,), daemon=True)
-        t.start()
+    # One scheduler per `worker start`; only the lease holder promotes retries
+    scheduler = RetryScheduler(storage, stop_event, wake_event)
+    scheduler_thread = scheduler.start()
+
+    flusher = metrics.start_flusher(storage.r, stop_event)
+    server = None
+    if metrics_port:
+        server = metrics.serve(metrics_port, storage.metrics_text)
+        click.echo(f"📈 Serving metrics on http://0.0.0.0:{metrics_port}/metrics")
+
+    # With several processes the children do the work, so they profile it
+    profile = (profile_interval, profile_dir) if profile else None
+    reporter = None
+    if profile and processes == 1:
+        reporter = start_profiling(stop_event, profile)
 
     try:
-        # The main process continuously monitors retry queues
-        while not should_stop():
-            storage.process_retry_queue()
-            time.sleep(2)
+        if processes > 1:
+            supervise_processes(
+                stop_event, processes, count, prefetch, engine, concurrency, queues, profile
+            )
+        else:
+            threads = launch_workers(stop_event, count, prefetch, engine, concurrency, queues)
+            while not stop_event.wait(1):
+                pass
+            # Let workers finish the job they are running
+            join_workers(threads)
 
     except KeyboardInterrupt:
         click.echo("\n🛑 KeyboardInterrupt received, shutting down.")
 
     finally:
+        # Make sure the scheduler hands its lease back before we exit
+        stop_event.set()
+        wake_event.set()
+        scheduler_thread.join(timeout=5)
+        flusher.join(timeout=5)
+        if reporter is not None:
+            reporter.join(timeout=5)
+        if server is not None:
+            server.shutdown()
+        listener.stop()
         click.echo("✅ All workers stopped and cleaned up.")
 
 
+def start_profiling(stop_event, profile):
+    """Enable phase timers and the SIGUSR1 dump for this process; returns the reporter thread."""
+    interval, directory = profile
+    reporter = profiling.start_reporter(stop_event, interval, echo=click.echo)
+    if profiling.install_dump_signal(directory, echo=click.echo):
+        click.echo(
+            f"🔬 Profiling (pid {os.getpid()}): phase summary every {interval:g}s; "
+            f"kill -USR1 {os.getpid()} dumps a profile to {directory}"
+        )
+    else:
+        click.echo(f"🔬 Profiling: phase summary every {interval:g}s (no SIGUSR1 dumps on this platform)")
+    return reporter
+
+
+def launch_workers(stop_event, count, prefetch, engine, concurrency, queues=(DEFAULT_QUEUE,),
+                   name_prefix="Worker"):
+    """Start this process's worker threads (or asyncio engine) and return them."""
+    threads = []
+    if engine == "asyncio":
+        import asyncio
+        from queuectl.core.async_worker import run_async_engine
+
+        click.echo(f"🚀 Starting asyncio engine with concurrency {concurrency}...")
+        engine_run = run_async_engine(
+            f"Async{name_prefix}-1", stop_event, concurrency, queues=queues
+        )
+        threads.append(threading.Thread(target=asyncio.run, args=(engine_run,), daemon=True))
+    else:
+        click.echo(f"🚀 Starting {count} worker thread(s)...")
+        # Launch the specified number of worker threads
+        for i in range(count):
+            worker_name = f"{name_prefix}-{i+1}"
+            threads.append(threading.Thread(
+                target=run_worker, args=(worker_name, stop_event, prefetch, queues),
+                name=worker_name, daemon=True,
+            ))
+
+    for t in threads:
+        t.start()
+    return threads
+
+
+def join_workers(threads):
+    for t in threads:
+        while t.is_alive():
+            t.join(timeout=1)
+
+
+def run_worker_process(process_index, count, prefetch, engine, concurrency, queues, profile=None):
+    """Entry point of each child process started by `worker start --processes`."""
+    stop_event, listener = watch_stop_signal()
+    # The supervisor passes on its own SIGTERM: finish the current jobs and exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    flusher = metrics.start_flusher(storage.r, stop_event)
+    reporter = start_profiling(stop_event, profile) if profile else None
+    threads = launch_workers(
+        stop_event, count, prefetch, engine, concurrency, queues,
+        name_prefix=f"Worker-{process_index}",
+    )
+    try:
+        join_workers(threads)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        flusher.join(timeout=5)
+        if reporter is not None:
+            reporter.join(timeout=5)
+        listener.stop()
+
+
+def supervise_processes(stop_event, processes, count, prefetch, engine, concurrency, queues,
+                        profile=None):
+    """
+    Run `processes` child processes of workers, restarting any that die
+    until the stop signal arrives. Jobs a dead child had claimed are
+    requeued by the retry scheduler once its worker leases lapse.
+
+    A SIGTERM to the supervisor (systemd, docker stop) is passed on to the
+    children, which finish their current jobs and exit before it returns.
+    """
+    # spawn, not fork: this process already holds Redis connections and a
+    # pub/sub listener thread that must not be shared with children.
+    ctx = multiprocessing.get_context("spawn")
+
+    def spawn(index):
+        proc = ctx.Process(
+            target=run_worker_process,
+            args=(index, count, prefetch, engine, concurrency, queues, profile),
+            name=f"queuectl-worker-{index}",
+        )
+        proc.start()
+        return proc
+
+    click.echo(f"🚀 Starting {processes} worker process(es)...")
+    children = {index: spawn(index) for index in range(1, processes + 1)}
+
+    def on_sigterm(signum, frame):
+        click.echo("\n🛑 SIGTERM received, stopping worker processes.")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+    if profile and hasattr(signal, "SIGUSR1"):
+        # Pass profile dump requests on to the processes doing the work
+        def forward_dump(signum, frame):
+            for proc in children.values():
+                if proc.is_alive():
+                    os.kill(proc.pid, signum)
+
+        signal.signal(signal.SIGUSR1, forward_dump)
+
+    try:
+        # Supervisor loop: replace children that died
+        while not stop_event.wait(SUPERVISE_INTERVAL):
+            for index, proc in children.items():
+                if not proc.is_alive() and not stop_event.is_set():
+                    click.echo(
+                        f"⚠️ Worker process {index} (pid {proc.pid}) exited with code "
+                        f"{proc.exitcode}; restarting.", err=True
+                    )
+                    children[index] = spawn(index)
+
+        # Children stopped by the control channel are already on their way
+        # out; SIGTERM stops the rest (e.g. when the supervisor was signalled)
+        for proc in children.values():
+            if proc.is_alive():
+                proc.terminate()
+        for proc in children.values():
+            proc.join()
+
+    except KeyboardInterrupt:
+        for proc in children.values():
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        raise
+
+
 @worker.command()
 def stop():
     """Stop all running workers gracefully and clear their records."""
@@ -92,7 +413,7 @@ def stop():
     click.echo("🛑 Stop signal sent. Workers will exit after finishing current job.")
 
     time.sleep(1)
-    worker_keys = storage.r.keys("queuectl:worker:*")
+    worker_keys = list(storage.r.scan_iter("queuectl:worker:*", count=1000))
     for key in worker_keys:
         storage.r.delete(key)
     click.echo(f"🧹 Cleared {len(worker_keys)} worker record(s) from Redis.")
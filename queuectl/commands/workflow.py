@@ -0,0 +1,53 @@
+import click
+import json
+from collections import Counter
+from queuectl.core.storage import RedisStorage
+from queuectl.core.workflows import plan_workflow
+
+storage = RedisStorage()
+
+
+@click.group(help="Submit and inspect workflows of dependent jobs")
+def workflow():
+    pass
+
+
+@workflow.command("submit", help="Enqueue the jobs of a JSON workflow spec, each after its dependencies")
+@click.argument("spec_file", type=click.File("r"))
+def submit(spec_file):
+    try:
+        plan = plan_workflow(json.load(spec_file))
+    except json.JSONDecodeError as e:
+        raise click.ClickException(f"Invalid JSON in {spec_file.name}: {e}")
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    workflow_id, job_ids = storage.submit_workflow(plan)
+    click.echo(f"✅ Workflow {workflow_id} submitted with {len(job_ids)} jobs")
+    for job in plan:
+        waits = f" (after {len(job['after'])})" if job["after"] else ""
+        click.echo(f"  {job['name']}: {job_ids[job['name']]}{waits}")
+
+
+@workflow.command("status", help="Show the state of each job in a workflow")
+@click.argument("workflow_id")
+def status(workflow_id):
+    jobs = storage.get_workflow(workflow_id)
+    if jobs is None:
+        click.echo(f"❌ No workflow {workflow_id} found.")
+        return
+    states = Counter(job["status"] if job else "expired" for _, job in jobs)
+    click.echo(f"📊 Workflow {workflow_id}: " + ", ".join(f"{state} {n}" for state, n in sorted(states.items())))
+    for name, job in jobs:
+        if job is None:
+            click.echo(f"  {name}: expired")
+            continue
+        line = f"  {name}: {job['status']} [{job['id']}]"
+        if job.get("pending_parents"):
+            line += f" waiting for {job['pending_parents']}"
+        if job.get("reason"):
+            line += f" — {job['reason']}"
+        click.echo(line)
+
+
+if __name__ == "__main__":
+    workflow()
@@ -0,0 +1,67 @@
+# core/archive.py
+#
+# Local archive of jobs removed by retention. Each retention pass that
+# archives anything appends a gzip member of JSON lines (one job hash per
+# line) to the day's segment, archive/jobs-YYYY-MM-DD.jsonl.gz, so segments
+# never need rewriting and stay readable while being appended to.
+#
+# The directory is set through the environment so that every worker process
+# agrees on it:
+#   QUEUECTL_ARCHIVE_DIR   default: queuectl/archive
+import gzip
+import json
+import os
+import re
+import time
+
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), "..", "archive")
+
+SEGMENT_PATTERN = re.compile(r"jobs-\d{4}-\d{2}-\d{2}\.jsonl\.gz$")
+
+
+def archive_dir():
+    return os.environ.get("QUEUECTL_ARCHIVE_DIR") or DEFAULT_ARCHIVE_DIR
+
+
+def segment_paths():
+    """Archive segments, oldest first."""
+    directory = archive_dir()
+    try:
+        entries = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, e) for e in sorted(entries) if SEGMENT_PATTERN.match(e)]
+
+
+def archive_jobs(jobs):
+    """Append job hashes (dicts including "id") to today's segment."""
+    if not jobs:
+        return
+    directory = archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, time.strftime("jobs-%Y-%m-%d.jsonl.gz"))
+    lines = "".join(json.dumps(job) + "\n" for job in jobs)
+    with gzip.open(path, "ab") as f:
+        f.write(lines.encode())
+
+
+def iter_archived(states=None):
+    """Stream archived job hashes, oldest segment first, optionally by state."""
+    for path in segment_paths():
+        with gzip.open(path, "rt") as f:
+            try:
+                for line in f:
+                    job = json.loads(line)
+                    if states is None or job.get("status") in states:
+                        yield job
+            except (EOFError, json.JSONDecodeError):
+                # A member cut short by a crash mid-append ends the segment
+                continue
+
+
+def find_job(job_id):
+    """The archived hash of `job_id`, or None."""
+    for job in iter_archived():
+        if job.get("id") == job_id:
+            return job
+    return None
@@ -0,0 +1,250 @@
+# core/async_worker.py
+#
+# Asyncio worker engine: a single event loop runs many jobs concurrently via
+# asyncio.create_subprocess_shell instead of one OS thread per job. It drives
+# the same Lua transitions as the threaded workers, so retry/backoff and DLQ
+# behaviour is identical.
+import asyncio
+import os
+
+from queuectl.core import connection, metrics, profiling, scripts
+from queuectl.core.job_log import BUFFER_SIZE, FLUSH_INTERVAL, JobLog
+from queuectl.core.storage import (
+    DEFAULT_QUEUE,
+    WORKER_LEASE_TTL,
+    claim_args,
+    claimed_key,
+    complete_args,
+    fail_args,
+    parse_claimed,
+    ready_key,
+    report_failure,
+    report_lost,
+    woken_queue,
+    worker_lease_key,
+    worker_owner,
+)
+
+
+class AsyncRedisStorage:
+    """The subset of RedisStorage a worker needs, on redis.asyncio."""
+
+    def __init__(self):
+        self.r = connection.get_async_redis()
+        self._dequeue = self.r.register_script(scripts.DEQUEUE)
+        self._release = self.r.register_script(scripts.RELEASE)
+        self._complete = self.r.register_script(scripts.COMPLETE)
+        self._fail = self.r.register_script(scripts.FAIL)
+        if metrics.recorder is not None:
+            for name in ("dequeue", "release", "complete", "fail"):
+                script = getattr(self, f"_{name}")
+                setattr(self, f"_{name}", metrics.recorder.timed_async(name, script))
+        # Phase timers for `worker start --profile`; jobs overlap on the
+        # event loop, so phase totals can add up to more than wall time
+        if profiling.profiler is not None:
+            for name in ("dequeue", "complete", "fail"):
+                script = getattr(self, f"_{name}")
+                setattr(self, f"_{name}", profiling.profiler.timed_async(name, script))
+
+    async def claim_jobs(self, worker_name, count=1, timeout=None, queues=(DEFAULT_QUEUE,)):
+        """Async counterpart of RedisStorage.claim_jobs()."""
+        jobs = await self._claim(worker_name, count, queues)
+        if not jobs and timeout is not None:
+            ready = await self.r.brpop([ready_key(q) for q in queues], timeout=timeout)
+            woken = woken_queue(ready, queues)
+            if woken:
+                jobs = await self._claim(worker_name, count, queues, woken)
+        return jobs
+
+    async def _claim(self, worker_name, count, queues, woken=""):
+        """Async counterpart of RedisStorage._claim()."""
+        keys = [claimed_key(worker_name)]
+        while True:
+            reply = await self._dequeue(keys=keys, args=claim_args(worker_name, count, queues, woken))
+            with profiling.phase("decode"):
+                more, jobs = parse_claimed(reply)
+            if jobs or not more:
+                return jobs
+            woken = ""
+
+    async def release_jobs(self, worker_name, job_ids=None):
+        return await self._release(
+            keys=[claimed_key(worker_name)],
+            args=[worker_name, *(job_ids or [])],
+        )
+
+    async def hold_worker_lease(self, owner):
+        await self.r.set(worker_lease_key(owner), 1, px=int(WORKER_LEASE_TTL * 1000))
+
+    async def drop_worker_lease(self, owner):
+        await self.r.delete(worker_lease_key(owner))
+
+    async def mark_completed(self, job_id, result, worker_name=None):
+        return bool(await self._complete(args=complete_args(job_id, result, worker_name)))
+
+    async def mark_failed(self, job_id, reason, worker_name=None):
+        outcome = await self._fail(args=fail_args(job_id, reason, worker_name))
+        report_failure(job_id, reason, outcome)
+
+
+async def pump(stream, job_log, captured):
+    """Async counterpart of JobLog.pump() for a subprocess stream."""
+    while chunk := await stream.read(BUFFER_SIZE):
+        job_log.write(chunk)
+        captured.append(chunk)
+
+
+async def run_command(command, job_log, timeout=None):
+    """Async counterpart of queue_manager.run_command()."""
+    proc = await asyncio.create_subprocess_shell(
+        command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = [], []
+    finished = asyncio.gather(
+        pump(proc.stdout, job_log, stdout),
+        pump(proc.stderr, job_log, stderr),
+        proc.wait(),
+    )
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    while True:
+        wait_for = FLUSH_INTERVAL if deadline is None else min(FLUSH_INTERVAL, deadline - loop.time())
+        done, _ = await asyncio.wait({finished}, timeout=max(0, wait_for))
+        if done:
+            break
+        if deadline is not None and loop.time() >= deadline:
+            proc.kill()
+            finished.cancel()
+            await proc.wait()
+            raise asyncio.TimeoutError
+        job_log.flush()
+    finished.result()
+
+    decode = lambda chunks: b"".join(chunks).decode(errors="replace")
+    return proc.returncode, decode(stdout), decode(stderr)
+
+
+async def run_job(storage, job_id, data, worker_name, owner=None):
+    """Async counterpart of queue_manager.process_job()."""
+    job_log = JobLog(job_id)
+    log = job_log.log
+
+    log(f"👷 {worker_name} picked job {job_id}: {data}")
+
+    command = data.get("command")
+    timeout = data.get("timeout")
+    try:
+        if not command:
+            raise ValueError("No command found in job data")
+
+        log(f"🚀 Executing command: {command}")
+        try:
+            with profiling.phase("run"):
+                returncode, stdout, stderr = await run_command(command, job_log, timeout)
+        except asyncio.TimeoutError:
+            error_msg = f"Job exceeded timeout of {timeout}s"
+            await storage.mark_failed(job_id, error_msg, owner)
+            print(f"⏰ Job {job_id} failed: {error_msg}")
+            return
+
+        if returncode == 0:
+            output = stdout.strip() or "(no output)"
+            if await storage.mark_completed(job_id, output, owner):
+                log(f"✅ Job {job_id} completed successfully.")
+            else:
+                report_lost(job_id)
+        else:
+            error_msg = stderr.strip() or f"Command failed with code {returncode}"
+            raise Exception(error_msg)
+
+    except Exception as e:
+        await storage.mark_failed(job_id, str(e), owner)
+        print(f"❌ Job {job_id} failed: {e}")
+
+    finally:
+        log("🏁 Job finished.")
+        job_log.close()
+
+
+async def run_async_engine(worker_name, stop_event, concurrency, idle_timeout=1,
+                           queues=(DEFAULT_QUEUE,)):
+    """
+    Keep up to `concurrency` jobs from `queues` running on this event loop
+    until `stop_event` (a threading.Event fed by the control channel) is set.
+
+    Free slots are filled by a claim that runs alongside the jobs, so a new
+    job is picked up as soon as it is queued and a finished job's slot is
+    refilled as soon as it frees. An idle claim blocks for at most
+    `idle_timeout` seconds. Jobs are claimed under an owner id unique to
+    this process, whose lease the loop renews as it goes.
+    """
+    storage = AsyncRedisStorage()
+    worker_key = f"queuectl:worker:{worker_name}"
+    owner = worker_owner(worker_name)
+    running = set()
+    claim = None
+
+    loop = asyncio.get_running_loop()
+    await storage.hold_worker_lease(owner)
+    renew_at = loop.time() + WORKER_LEASE_TTL / 3
+
+    await storage.r.hset(worker_key, mapping={
+        "status": "active",
+        "current_job": "idle",
+        "engine": "asyncio",
+        "pid": os.getpid(),
+        "concurrency": concurrency,
+        "queues": ",".join(queues),
+    })
+
+    try:
+        while not stop_event.is_set():
+            # The loop comes round at least every idle_timeout
+            if loop.time() >= renew_at:
+                await storage.hold_worker_lease(owner)
+                renew_at = loop.time() + WORKER_LEASE_TTL / 3
+
+            free = concurrency - len(running)
+            if claim is None and free > 0:
+                claim = asyncio.create_task(
+                    storage.claim_jobs(owner, free, timeout=idle_timeout, queues=queues)
+                )
+
+            waiting = running | ({claim} if claim else set())
+            done, _ = await asyncio.wait(
+                waiting, timeout=idle_timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            running -= done
+
+            if claim in done:
+                finished, claim = claim, None
+                try:
+                    jobs = finished.result()
+                except Exception as e:
+                    print(f"⚠️ Error in {worker_name}: {e}. Retrying in 5s...")
+                    await asyncio.sleep(5)
+                    continue
+                for job_id, data in jobs:
+                    running.add(asyncio.create_task(run_job(storage, job_id, data, worker_name, owner)))
+                if jobs:
+                    await storage.r.hset(worker_key, "current_job", f"{len(running)} running")
+
+        # Jobs claimed after the stop signal arrived go back to the queue;
+        # in-flight jobs finish, like the threaded workers do.
+        if claim is not None:
+            leftover = await claim
+            if leftover:
+                await storage.release_jobs(owner, [job_id for job_id, _ in leftover])
+        # Keep the lease while the last jobs finish
+        while running:
+            await storage.hold_worker_lease(owner)
+            _, running = await asyncio.wait(running, timeout=WORKER_LEASE_TTL / 3)
+        print(f"🛑 {worker_name} stopping gracefully (received stop signal).")
+
+    finally:
+        await storage.r.delete(worker_key)
+        await storage.drop_worker_lease(owner)
+        await storage.r.aclose()
+        print(f"🧹 {worker_name} removed from worker registry.")
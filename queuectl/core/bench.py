@@ -0,0 +1,241 @@
+# core/bench.py
+#
+# `queuectl bench`: throughput and latency of the queue itself, measured
+# against a real Redis server with the same code paths the CLI and workers
+# use. Each benchmark starts from an empty database and flushes it
+# afterwards, so it must be pointed at a database of its own (e.g.
+# --redis-url redis://localhost:6379/15).
+#
+# Results are a JSON-serialisable dict (see run()); compare() lines two of
+# them up so a change to the storage layer or the worker loop can be
+# checked against a baseline run.
+import contextlib
+import os
+import platform
+import threading
+import time
+
+# What run() measures, in order.
+BENCHMARKS = ("enqueue", "latency", "throughput", "listing")
+
+DEFAULTS = {
+    "jobs": 10000,
+    "latency_samples": 200,
+    "workers": (1, 4, 16),
+    "throughput_jobs": 2000,
+    "sizes": (10000, 100000, 1000000),
+}
+
+NOOP_JOB = {"command": "true"}
+
+# How often completion is polled while workers drain the queue.
+POLL_INTERVAL = 0.01
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list of numbers."""
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def _rate(jobs, seconds):
+    return {"jobs": jobs, "seconds": round(seconds, 4), "jobs_per_sec": round(jobs / seconds, 1)}
+
+
+def _reset(storage):
+    storage.r.flushdb()
+
+
+@contextlib.contextmanager
+def _quiet():
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            yield
+
+
+@contextlib.contextmanager
+def _workers(count):
+    """Run `count` worker threads in this process, as `worker start` does."""
+    # Imported here: only the worker benchmarks need the worker loop
+    from queuectl.commands.worker import RESERVED_CONNECTIONS, join_workers, launch_workers
+    from queuectl.core import connection
+
+    if connection.settings()["max_connections"] < count + RESERVED_CONNECTIONS:
+        connection.configure(max_connections=count + RESERVED_CONNECTIONS)
+    stop_event = threading.Event()
+    # Worker threads report as they go; keep that out of the results
+    with _quiet():
+        threads = launch_workers(stop_event, count, 1, "threads", count, name_prefix="BenchWorker")
+        try:
+            yield
+        finally:
+            stop_event.set()
+            join_workers(threads)
+
+
+def _wait_for(storage, state, count, timeout):
+    deadline = time.monotonic() + timeout
+    while storage.count_states()[state] < count:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out waiting for {count} {state} jobs")
+        time.sleep(POLL_INTERVAL)
+
+
+def bench_enqueue(storage, jobs):
+    """Jobs per second through enqueue_job() one at a time, and through enqueue_many()."""
+    _reset(storage)
+    started = time.perf_counter()
+    for _ in range(jobs):
+        storage.enqueue_job(NOOP_JOB)
+    single = _rate(jobs, time.perf_counter() - started)
+
+    _reset(storage)
+    started = time.perf_counter()
+    storage.enqueue_many(NOOP_JOB for _ in range(jobs))
+    bulk = _rate(jobs, time.perf_counter() - started)
+    return {"single": single, "bulk": bulk}
+
+
+def bench_latency(storage, samples, timeout=30):
+    """
+    Pickup latency: with one idle worker blocked on the queue, how long
+    each job waits between being enqueued (queued_at) and being claimed
+    (started_at). Jobs are enqueued one at a time, after the previous one
+    has finished.
+    """
+    _reset(storage)
+    waits = []
+    with _workers(1):
+        # Let the worker reach its blocking dequeue first
+        time.sleep(0.2)
+        for n in range(1, samples + 1):
+            job_id = storage.enqueue_job(NOOP_JOB)
+            _wait_for(storage, "completed", n, timeout)
+            job = storage.get_job(job_id)
+            waits.append(float(job["started_at"]) - float(job["queued_at"]))
+    ms = [wait * 1000 for wait in waits]
+    return {
+        "jobs": samples,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3),
+    }
+
+
+def bench_throughput(storage, jobs, worker_counts, timeout=600):
+    """End-to-end no-op jobs per second with each number of worker threads."""
+    results = {}
+    for count in worker_counts:
+        _reset(storage)
+        storage.enqueue_many(NOOP_JOB for _ in range(jobs))
+        started = time.perf_counter()
+        with _workers(count):
+            _wait_for(storage, "completed", jobs, timeout)
+            elapsed = time.perf_counter() - started
+        results[str(count)] = _rate(jobs, elapsed)
+    return results
+
+
+def time_command(args):
+    """Run a queuectl command with its output discarded; returns the seconds it took."""
+    # Imported here: the CLI imports command modules on first use
+    from queuectl.cli import cli
+
+    with _quiet():
+        started = time.perf_counter()
+        cli.main(args, prog_name="queuectl", standalone_mode=False)
+        return round(time.perf_counter() - started, 4)
+
+
+def bench_listing(storage, sizes):
+    """
+    Time `status`, `list --limit 100` and a full `list` with 10k, 100k, ...
+    pending jobs stored. The store grows from one size to the next.
+    """
+    _reset(storage)
+    results, stored = {}, 0
+    for size in sorted(sizes):
+        storage.enqueue_many(NOOP_JOB for _ in range(size - stored))
+        stored = size
+        results[str(size)] = {
+            "status_seconds": time_command(["status"]),
+            "list_page_seconds": time_command(["list", "--limit", "100"]),
+            "list_seconds": time_command(["list"]),
+        }
+    return results
+
+
+def run(storage, only=BENCHMARKS, progress=None, **options):
+    """
+    Run the benchmarks in `only` with DEFAULTS overridden by `options` and
+    return the results with the environment they were measured in.
+    `progress(name)` is called before each one. Raises RuntimeError if the
+    database is not empty; it is flushed when done.
+    """
+    if storage.r.dbsize():
+        raise RuntimeError(
+            "The Redis database is not empty; run benchmarks against a database of their own"
+        )
+    options = {**DEFAULTS, **{name: value for name, value in options.items() if value}}
+    runners = {
+        "enqueue": lambda: bench_enqueue(storage, options["jobs"]),
+        "latency": lambda: bench_latency(storage, options["latency_samples"]),
+        "throughput": lambda: bench_throughput(storage, options["throughput_jobs"], options["workers"]),
+        "listing": lambda: bench_listing(storage, options["sizes"]),
+    }
+    results = {}
+    try:
+        for name in BENCHMARKS:
+            if name in only:
+                if progress:
+                    progress(name)
+                results[name] = runners[name]()
+    finally:
+        _reset(storage)
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "redis": storage.r.info("server").get("redis_version"),
+        },
+        "options": {name: list(value) if isinstance(value, tuple) else value
+                    for name, value in options.items()},
+        "results": results,
+    }
+
+
+def flatten(results, prefix=""):
+    """
+    {"enqueue.single.jobs_per_sec": 1234.5, ...} for every measured number,
+    leaving out job counts and the run times they were turned into rates with.
+    """
+    flat = {}
+    for name, value in results.items():
+        path = f"{prefix}{name}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif name not in ("jobs", "seconds"):
+            flat[path] = value
+    return flat
+
+
+def compare(baseline, current):
+    """
+    Line up two run() results. Returns (metric, before, after, change)
+    tuples for the metrics both measured, where `change` is the relative
+    improvement: positive is better, whether the metric is a rate or a time.
+    """
+    before, after = flatten(baseline["results"]), flatten(current["results"])
+    rows = []
+    for metric, old in before.items():
+        new = after.get(metric)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        if not metric.endswith("per_sec"):
+            change = -change
+        rows.append((metric, old, new, change))
+    return rows
@@ -0,0 +1,103 @@
+# core/connection.py
+#
+# One Redis client (and connection pool) per process, shared by every
+# command module, worker thread and the retry scheduler.
+#
+# Settings come from the environment so that spawned worker processes
+# inherit whatever the CLI was given:
+#   QUEUECTL_REDIS_URL              redis://host:port/db, rediss://..., or
+#                                   unix:///path/to/redis.sock?db=0
+#   QUEUECTL_REDIS_MAX_CONNECTIONS  pool size (default 64)
+#   QUEUECTL_REDIS_SOCKET_TIMEOUT   seconds; unset means no read timeout,
+#                                   which blocking dequeues rely on
+import os
+import threading
+
+DEFAULT_URL = "redis://localhost:6379/0"
+DEFAULT_MAX_CONNECTIONS = 64
+
+# How long a thread waits for a free pooled connection before erroring.
+POOL_TIMEOUT = 20
+CONNECT_TIMEOUT = 5
+HEALTH_CHECK_INTERVAL = 30
+
+_lock = threading.Lock()
+_client = None
+
+
+def settings():
+    timeout = os.environ.get("QUEUECTL_REDIS_SOCKET_TIMEOUT")
+    return {
+        "url": os.environ.get("QUEUECTL_REDIS_URL") or DEFAULT_URL,
+        "max_connections": int(
+            os.environ.get("QUEUECTL_REDIS_MAX_CONNECTIONS") or DEFAULT_MAX_CONNECTIONS
+        ),
+        "socket_timeout": float(timeout) if timeout else None,
+    }
+
+
+def configure(url=None, max_connections=None, socket_timeout=None):
+    """
+    Override connection settings (e.g. from CLI flags). Values are exported
+    to the environment so child processes pick them up, and the shared
+    client is rebuilt on next use.
+    """
+    global _client
+    before = settings()
+    if url:
+        os.environ["QUEUECTL_REDIS_URL"] = url
+    if max_connections:
+        os.environ["QUEUECTL_REDIS_MAX_CONNECTIONS"] = str(max_connections)
+    if socket_timeout:
+        os.environ["QUEUECTL_REDIS_SOCKET_TIMEOUT"] = str(socket_timeout)
+    if settings() == before:
+        return
+    with _lock:
+        old, _client = _client, None
+    if old is not None:
+        old.connection_pool.disconnect()
+
+
+def _pool_options():
+    opts = settings()
+    options = {
+        "max_connections": opts["max_connections"],
+        "socket_timeout": opts["socket_timeout"],
+        "socket_connect_timeout": CONNECT_TIMEOUT,
+        "health_check_interval": HEALTH_CHECK_INTERVAL,
+        "decode_responses": True,
+    }
+    # TCP only: keep idle worker connections from being dropped by NATs and
+    # load balancers. Unix sockets skip both the option and the TCP stack.
+    if not opts["url"].startswith("unix://"):
+        options["socket_keepalive"] = True
+    return opts["url"], options
+
+
+def get_redis():
+    """Return the process-wide client, creating its pool on first use."""
+    global _client
+    client = _client
+    if client is None:
+        import redis
+
+        with _lock:
+            if _client is None:
+                url, options = _pool_options()
+                # Blocking pool: with many worker threads, wait for a free
+                # connection instead of failing when the pool is exhausted.
+                pool = redis.BlockingConnectionPool.from_url(url, timeout=POOL_TIMEOUT, **options)
+                _client = redis.Redis(connection_pool=pool)
+            client = _client
+    return client
+
+
+def get_async_redis():
+    """
+    Return a new redis.asyncio client with the same settings. Async pools
+    are bound to the event loop that uses them, so these are not shared.
+    """
+    import redis.asyncio as aioredis
+
+    url, options = _pool_options()
+    return aioredis.Redis.from_url(url, **options)
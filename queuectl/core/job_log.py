@@ -0,0 +1,253 @@
+# core/job_log.py
+#
+# Per-job log sink. A job's log is opened once, written through a large
+# buffer (worker messages plus the command's stdout/stderr as it is
+# produced) and flushed periodically and on close, instead of reopening the
+# file for every line.
+#
+# Logs are plain files (logs/<job_id>.log) by default. With compression on
+# they are written as numbered gzip segments (logs/<job_id>.log.<n>.gz) that
+# roll over every SEGMENT_BYTES of output, so the end of a large log can be
+# read without decompressing all of it. Set through the environment so that
+# spawned worker processes inherit it:
+#   QUEUECTL_LOG_COMPRESS   1 to write compressed segments
+import gzip
+import mmap
+import os
+import re
+import threading
+import time
+from collections import deque
+from queuectl.core import profiling
+
+LOG_DIR = os.path.join(os.path.dirname(__file__), "..", "logs")
+
+BUFFER_SIZE = 64 * 1024
+
+# Longest a running job's output may sit in the buffer before it is flushed
+# to disk (and visible to `queuectl logs`).
+FLUSH_INTERVAL = 1.0
+
+# Uncompressed bytes per gzip segment.
+SEGMENT_BYTES = 16 * 1024 * 1024
+
+
+def settings():
+    return {"compress": os.environ.get("QUEUECTL_LOG_COMPRESS", "") not in ("", "0")}
+
+
+def configure(compress=None):
+    """Override log settings (e.g. from CLI flags) for this and child processes."""
+    if compress is not None:
+        os.environ["QUEUECTL_LOG_COMPRESS"] = "1" if compress else "0"
+
+
+def job_log_path(job_id):
+    """Path of a job's log file; the log directory is created on first use."""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    return os.path.join(LOG_DIR, f"{job_id}.log")
+
+
+def segment_paths(path):
+    """The compressed segments of the log at `path`, oldest first."""
+    directory, name = os.path.split(path)
+    pattern = re.compile(re.escape(name) + r"\.(\d+)\.gz$")
+    try:
+        entries = os.listdir(directory or ".")
+    except FileNotFoundError:
+        return []
+    found = [(int(m.group(1)), e) for e in entries if (m := pattern.match(e))]
+    return [os.path.join(directory, e) for _, e in sorted(found)]
+
+
+def log_exists(path):
+    return os.path.exists(path) or bool(segment_paths(path))
+
+
+# -----------------------------
+# Reading
+# -----------------------------
+# A log is addressed by offsets into its uncompressed contents: compressed
+# segments in order, then the plain file (a job retried after compression was
+# switched on or off can have both).
+def _parts(path):
+    parts = [(True, segment) for segment in segment_paths(path)]
+    if os.path.exists(path):
+        parts.append((False, path))
+    return parts
+
+
+def _read_segment(path, skip=0, chunk_size=BUFFER_SIZE):
+    """Yield a segment's uncompressed bytes, starting `skip` bytes in."""
+    with gzip.open(path, "rb") as f:
+        try:
+            if skip:
+                f.seek(skip)
+            yield from iter(lambda: f.read(chunk_size), b"")
+        except EOFError:
+            # Segment still being written: everything flushed so far has
+            # been returned.
+            pass
+
+
+def _part_sizes(parts):
+    sizes = []
+    for index, (compressed, path) in enumerate(parts):
+        if not compressed:
+            sizes.append(os.path.getsize(path))
+        elif index + 1 < len(parts) and parts[index + 1][0]:
+            # Finished segment: the gzip trailer records its size (mod 2**32,
+            # which SEGMENT_BYTES stays under).
+            with open(path, "rb") as f:
+                f.seek(-4, os.SEEK_END)
+                sizes.append(int.from_bytes(f.read(4), "little"))
+        else:
+            # The newest segment may still be open, with no trailer yet
+            sizes.append(sum(len(chunk) for chunk in _read_segment(path)))
+    return sizes
+
+
+def read_chunks(path, offset=0, chunk_size=BUFFER_SIZE):
+    """Yield the log at `path` as bytes, starting at `offset`."""
+    parts = _parts(path)
+    sizes = _part_sizes(parts) if offset else [0] * len(parts)
+    for (compressed, part), size in zip(parts, sizes):
+        if offset and offset >= size:
+            offset -= size
+            continue
+        if compressed:
+            yield from _read_segment(part, offset, chunk_size)
+        else:
+            with open(part, "rb") as f:
+                f.seek(offset)
+                yield from iter(lambda: f.read(chunk_size), b"")
+        offset = 0
+
+
+def _newlines_reversed(compressed, path, size, limit):
+    """Offsets of newlines within one part, last first (at most `limit`)."""
+    if compressed:
+        # No random access into gzip: stream it, remembering only the last few
+        found, position = deque(maxlen=limit), 0
+        for chunk in _read_segment(path):
+            start = 0
+            while (i := chunk.find(b"\n", start)) != -1:
+                found.append(position + i)
+                start = i + 1
+            position += len(chunk)
+        yield from reversed(found)
+    elif size:
+        # Scan backwards through a memory map; only the pages holding the
+        # last `limit` lines are touched, however large the file is.
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            end = size
+            while (i := mm.rfind(b"\n", 0, end)) != -1:
+                yield i
+                end = i
+
+
+def tail_offset(path, lines):
+    """Offset where the last `lines` lines of the log at `path` begin."""
+    parts = _parts(path)
+    sizes = _part_sizes(parts)
+    total = sum(sizes)
+    if lines <= 0:
+        return total
+
+    base = total
+    for (compressed, part), size in zip(reversed(parts), reversed(sizes)):
+        base -= size
+        for i in _newlines_reversed(compressed, part, size, lines + 1):
+            if base + i == total - 1:
+                continue  # the final line's own newline
+            lines -= 1
+            if lines == 0:
+                return base + i + 1
+    return 0
+
+
+class JobLog:
+    """
+    One open, buffered log for a job run. Thread-safe, so the command's
+    stdout and stderr can be pumped into it concurrently.
+
+    Use as a context manager, or call close() when the job finishes.
+    """
+
+    def __init__(self, job_id, compress=None):
+        self.path = job_log_path(job_id)
+        self.compress = settings()["compress"] if compress is None else compress
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        if self.compress:
+            # Retries append new segments after the previous run's
+            segments = segment_paths(self.path)
+            self._segment = int(segments[-1].rsplit(".", 2)[-2]) if segments else 0
+            self._file = self._next_segment()
+        else:
+            self._file = open(self.path, "ab", buffering=BUFFER_SIZE)
+
+    def _next_segment(self):
+        self._segment += 1
+        self._segment_bytes = 0
+        raw = open(f"{self.path}.{self._segment}.gz", "wb", buffering=BUFFER_SIZE)
+        return gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+
+    def _close_file(self):
+        raw = self._file.fileobj if self.compress else None
+        self._file.close()
+        if raw is not None:
+            raw.close()
+
+    def write(self, data):
+        """Append raw bytes (e.g. command output)."""
+        with self._lock:
+            if self._file is None:
+                return  # closed: output from a killed job's leftover children
+            self._file.write(data)
+            if self.compress:
+                self._segment_bytes += len(data)
+                if self._segment_bytes >= SEGMENT_BYTES:
+                    self._close_file()
+                    self._file = self._next_segment()
+            if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+                self._flush()
+
+    def log(self, message):
+        """Write a timestamped worker message to the console and the log."""
+        with profiling.phase("log"):
+            entry = f"{time.strftime('[%Y-%m-%d %H:%M:%S]')} {message}"
+            print(entry)
+            self.write((entry + "\n").encode())
+
+    def pump(self, pipe, captured=None):
+        """
+        Copy `pipe` into the log as data arrives, until EOF. Chunks read are
+        also appended to `captured` if given.
+        """
+        read = getattr(pipe, "read1", pipe.read)
+        for chunk in iter(lambda: read(BUFFER_SIZE), b""):
+            self.write(chunk)
+            if captured is not None:
+                captured.append(chunk)
+
+    def _flush(self):
+        if self._file is not None:
+            self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with profiling.phase("log"), self._lock:
+            if self._file is not None:
+                self._close_file()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,197 @@
+# core/metrics.py
+#
+# Job timing metrics, aggregated in the queuectl:metrics hash and exported in
+# the Prometheus text format (`queuectl metrics`, `worker start
+# --metrics-port`). Queue wait and run time histograms and per-queue counters
+# are recorded by the transition scripts themselves, where the job's
+# timestamps are at hand. Redis round-trip latency is measured by each worker
+# process and flushed into the same hash every FLUSH_INTERVAL seconds.
+#
+# Hash fields are "<metric>|<labels>" for counters and
+# "<metric>|<labels>|<bucket upper bound, +Inf or sum>" for histograms, with
+# labels already in Prometheus form (queue="default",outcome="completed").
+# Bucket counts are stored per bucket and made cumulative when rendered.
+import threading
+import time
+
+METRICS_KEY = "queuectl:metrics"
+
+# Upper bounds (seconds) of the histogram buckets, besides +Inf.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+FLUSH_INTERVAL = 5
+
+HELP = {
+    "queuectl_job_queue_wait_seconds": ("histogram", "Time from a job becoming runnable to a worker claiming it."),
+    "queuectl_job_run_seconds": ("histogram", "Time from a worker claiming a job to its outcome being recorded."),
+    "queuectl_redis_op_seconds": ("histogram", "Latency of the Redis scripts run by workers."),
+    "queuectl_jobs_enqueued_total": ("counter", "Jobs enqueued, by queue."),
+    "queuectl_jobs_finished_total": ("counter", "Job runs finished, by queue and outcome."),
+    "queuectl_jobs": ("gauge", "Jobs currently in each state."),
+    "queuectl_queue_depth": ("gauge", "Jobs waiting on each queue's lanes."),
+    "queuectl_result_cache_total": ("counter", "Result cache lookups, by outcome."),
+}
+
+# The recorder of this process while metrics are enabled (see enable()).
+recorder = None
+
+
+def _bucket(value, bounds):
+    for bound in bounds:
+        if value <= bound:
+            return f"{bound:g}"
+    return "+Inf"
+
+
+class LatencyRecorder:
+    """Per-process Redis latency histogram, merged into METRICS_KEY by flush()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._sums = {}
+
+    def observe(self, op, seconds):
+        labels = f'op="{op}"'
+        field = f"queuectl_redis_op_seconds|{labels}|{_bucket(seconds, LATENCY_BUCKETS)}"
+        with self._lock:
+            self._counts[field] = self._counts.get(field, 0) + 1
+            self._sums[labels] = self._sums.get(labels, 0.0) + seconds
+
+    def timed(self, op, call):
+        """Wrap a (script) callable so each call's latency is observed as `op`."""
+        def timed_call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return call(*args, **kwargs)
+            finally:
+                self.observe(op, time.perf_counter() - started)
+        return timed_call
+
+    def timed_async(self, op, call):
+        """timed() for a coroutine function."""
+        async def timed_call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                self.observe(op, time.perf_counter() - started)
+        return timed_call
+
+    def flush(self, client):
+        """Add what was observed since the last flush to METRICS_KEY."""
+        with self._lock:
+            counts, sums = self._counts, self._sums
+            self._counts, self._sums = {}, {}
+        if not counts:
+            return
+        pipe = client.pipeline(transaction=False)
+        for field, count in counts.items():
+            pipe.hincrby(METRICS_KEY, field, count)
+        for labels, total in sums.items():
+            pipe.hincrbyfloat(METRICS_KEY, f"queuectl_redis_op_seconds|{labels}|sum", total)
+        pipe.execute()
+
+
+def enable():
+    """Start measuring Redis latency in this process; returns the recorder."""
+    global recorder
+    if recorder is None:
+        recorder = LatencyRecorder()
+    return recorder
+
+
+def start_flusher(client, stop_event):
+    """Flush this process's recorder every FLUSH_INTERVAL, and once more on stop."""
+    def run():
+        while not stop_event.wait(FLUSH_INTERVAL):
+            try:
+                recorder.flush(client)
+            except Exception as e:
+                print(f"⚠️ Metrics flush error: {e}")
+        recorder.flush(client)
+
+    enable()
+    thread = threading.Thread(target=run, name="queuectl-metrics-flush", daemon=True)
+    thread.start()
+    return thread
+
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render(fields, stats):
+    """
+    Prometheus text exposition of the METRICS_KEY hash `fields` plus gauges
+    and counters from storage.get_stats() `stats`.
+    """
+    histograms, counters = {}, {}
+    for field, value in fields.items():
+        parts = field.split("|")
+        if len(parts) == 3:
+            name, labels, bucket = parts
+            histograms.setdefault(name, {}).setdefault(labels, {})[bucket] = value
+        elif len(parts) == 2:
+            counters.setdefault(parts[0], {})[parts[1]] = value
+
+    counters["queuectl_result_cache_total"] = {
+        f'result="{name.removeprefix("cache_")}"': count for name, count in stats["cache"].items()
+    }
+    gauges = {
+        "queuectl_jobs": {f'state="{state}"': count for state, count in stats["states"].items()},
+        "queuectl_queue_depth": {
+            f'queue="{queue}"': depths["queued"] for queue, depths in stats["by_queue"].items()
+        },
+    }
+
+    lines = []
+
+    def header(name):
+        kind, text = HELP[name]
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for name in sorted(histograms):
+        header(name)
+        bounds = LATENCY_BUCKETS if name == "queuectl_redis_op_seconds" else DURATION_BUCKETS
+        for labels, buckets in sorted(histograms[name].items()):
+            cumulative = 0
+            for bound in [f"{b:g}" for b in bounds] + ["+Inf"]:
+                cumulative += int(buckets.get(bound, 0))
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {_format_value(buckets.get('sum', 0))}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+    for series in (counters, gauges):
+        for name in sorted(series):
+            header(name)
+            for labels, value in sorted(series[name].items()):
+                lines.append(f"{name}{{{labels}}} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def serve(port, render_text):
+    """Serve render_text() at /metrics on `port` from a daemon thread; returns the server."""
+    # Imported here: only workers started with --metrics-port need it
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    threading.Thread(target=server.serve_forever, name="queuectl-metrics-http", daemon=True).start()
+    return server
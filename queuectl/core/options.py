@@ -0,0 +1,13 @@
+import click
+
+
+def validate_with(parse):
+    """Option callback that parses the value with `parse`, reporting its ValueError."""
+    def callback(ctx, param, value):
+        if value is not None:
+            try:
+                return parse(value)
+            except ValueError as e:
+                raise click.BadParameter(str(e))
+        return value
+    return callback
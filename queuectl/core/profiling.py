@@ -0,0 +1,207 @@
+# core/profiling.py
+#
+# Hot-path profiling for `worker start --profile`. Workers mark the phases
+# of each job (dequeue, idle, decode, registry, run, log, complete, fail)
+# with phase(), which costs a global lookup and a shared no-op context
+# manager while profiling is off. With it on, per-phase call counts, total
+# and max time are printed every interval, and SIGUSR1 writes a dump of
+# every thread's stack plus a short stack-sampling profile of all threads
+# to the profile directory.
+import collections
+import contextlib
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+DEFAULT_INTERVAL = 60
+
+# Stack sampling after SIGUSR1: how long, and how often.
+SAMPLE_SECONDS = 5
+SAMPLE_INTERVAL = 0.005
+
+_DISABLED = contextlib.nullcontext()
+
+# The profiler of this process while profiling is enabled (see enable()).
+profiler = None
+
+
+def phase(name):
+    """Context manager timing phase `name` of the current job, if profiling."""
+    if profiler is None:
+        return _DISABLED
+    return profiler.phase(name)
+
+
+class PhaseProfiler:
+    """Per-phase timings across all threads, since start and since the last summary."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._window = {}
+        self._total = {}
+        self.started = self._window_started = time.monotonic()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        with self._lock:
+            for stats in (self._window, self._total):
+                entry = stats.get(name)
+                if entry is None:
+                    stats[name] = [1, seconds, seconds]
+                else:
+                    entry[0] += 1
+                    entry[1] += seconds
+                    entry[2] = max(entry[2], seconds)
+
+    def timed_async(self, name, call):
+        """Wrap a coroutine function so each call is recorded as phase `name`."""
+        async def timed_call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - started)
+        return timed_call
+
+    def summary(self, cumulative=False):
+        """
+        Table of the phases recorded since the last (non-cumulative) summary,
+        or since profiling started; a non-cumulative summary starts a new window.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if cumulative:
+                stats, since = {name: list(entry) for name, entry in self._total.items()}, self.started
+            else:
+                stats, since = self._window, self._window_started
+                self._window, self._window_started = {}, now
+        return format_summary(stats, now - since, "in total over" if cumulative else "over the last")
+
+
+def format_summary(stats, elapsed, period="over the last"):
+    lines = [f"⏱️ Worker phases {period} {elapsed:.1f}s:"]
+    if not stats:
+        lines.append("  (no jobs)")
+        return "\n".join(lines)
+    busy = sum(total for name, (_, total, _) in stats.items() if name != "idle") or 1
+    lines.append(f"  {'phase':<10} {'calls':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10} {'busy %':>7}")
+    for name, (count, total, longest) in sorted(stats.items(), key=lambda item: -item[1][1]):
+        share = "-" if name == "idle" else f"{total / busy:.1%}"
+        lines.append(
+            f"  {name:<10} {count:>8} {total:>10.3f} {total / count * 1000:>10.3f} "
+            f"{longest * 1000:>10.3f} {share:>7}"
+        )
+    return "\n".join(lines)
+
+
+def enable():
+    """Start recording phases in this process; returns the profiler."""
+    global profiler
+    if profiler is None:
+        profiler = PhaseProfiler()
+    return profiler
+
+
+def start_reporter(stop_event, interval=DEFAULT_INTERVAL, echo=print):
+    """Print a phase summary every `interval` seconds, and a cumulative one on stop."""
+    def run():
+        while not stop_event.wait(interval):
+            echo(profiler.summary())
+        echo(profiler.summary(cumulative=True))
+
+    enable()
+    thread = threading.Thread(target=run, name="queuectl-profile-report", daemon=True)
+    thread.start()
+    return thread
+
+
+def thread_stacks():
+    """Current stack of every thread, as text."""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    sections = []
+    for ident, frame in sys._current_frames().items():
+        stack = "".join(traceback.format_stack(frame))
+        sections.append(f"--- Thread {names.get(ident, '?')} ({ident}) ---\n{stack}")
+    return "\n".join(sections)
+
+
+def _collapse(frame):
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+def sample_stacks(seconds=SAMPLE_SECONDS, interval=SAMPLE_INTERVAL):
+    """
+    Sample every other thread's stack for `seconds`. Returns a Counter of
+    collapsed stacks ("outer;...;inner" per thread, prefixed with the thread
+    name), the input format of flamegraph.pl and speedscope.
+    """
+    me = threading.get_ident()
+    samples = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != me:
+                samples[f"{names.get(ident, ident)};{_collapse(frame)}"] += 1
+        time.sleep(interval)
+    return samples
+
+
+def dump(directory=".", seconds=SAMPLE_SECONDS, echo=print):
+    """
+    Write <directory>/queuectl-profile-<pid>-<time>.txt with the phase
+    summary, every thread's stack and the hottest sampled stacks, and the
+    full sample as a .folded file next to it. Returns the .txt path.
+    """
+    base = os.path.join(directory, f"queuectl-profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}")
+    stacks = thread_stacks()
+    samples = sample_stacks(seconds)
+
+    with open(base + ".folded", "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(base + ".txt", "w") as f:
+        if profiler is not None:
+            f.write(profiler.summary(cumulative=True) + "\n\n")
+        f.write(f"Thread stacks at {time.strftime('%Y-%m-%d %H:%M:%S')}:\n{stacks}\n")
+        total = sum(samples.values()) or 1
+        f.write(f"Hottest stacks over {seconds}s ({total} samples, all in {base}.folded):\n")
+        for stack, count in samples.most_common(20):
+            thread, *frames = stack.split(";")
+            f.write(f"  {count / total:6.1%}  {thread}: {' <- '.join(reversed(frames[-3:]))}\n")
+    echo(f"📝 Profile written to {base}.txt")
+    return base + ".txt"
+
+
+def install_dump_signal(directory=".", echo=print):
+    """
+    Dump a profile (from a background thread) whenever this process gets
+    SIGUSR1. Must be called from the main thread. Returns False where there
+    is no SIGUSR1 (Windows).
+    """
+    signum = getattr(signal, "SIGUSR1", None)
+    if signum is None:
+        return False
+
+    def handler(signum, frame):
+        threading.Thread(
+            target=dump, args=(directory,), kwargs={"echo": echo}, name="queuectl-profile-dump", daemon=True
+        ).start()
+
+    signal.signal(signum, handler)
+    return True
@@ -1,12 +1,19 @@
 import subprocess
-from queuectl.core.storage import RedisStorage
+from itertools import islice
+from queuectl.core import profiling
+from queuectl.core.archive import iter_archived
+from queuectl.core.job_log import FLUSH_INTERVAL, JobLog
+from queuectl.core.storage import JOB_STATES, RedisStorage, report_lost
 import click
 import json
-import os
+import threading
 import time
+import uuid
 storage = RedisStorage()
-LOG_DIR = os.path.join(os.path.dirname(__file__), "..", "logs")
-os.makedirs(LOG_DIR, exist_ok=True)
+
+# Workers learn about stop/resume from this channel instead of polling.
+CONTROL_CHANNEL = "queuectl:control"
+
 def should_stop():
     """Check if stop signal is active."""
     return storage.r.get("queuectl:stop_signal") == "true"
@@ -14,220 +21,251 @@ def should_stop():
 def set_stop_signal():
     """Activate the stop signal for all workers."""
     storage.r.set("queuectl:stop_signal", "true")
+    storage.r.publish(CONTROL_CHANNEL, "stop")
 
 def clear_stop_signal():
     """Deactivate the stop signal before starting workers."""
     storage.r.delete("queuectl:stop_signal")
-    
-def enqueue_job(data):
-    job_id = storage.enqueue_job(data)
-    print(f"✅ Job added: {job_id}")
-    return job_id
+    storage.r.publish(CONTROL_CHANNEL, "resume")
 
-def list_jobs(state_filter=None):
+def watch_stop_signal(wake_event=None):
     """
-    Lists jobs, optionally filtering by a specific state.
+    Return (stop_event, listener) where stop_event is a threading.Event that
+    mirrors the stop signal, kept current by a pub/sub listener thread.
+    Call listener.stop() to unsubscribe.
+
+    If `wake_event` is given it is set whenever a sooner retry is scheduled
+    (and on stop), so the retry scheduler can recompute its sleep.
     """
+    stop_event = threading.Event()
+
+    def on_control(message):
+        if message["data"] == "stop":
+            stop_event.set()
+        elif message["data"] == "resume":
+            stop_event.clear()
+        if wake_event is not None and message["data"] in ("stop", "retry"):
+            wake_event.set()
+
+    pubsub = storage.r.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(**{CONTROL_CHANNEL: on_control})
+    listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    # Subscribed first, so a signal sent before this point is not missed
+    if should_stop():
+        stop_event.set()
+    return stop_event, listener
     
-    # --- Handle specific list-based states first ---
-    
-    if state_filter == 'dead':
-        click.echo("📋 Inspecting 'dead' jobs...")
-        click.echo("🪦 Jobs in Dead Letter Queue (DLQ):")
-
-        dlq_jobs = storage.list_dlq()
-        if not dlq_jobs:
-            click.echo("DLQ is empty.")
-            return
-
-        count = 0
-        for job in dlq_jobs:
-            status = job.get("status", "dead")
-            date_added = job.get("date_added", "?")
-            data = job.get("data", {})
-            error = job.get("error", "No error info")
-
-            # Extract command (from dict or str)
-            if isinstance(data, dict):
-                command = data.get("command", "N/A")
-            else:
-                command = str(data)
-
-            click.echo(f"[{status}][{date_added}] {command} ❌ {error}")
-            count += 1
-
-        click.echo(f"Total: {count} jobs")
-        return
-
-
-    if state_filter == 'pending':
-        click.echo("Pending jobs in main queue:")
-        # This assumes your pending queue is a list named 'queuectl:queue'
-        pending_jobs = storage.list_pending()
-        if not pending_jobs:
-            click.echo("Pending queue is empty.")
-            return
-        for j in pending_jobs:
-            print(f"[{j.get('status', '?')}][{j.get('date_added','?')}] {j.get('data', '{}')}")
-        print(f"Total: {len(pending_jobs)} jobs")
-        return
-    
-    if state_filter == 'failed':
-        click.echo("Failed jobs:")
-        list_failed_jobs()
-        return
-    
-    if state_filter == 'processing':
-        click.echo("Processing jobs:")
-        list_processing_jobs()
-        return
-    
-    if state_filter == 'completed':
-        click.echo("Completed jobs:")
-        list_completed_jobs()
-        return
+def enqueue_job(data, priority=None, queue=None, run_at=None, after=None, idempotency_key=None,
+                cache_ttl=None, concurrency_key=None):
+    """
+    Enqueue one job; returns (job id, whether it was added), the latter
+    False when the idempotency key already belongs to another job.
+    """
+    new_id = str(uuid.uuid4())
+    job_id = storage.enqueue_job(
+        data, priority=priority, queue=queue, run_at=run_at, after=after,
+        idempotency_key=idempotency_key, cache_ttl=cache_ttl, job_id=new_id,
+        concurrency_key=concurrency_key,
+    )
+    if job_id != new_id:
+        print(f"♻️ Job {job_id} already has idempotency key {idempotency_key!r}; not enqueued again")
+        return job_id, False
+    print(f"✅ Job added: {job_id}")
+    return job_id, True
 
-    # --- Handle hash-based states (or all jobs) ---
-    
-    click.echo("Inspecting all job records...")
-    job_keys = storage.r.keys("queuectl:jobs:*")
-    
-    if not job_keys:
-        click.echo("No jobs found in database.")
-        return
-
-    count = 0
-    for key in job_keys:
-        job = storage.r.hgetall(key)
-        status = job.get("status", "unknown")
-        
-        # If a filter is active, skip non-matching statuses
-        if state_filter and status != state_filter:
-            continue
-            
-        # Passed filter (or no filter), so print it
-        job_id = key.split(":")[-1]
-        command = job.get("data", "{}")
-        date_added = job.get("date_added", "-")
-        
-        click.echo(f"[{job_id}] {command} - {status} ({date_added})")
-        count += 1
-        
-    if count == 0 and state_filter:
-        click.echo(f"No jobs found with state '{state_filter}'.")
+def enqueue_many(jobs, batch_size=1000, priority=None, queue=None, run_at=None, after=None,
+                 cache_ttl=None, concurrency_key=None):
+    """Bulk-enqueue job data dicts; returns (count, elapsed seconds)."""
+    started = time.perf_counter()
+    count = storage.enqueue_many(
+        jobs, batch_size=batch_size, priority=priority, queue=queue, run_at=run_at, after=after,
+        cache_ttl=cache_ttl, concurrency_key=concurrency_key,
+    )
+    return count, time.perf_counter() - started
 
-def list_failed_jobs():
-    jobs = storage.list_failed()
-    for j in jobs:
-        print(f"[FAILED] {j.get('data', '{}')} → attempts: {j.get('attempts', 0)}")
-    print(f"Total Failed: {len(jobs)} jobs")
+def job_record(job):
+    """A job hash as a JSON-ready dict, with its JSON-encoded fields decoded."""
+    record = dict(job)
+    for field in ("data", "result"):
+        if field in record:
+            try:
+                record[field] = json.loads(record[field])
+            except ValueError:
+                pass
+    return record
 
 
-def list_processing_jobs():
-    jobs = storage.list_processing()
-    for j in jobs:
-        print(f"[PROCESSING] {j.get('data', '{}')} → started_at: {j.get('started_at')}")
-    print(f"Total Processing: {len(jobs)} jobs")
+# Columns of `list --format table`: (header, width); the command takes the rest.
+TABLE_COLUMNS = (("ID", 36), ("STATUS", 10), ("ATTEMPTS", 8), ("DATE ADDED", 19))
 
 
-def list_completed_jobs():
-    jobs = storage.list_completed()
-    for j in jobs:
-        print(f"[COMPLETED] {j.get('data', '{}')} → completed_at: {j.get('completed_at')}")
-    print(f"Total Completed: {len(jobs)} jobs")
+def format_table_row(values):
+    cells = [str(v).ljust(width) for v, (_, width) in zip(values, TABLE_COLUMNS)]
+    return "  ".join(cells + [str(values[-1])])
 
 
-def list_all_jobs():
-    jobs = storage.list_jobs()
-    for j in jobs:
-        print(f"[{j.get('status', '?')}][{j.get('date_added','?')}] {j.get('data', '{}')}")
-    print(f"Total: {len(jobs)} jobs")
+def list_jobs(state_filter=None, limit=None, cursor=None, sort="date_added", fmt="table",
+              archived=False):
+    """
+    Stream jobs (optionally only those in `state_filter`) to stdout, oldest
+    first, or newest first with sort="-date_added". With `archived`, list
+    jobs retention moved to the local archive instead, in archive order.
+
+    Rows are printed as each batch arrives rather than after loading every
+    job. Returns the cursor to pass back in to continue after the last row,
+    or None if there are no more jobs.
+    """
+    states = (state_filter,) if state_filter else JOB_STATES
+    if archived:
+        jobs = ((None, job) for job in islice(iter_archived(states), limit))
+    else:
+        jobs = storage.iter_jobs(states, cursor=cursor, limit=limit, reverse=sort.startswith("-"))
+
+    if fmt == "table":
+        click.echo(format_table_row([name for name, _ in TABLE_COLUMNS] + ["COMMAND"]))
+
+    count, last = 0, None
+    for last, job in jobs:
+        record = job_record(job)
+        if fmt == "jsonl":
+            click.echo(json.dumps(record))
+        else:
+            data = record.get("data")
+            command = data.get("command", "N/A") if isinstance(data, dict) else data
+            click.echo(format_table_row([
+                job["id"],
+                job.get("status", "unknown"),
+                f"{job.get('attempts', 0)}/{job.get('max_retries', '?')}",
+                job.get("date_added", "-"),
+                command,
+            ]))
+        count += 1
 
+    if fmt == "table":
+        if count == 0:
+            click.echo(f"No jobs found with state '{state_filter}'." if state_filter else "No jobs found.")
+        else:
+            click.echo(f"Total: {count} jobs")
+    # A full page may have more after it
+    return last if limit is not None and count == limit and not archived else None
 
-def list_dlq_jobs():
-    jobs = storage.list_dlq()
-    for j in jobs:
-        print(f"[DLQ] {j.get('data', '{}')} → reason: {j.get('reason')}")
-    print(f"Total DLQ: {len(jobs)} jobs")
 
 def get_active_workers():
-    import redis
-    r = redis.Redis(host="localhost", port=6379, decode_responses=True)
+    keys = list(storage.r.scan_iter("queuectl:worker:*", count=1000))
+    pipe = storage.r.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
     workers = {}
-    for key in r.keys("queuectl:worker:*"):
-        workers[key.split(":")[-1]] = r.hgetall(key)
+    for key, info in zip(keys, pipe.execute()):
+        if info:
+            workers[key.split(":")[-1]] = info
     return workers
 
 
+def run_command(command, job_log, timeout=None):
+    """
+    Run a shell command, streaming its stdout/stderr into `job_log` while it
+    runs and flushing the log at least every FLUSH_INTERVAL seconds.
 
+    Returns (returncode, stdout, stderr); raises subprocess.TimeoutExpired
+    (after killing the command) if it runs longer than `timeout` seconds.
+    """
+    proc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = [], []
+    pumps = [
+        threading.Thread(target=job_log.pump, args=(proc.stdout, stdout), daemon=True),
+        threading.Thread(target=job_log.pump, args=(proc.stderr, stderr), daemon=True),
+    ]
+    for pump in pumps:
+        pump.start()
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    timed_out = False
+    try:
+        while True:
+            wait_for = FLUSH_INTERVAL
+            if deadline is not None:
+                wait_for = max(0, min(wait_for, deadline - time.monotonic()))
+            try:
+                proc.wait(timeout=wait_for)
+                break
+            except subprocess.TimeoutExpired:
+                if deadline is not None and time.monotonic() >= deadline:
+                    timed_out = True
+                    proc.kill()
+                    proc.wait()
+                    raise subprocess.TimeoutExpired(command, timeout)
+                job_log.flush()
+    finally:
+        # A killed shell's children may still hold the pipes open
+        for pump in pumps:
+            pump.join(timeout=1 if timed_out else None)
+        if not any(pump.is_alive() for pump in pumps):
+            proc.stdout.close()
+            proc.stderr.close()
 
+    decode = lambda chunks: b"".join(chunks).decode(errors="replace")
+    return proc.returncode, decode(stdout), decode(stderr)
 
-def process_next_job(worker_name="Worker"):
-    job_id, data = storage.get_next_job()
-    if not job_id:
-        return  # Quietly return if no jobs
-
-    log_file_path = os.path.join(LOG_DIR, f"{job_id}.log")
 
-    def log(message):
-        """Helper to write logs to both console and file."""
-        timestamp = time.strftime("[%Y-%m-%d %H:%M:%S]")
-        entry = f"{timestamp} {message}"
-        print(entry)
-        with open(log_file_path, "a") as f:
-            f.write(entry + "\n")
+def process_job(job_id, data, worker_name="Worker", owner=None):
+    """
+    Run a job that `worker_name` has already claimed, under owner id `owner`
+    if given: if the job was requeued from that owner meanwhile, its outcome
+    is discarded.
+    """
+    job_log = JobLog(job_id)
+    log = job_log.log
 
     log(f"👷 {worker_name} picked job {job_id}: {data}")
 
     try:
         command = data.get("command")
-        # --- NEW: Get the timeout value ---
-        # This will be `None` if not set, which `subprocess.run`
-        # correctly interprets as "no timeout".
+        # `None` when not set, which run_command treats as "no timeout".
         timeout = data.get("timeout")
 
         if not command:
             raise ValueError("No command found in job data")
 
-        # Update status to 'processing'
-        storage.r.hset(f"queuectl:jobs:{job_id}", mapping={"status": "processing"})
-        storage.r.hset(
-            f"queuectl:worker:{worker_name}", "current_job", f"Job-{job_id} ({command})"
-        )
+        with profiling.phase("registry"):
+            storage.r.hset(
+                f"queuectl:worker:{worker_name}", "current_job", f"Job-{job_id} ({command})"
+            )
 
         log(f"🚀 Executing command: {command}")
 
-        # Execute the shell command
-        result = subprocess.run(
-            command,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=timeout  # --- NEW: Pass timeout to subprocess ---
-        )
+        # Execute the shell command; its output goes to the log as it is produced
+        with profiling.phase("run"):
+            returncode, stdout, stderr = run_command(command, job_log, timeout)
 
         # Handle result
-        if result.returncode == 0:
-            output = result.stdout.strip() or "(no output)"
-            storage.mark_completed(job_id, output)
-            log(f"✅ Job {job_id} completed successfully:\n{output}")
+        if returncode == 0:
+            output = stdout.strip() or "(no output)"
+            with profiling.phase("complete"):
+                completed = storage.mark_completed(job_id, output, owner)
+            if completed:
+                log(f"✅ Job {job_id} completed successfully.")
+            else:
+                report_lost(job_id)
         else:
-            error_msg = result.stderr.strip() or f"Command failed with code {result.returncode}"
+            error_msg = stderr.strip() or f"Command failed with code {returncode}"
             raise Exception(error_msg)
 
-    # --- NEW: Catch timeout errors specifically ---
     except subprocess.TimeoutExpired:
         error_msg = f"Job exceeded timeout of {timeout}s"
-        storage.mark_failed(job_id, error_msg)
+        with profiling.phase("fail"):
+            storage.mark_failed(job_id, error_msg, owner)
         print(f"⏰ Job {job_id} failed: {error_msg}")
 
     except Exception as e:
-        storage.mark_failed(job_id, str(e))
+        with profiling.phase("fail"):
+            storage.mark_failed(job_id, str(e), owner)
         # Added a print here for better visibility on failures
         print(f"❌ Job {job_id} failed: {e}")
 
     finally:
-        storage.r.hset(f"queuectl:worker:{worker_name}", "current_job", "idle")
-        storage.r.hset(f"queuectl:jobs:{job_id}", "log_file", log_file_path)
+        with profiling.phase("registry"):
+            storage.r.hset(f"queuectl:worker:{worker_name}", "current_job", "idle")
         log("🏁 Job finished.")
-
+        job_log.close()
@@ -0,0 +1,182 @@
+# core/records.py
+#
+# Compact job record format. Job hashes use short field names, store
+# timestamps as epoch seconds, and leave out values that equal their
+# defaults (attempts=0, priority=5, queue=default, retry/backoff settings,
+# which are resolved from queuectl:config when needed). decode_job() turns a
+# stored hash, compact or written by an older version, back into the
+# long-named form every reader uses.
+#
+# `data` and `result` can additionally be encoded with msgpack and/or zlib.
+# Redis clients here decode replies as UTF-8, so binary encodings are stored
+# base85-encoded behind a "~<codec>:" tag; plain JSON is stored untagged.
+# The codec is set through the environment so spawned workers inherit it:
+#   QUEUECTL_PAYLOAD_CODEC   json (default), zlib, msgpack or msgpack+zlib
+import base64
+import json
+import os
+import time
+import zlib
+
+# Long name -> stored field
+FIELDS = {
+    "status": "s",
+    "date_added": "t",
+    "attempts": "a",
+    "max_retries": "mr",
+    "backoff_base": "bb",
+    "backoff_factor": "bf",
+    "data": "d",
+    "worker": "w",
+    "result": "o",
+    "completed_at": "ct",
+    "reason": "x",
+    "failed_at": "ft",
+    "last_error": "le",
+    "next_retry_at": "nr",
+    "log_file": "lf",
+    "priority": "p",
+    "queue": "q",
+    "run_at": "ra",
+    "schedule": "sc",
+    "parents": "pa",
+    "pending_parents": "dp",
+    "workflow": "wf",
+    "idempotency_key": "ik",
+    "cache_key": "ck",
+    "cache_ttl": "cl",
+    "cache_hit": "ch",
+    "concurrency_key": "ky",
+    "queued_at": "qt",
+    "started_at": "st",
+}
+LONG_NAMES = {short: name for name, short in FIELDS.items()}
+
+TIMESTAMP_FIELDS = ("date_added", "completed_at", "failed_at", "next_retry_at", "run_at")
+PAYLOAD_FIELDS = ("data", "result")
+
+# Values left out of the hash when they are the default.
+IMPLICIT_DEFAULTS = {"attempts": "0", "priority": "5", "queue": "default"}
+
+# Built-in retry/backoff defaults, used when neither the job nor
+# queuectl:config sets them.
+RETRY_DEFAULTS = {"max_retries": "3", "backoff_base": "2", "backoff_factor": "2"}
+
+CODECS = ("json", "zlib", "msgpack", "msgpack+zlib")
+
+# Payloads shorter than this are stored uncompressed even with a zlib codec;
+# compressing them does not pay for the tag and base85 overhead.
+COMPRESS_MIN_BYTES = 256
+
+
+def codec():
+    name = os.environ.get("QUEUECTL_PAYLOAD_CODEC") or "json"
+    if name not in CODECS:
+        raise ValueError(f"Unknown payload codec {name!r} (choose from {', '.join(CODECS)})")
+    return name
+
+
+def configure(payload_codec=None):
+    """Override the payload codec (e.g. from CLI flags) for this and child processes."""
+    if payload_codec:
+        os.environ["QUEUECTL_PAYLOAD_CODEC"] = payload_codec
+        codec()
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise RuntimeError(
+            "The msgpack payload codec needs the msgpack package: pip install queuectl[msgpack]"
+        ) from None
+    return msgpack
+
+
+def encode_payload(value, name=None):
+    """Encode a job's data or result for storage with codec `name` (default: configured)."""
+    name = name or codec()
+    if name in ("json", "zlib"):
+        raw = json.dumps(value, separators=(",", ":")).encode()
+        if name == "json" or len(raw) < COMPRESS_MIN_BYTES:
+            return raw.decode()
+        return "~z:" + base64.b85encode(zlib.compress(raw)).decode()
+
+    raw = _msgpack().packb(value)
+    if name == "msgpack+zlib" and len(raw) >= COMPRESS_MIN_BYTES:
+        return "~mz:" + base64.b85encode(zlib.compress(raw)).decode()
+    return "~m:" + base64.b85encode(raw).decode()
+
+
+def decode_payload(stored):
+    """Inverse of encode_payload(), whichever codec wrote the value."""
+    if not stored.startswith("~"):
+        return json.loads(stored)
+    tag, _, body = stored[1:].partition(":")
+    raw = base64.b85decode(body)
+    if tag.endswith("z"):
+        raw = zlib.decompress(raw)
+    if tag.startswith("m"):
+        return _msgpack().unpackb(raw)
+    return json.loads(raw)
+
+
+def format_timestamp(ts=None):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+
+
+def parse_timestamp(value):
+    """Epoch seconds from a stored timestamp, compact or formatted (None if unset)."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return time.mktime(time.strptime(value, "%Y-%m-%d %H:%M:%S"))
+
+
+def decode_job(stored, config=None):
+    """
+    Long-named view of a stored job hash: formatted timestamps, `data` and
+    `result` as JSON text, and omitted settings filled in from `config`
+    (the queuectl:config hash) or the built-in defaults.
+    """
+    job = {LONG_NAMES.get(field, field): value for field, value in stored.items()}
+    for name, default in IMPLICIT_DEFAULTS.items():
+        job.setdefault(name, default)
+    for name, default in RETRY_DEFAULTS.items():
+        if name not in job:
+            job[name] = (config or {}).get(name, default)
+    for name in TIMESTAMP_FIELDS:
+        value = job.get(name)
+        # Epoch seconds, whole or (for completed_at/failed_at) fractional
+        if value and value.replace(".", "", 1).isdigit():
+            job[name] = format_timestamp(float(value))
+    for name in PAYLOAD_FIELDS:
+        value = job.get(name)
+        if value and value.startswith("~"):
+            job[name] = json.dumps(decode_payload(value))
+    return job
+
+
+def encode_job(job, config=None):
+    """
+    Compact form of a long-named job hash (e.g. one written by an older
+    version), for migration. Settings equal to what `config` (or the
+    built-in defaults) would supply are dropped. Returns the stored
+    field -> value mapping.
+    """
+    compact = {}
+    for name, value in job.items():
+        if name not in FIELDS or value in (None, ""):
+            continue
+        if IMPLICIT_DEFAULTS.get(name) == value:
+            continue
+        if name in RETRY_DEFAULTS and value == (config or {}).get(name, RETRY_DEFAULTS[name]):
+            continue
+        if name in TIMESTAMP_FIELDS:
+            value = int(parse_timestamp(value))
+        elif name in PAYLOAD_FIELDS and not value.startswith("~"):
+            value = encode_payload(json.loads(value))
+        compact[FIELDS[name]] = value
+    return compact
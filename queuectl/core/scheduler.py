@@ -0,0 +1,93 @@
+# core/scheduler.py
+#
+# A single retry scheduler per deployment. Every `worker start` process runs
+# one, but only the holder of a Redis lease promotes jobs (due retries and
+# scheduled jobs), fires recurring schedules, requeues jobs parked by rate
+# limits, requeues jobs of workers that died and applies job retention; the
+# rest stand by and take over if the leader's lease lapses.
+import os
+import socket
+import threading
+import time
+
+from queuectl.core import scripts
+from queuectl.core.archive import archive_jobs
+
+LEASE_KEY = "queuectl:scheduler:lease"
+
+# The leader renews well before the lease expires; standbys retry on the
+# same interval.
+LEASE_TTL = 10
+RENEW_INTERVAL = LEASE_TTL / 3
+
+# How often the leader expires (and optionally archives) finished jobs and
+# requeues the jobs of workers whose lease has lapsed.
+RETENTION_INTERVAL = 5
+
+
+class RetryScheduler:
+    """
+    While holding the scheduler lease, promotes due jobs from every queue's
+    retry and scheduled sets, enqueues jobs for due recurring schedules,
+    requeues rate-limited jobs as tokens refill, and every
+    RETENTION_INTERVAL expires finished jobs past their retention and
+    requeues the jobs claimed by workers that died.
+
+    Between passes it sleeps until the next of these falls due (capped at
+    the lease renewal interval), or until `wake_event` is set by the control
+    channel when something sooner is scheduled.
+    """
+
+    def __init__(self, storage, stop_event, wake_event):
+        self.storage = storage
+        self.stop_event = stop_event
+        self.wake_event = wake_event
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self._next_retention = 0
+        self._renew = storage.r.register_script(scripts.RENEW_LEASE)
+        self._release = storage.r.register_script(scripts.RELEASE_LEASE)
+
+    def _hold_lease(self):
+        ttl_ms = int(LEASE_TTL * 1000)
+        if self.is_leader:
+            self.is_leader = bool(self._renew(keys=[LEASE_KEY], args=[self.owner, ttl_ms]))
+        else:
+            self.is_leader = bool(self.storage.r.set(LEASE_KEY, self.owner, nx=True, px=ttl_ms))
+        return self.is_leader
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                # Cleared before the pass so a wake-up sent during it is kept
+                self.wake_event.clear()
+                sleep_for = RENEW_INTERVAL
+                try:
+                    if self._hold_lease():
+                        due_times = (self.storage.process_retry_queue(),
+                                     self.storage.fire_schedules(),
+                                     self.storage.unpark_due())
+                        # Due times are on the Redis server's clock, not ours
+                        now = self.storage.server_time()
+                        for next_due in due_times:
+                            if next_due is not None:
+                                sleep_for = min(sleep_for, max(0.0, next_due - now))
+                        if time.monotonic() >= self._next_retention:
+                            self._next_retention = time.monotonic() + RETENTION_INTERVAL
+                            self.storage.expire_finished(archive=archive_jobs)
+                            recovered = self.storage.reclaim_abandoned()
+                            if recovered:
+                                print(f"♻️ Requeued {recovered} job(s) left claimed by workers that died.")
+                except Exception as e:
+                    print(f"⚠️ Retry scheduler error: {e}")
+
+                self.wake_event.wait(sleep_for)
+        finally:
+            if self.is_leader:
+                self._release(keys=[LEASE_KEY], args=[self.owner])
+                self.is_leader = False
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name="queuectl-retry-scheduler", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,139 @@
+# core/schedules.py
+#
+# Time parsing for scheduled jobs: `enqueue --run-at/--delay` values and the
+# cron expressions of recurring schedules (`schedule add --cron`). Cron
+# expressions use the standard five fields, evaluated in local time:
+#
+#   minute hour day-of-month month day-of-week
+#
+# Each field takes `*`, numbers, ranges (`1-5`), steps (`*/15`, `0-30/10`)
+# and comma-separated lists; months and weekdays also take three-letter
+# names. As in cron, when both day fields are restricted a day matching
+# either one fires.
+import re
+import time
+from datetime import datetime, timedelta
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)([smhd]?)")
+
+MONTH_NAMES = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+WEEKDAY_NAMES = ["sun", "mon", "tue", "wed", "thu", "fri", "sat"]
+
+# (low, high, names) per cron field; names map to low, low + 1, ...
+CRON_FIELDS = (
+    (0, 59, None),
+    (0, 23, None),
+    (1, 31, None),
+    (1, 12, MONTH_NAMES),
+    (0, 7, WEEKDAY_NAMES),  # 0 and 7 are both Sunday
+)
+
+# Days searched for the next matching one before an expression is declared
+# unsatisfiable (e.g. "0 0 31 2 *"); covers a full leap-year cycle.
+MAX_SEARCH_DAYS = 4 * 366
+
+
+def parse_duration(value):
+    """Seconds in a duration like "30s", "5m", "1.5h", "2d" or a bare number of seconds."""
+    total, position = 0.0, 0
+    text = value.strip().lower()
+    for match in DURATION_PATTERN.finditer(text):
+        if match.start() != position:
+            break
+        total += float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
+        position = match.end()
+    if not text or position != len(text):
+        raise ValueError(f"Invalid duration {value!r} (e.g. 30s, 5m, 2h, 1d, 1h30m)")
+    return total
+
+
+def parse_run_at(value):
+    """Epoch seconds from an epoch number or an ISO 8601 date/time (local time if no offset)."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(
+            f"Invalid time {value!r} (use epoch seconds or e.g. '2025-01-31 09:30')"
+        ) from None
+
+
+def _parse_field(text, low, high, names):
+    def number(token):
+        token = token.lower()
+        if names and token in names:
+            return low + names.index(token)
+        if not token.isdigit() or not low <= int(token) <= high:
+            raise ValueError(f"{token!r} is not between {low} and {high}")
+        return int(token)
+
+    values = set()
+    for part in text.split(","):
+        spec, _, step = part.partition("/")
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            first, _, last = spec.partition("-")
+            start, end = number(first), number(last)
+        else:
+            # "5/15" steps from 5 to the end of the range
+            start = number(spec)
+            end = high if step else start
+        if step and (not step.isdigit() or int(step) == 0):
+            raise ValueError(f"invalid step in {part!r}")
+        if start > end:
+            raise ValueError(f"invalid range {part!r}")
+        values.update(range(start, end + 1, int(step or 1)))
+    return values
+
+
+class CronSchedule:
+    """A parsed five-field cron expression."""
+
+    def __init__(self, expression):
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"Invalid cron expression {expression!r}: expected 5 fields")
+        try:
+            parsed = [_parse_field(text, *spec) for text, spec in zip(fields, CRON_FIELDS)]
+        except ValueError as e:
+            raise ValueError(f"Invalid cron expression {expression!r}: {e}") from None
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+        self._sorted_minutes = sorted(self.minutes)
+        self._sorted_hours = sorted(self.hours)
+
+    def _day_matches(self, day):
+        if day.month not in self.months:
+            return False
+        in_days = day.day in self.days
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, ts=None):
+        """Epoch seconds of the first matching minute strictly after `ts` (default: now)."""
+        start = datetime.fromtimestamp(time.time() if ts is None else ts)
+        start = start.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(MAX_SEARCH_DAYS):
+            if self._day_matches(day):
+                same_day = day.date() == start.date()
+                for hour in self._sorted_hours:
+                    if same_day and hour < start.hour:
+                        continue
+                    for minute in self._sorted_minutes:
+                        if same_day and hour == start.hour and minute < start.minute:
+                            continue
+                        return day.replace(hour=hour, minute=minute).timestamp()
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression {self.expression!r} never matches")
@@ -0,0 +1,885 @@
+# core/scripts.py
+#
+# Server-side Lua scripts for every job state transition. RedisStorage
+# registers them once and invokes them with EVALSHA, so each lifecycle step
+# (enqueue, dequeue, complete, fail/backoff, DLQ, retry promotion, expiry) is
+# a single atomic round trip.
+#
+# The job hash, state indexes and counters are addressed by name inside the
+# scripts rather than through KEYS, so these assume a single (non-cluster)
+# Redis server. Job hash fields use the compact names from core/records.py
+# (s=status, t=date_added, a=attempts, d=data, w=worker, p=priority,
+# q=queue, ...).
+from queuectl.core.metrics import DURATION_BUCKETS
+
+# Histogram buckets for the metric helpers, as {upper bound, label} pairs.
+_LUA_BUCKETS = ", ".join(f"{{{bound!r}, '{bound:g}'}}" for bound in DURATION_BUCKETS)
+
+# Shared helpers prepended to every script.
+PRELUDE = """
+local function job_key(job_id)
+    return 'queuectl:jobs:' .. job_id
+end
+
+-- Job timing metrics, kept in queuectl:metrics (see core/metrics.py). Jobs
+-- record when they became runnable ('qt'), were claimed ('st') and finished
+-- ('ct'/'ft'), as epoch seconds with sub-millisecond resolution. These, and
+-- every other time a script writes or compares against (index scores, retry
+-- and due times, rate buckets), come from the Redis server's clock rather
+-- than the caller's, so hosts whose clocks disagree still agree on them.
+-- Reading TIME before writing needs effects replication (the default from
+-- Redis 5 on; a no-op there).
+redis.replicate_commands()
+
+local function server_time()
+    local time = redis.call('TIME')
+    return tonumber(time[1]) + tonumber(time[2]) / 1000000
+end
+
+local DURATION_BUCKETS = {""" + _LUA_BUCKETS + """}
+
+local function queue_label(queue)
+    return 'queue="' .. (queue or 'default') .. '"'
+end
+
+local function observe(metric, labels, seconds)
+    local bucket = '+Inf'
+    for _, bound in ipairs(DURATION_BUCKETS) do
+        if seconds <= bound[1] then
+            bucket = bound[2]
+            break
+        end
+    end
+    redis.call('HINCRBY', 'queuectl:metrics', metric .. '|' .. labels .. '|' .. bucket, 1)
+    redis.call('HINCRBYFLOAT', 'queuectl:metrics', metric .. '|' .. labels .. '|sum', seconds)
+end
+
+-- Count a claimed job's run as finished with `outcome`, timing it from its claim.
+local function record_finish(job_id, outcome)
+    local job = redis.call('HMGET', job_key(job_id), 'st', 'q')
+    local labels = queue_label(job[2]) .. ',outcome="' .. outcome .. '"'
+    redis.call('HINCRBY', 'queuectl:metrics', 'queuectl_jobs_finished_total|' .. labels, 1)
+    if job[1] then
+        observe('queuectl_job_run_seconds', labels, math.max(0, server_time() - tonumber(job[1])))
+    end
+end
+
+-- A named queue's lanes, wake-up list, retry set and DLQ live under
+-- queuectl:queue:<name>:; the default queue keeps the top-level keys.
+local function queue_prefix(queue)
+    if not queue or queue == '' or queue == 'default' then
+        return 'queuectl:'
+    end
+    return 'queuectl:queue:' .. queue .. ':'
+end
+
+-- Pending jobs wait on one list per priority level, 1-9 (9 most urgent);
+-- the default queue's normal level, 5, keeps the original queue list.
+local function lane_key(queue, priority)
+    priority = priority or '5'
+    local prefix = queue_prefix(queue)
+    if prefix == 'queuectl:' and priority == '5' then
+        return 'queuectl:jobs'
+    end
+    return prefix .. 'lane:' .. priority
+end
+
+-- Queue a pending job on its lane (at the consuming end if `first`, e.g. a
+-- released claim) and leave a wake-up token for workers blocked on its queue.
+local function push_pending(job_id, first)
+    local job = redis.call('HMGET', job_key(job_id), 'q', 'p')
+    redis.call(first and 'RPUSH' or 'LPUSH', lane_key(job[1], job[2]), job_id)
+    redis.call('LPUSH', queue_prefix(job[1]) .. 'ready', 1)
+end
+
+-- Limits: a job enqueued with a concurrency key ('ky') may only be claimed
+-- while its key, configured in queuectl:limit:<key>, has a free slot
+-- (concurrency: at most that many of its jobs processing, tracked in the
+-- <key>:holders sorted set) and a token (rate: a bucket of `rate` tokens
+-- refilled over `period` seconds). DEQUEUE parks jobs it cannot admit on
+-- <key>:parked and moves on; they go back to their lanes as slots free up or
+-- tokens refill, the latter tracked in queuectl:limits:parked by when.
+local function limit_key(key)
+    return 'queuectl:limit:' .. key
+end
+
+-- The key's settings, with its rate bucket refilled up to `now`.
+local function read_limit(key, now)
+    local stored = redis.call('HMGET', limit_key(key), 'concurrency', 'rate', 'period', 'tokens', 'ts')
+    local limit = {concurrency = tonumber(stored[1]), rate = tonumber(stored[2])}
+    if limit.rate then
+        limit.period = tonumber(stored[3]) or 1
+        local tokens = tonumber(stored[4]) or limit.rate
+        local elapsed = math.max(0, now - (tonumber(stored[5]) or now))
+        limit.tokens = math.min(limit.rate, tokens + elapsed * limit.rate / limit.period)
+    end
+    return limit
+end
+
+-- How many more of the key's jobs may start now, and if the rate is what
+-- holds them back, when the next token arrives.
+local function limit_capacity(key, limit, now)
+    local capacity = math.huge
+    if limit.concurrency then
+        local holders = limit_key(key) .. ':holders'
+        capacity = limit.concurrency - redis.call('ZCARD', holders)
+        if capacity <= 0 then
+            -- Drop holders no longer running, e.g. deleted mid-run
+            for _, holder in ipairs(redis.call('ZRANGE', holders, 0, -1)) do
+                if redis.call('HGET', job_key(holder), 's') ~= 'processing' then
+                    redis.call('ZREM', holders, holder)
+                end
+            end
+            capacity = limit.concurrency - redis.call('ZCARD', holders)
+        end
+        if capacity <= 0 then
+            return 0, nil
+        end
+    end
+    if limit.rate and limit.tokens < 1 then
+        return 0, now + (1 - limit.tokens) * limit.period / limit.rate
+    end
+    if limit.rate then
+        capacity = math.min(capacity, math.floor(limit.tokens))
+    end
+    return capacity, nil
+end
+
+-- Take a slot and a token of the key for job_id. Returns whether it did,
+-- and if not, when a rate-limited key gets its next token.
+local function acquire_limit(key, job_id, now)
+    local limit = read_limit(key, now)
+    local capacity, retry_at = limit_capacity(key, limit, now)
+    if capacity <= 0 then
+        return false, retry_at
+    end
+    if limit.rate then
+        redis.call('HSET', limit_key(key), 'tokens', limit.tokens - 1, 'ts', now)
+    end
+    if limit.concurrency then
+        redis.call('ZADD', limit_key(key) .. ':holders', now, job_id)
+    end
+    return true, nil
+end
+
+local function park(key, job_id, retry_at)
+    redis.call('LPUSH', limit_key(key) .. ':parked', job_id)
+    -- LT: never postpone an earlier wake-up already registered
+    redis.call('ZADD', 'queuectl:limits:parked', 'LT', retry_at or '+inf', key)
+end
+
+-- Return as many of the key's parked jobs to their lanes as could start now.
+local function unpark(key, now)
+    local parked = limit_key(key) .. ':parked'
+    local waiting = redis.call('LLEN', parked)
+    local capacity, retry_at = limit_capacity(key, read_limit(key, now), now)
+    for _ = 1, math.min(waiting, capacity) do
+        local job_id = redis.call('RPOP', parked)
+        if redis.call('HGET', job_key(job_id), 's') == 'pending' then
+            push_pending(job_id, true)
+        end
+    end
+    if redis.call('LLEN', parked) == 0 then
+        redis.call('ZREM', 'queuectl:limits:parked', key)
+    else
+        redis.call('ZADD', 'queuectl:limits:parked', retry_at or '+inf', key)
+    end
+end
+
+-- Move a job to new_state: swap its state index entry (keeping the enqueue
+-- time score), update the status field and adjust the per-state counters.
+local function transition(job_id, new_state, now)
+    local key = job_key(job_id)
+    local old_state = redis.call('HGET', key, 's')
+    local score = now
+    if old_state then
+        local old_score = redis.call('ZSCORE', 'queuectl:state:' .. old_state, job_id)
+        if old_score then
+            score = old_score
+            redis.call('ZREM', 'queuectl:state:' .. old_state, job_id)
+            redis.call('HINCRBY', 'queuectl:stats', old_state, -1)
+        end
+    end
+    redis.call('ZADD', 'queuectl:state:' .. new_state, score, job_id)
+    redis.call('HINCRBY', 'queuectl:stats', new_state, 1)
+    redis.call('HSET', key, 's', new_state)
+    -- A job leaving processing frees its concurrency slot
+    if old_state == 'processing' and new_state ~= 'processing' then
+        local limit = redis.call('HGET', key, 'ky')
+        if limit and redis.call('ZREM', limit_key(limit) .. ':holders', job_id) == 1 then
+            unpark(limit, now)
+        end
+    end
+end
+
+-- Workers with a non-empty claim list are registered in queuectl:claimants,
+-- which is what recovery iterates instead of scanning for claim lists.
+local function unregister_claimant(worker)
+    if redis.call('EXISTS', 'queuectl:claimed:' .. worker) == 0 then
+        redis.call('SREM', 'queuectl:claimants', worker)
+    end
+end
+
+-- Drop a job from the claim list of the worker that dequeued it.
+local function release_claim(job_id)
+    local worker = redis.call('HGET', job_key(job_id), 'w')
+    if worker then
+        redis.call('LREM', 'queuectl:claimed:' .. worker, 1, job_id)
+        unregister_claimant(worker)
+    end
+end
+
+-- Dependencies: a job enqueued after others waits in the 'waiting' state
+-- with 'dp' counting the parents not yet completed; each parent lists its
+-- waiting dependents in queuectl:deps:<parent>.
+
+-- Register job_id as a dependent of each parent that has not completed.
+-- Missing parents (e.g. expired after completing) count as done. Returns the
+-- number still to finish and one of them that is dead, if any.
+local function wait_for_parents(job_id, parents)
+    local unmet, dead = 0, nil
+    for _, parent in ipairs(parents) do
+        local status = redis.call('HGET', job_key(parent), 's')
+        if status and status ~= 'completed' then
+            redis.call('SADD', 'queuectl:deps:' .. parent, job_id)
+            unmet = unmet + 1
+            if status == 'dead' then
+                dead = parent
+            end
+        end
+    end
+    return unmet, dead
+end
+
+-- Dependents of job_id still waiting on it; forgets the dependency set.
+local function take_dependents(job_id)
+    local deps = 'queuectl:deps:' .. job_id
+    local waiting = {}
+    for _, child in ipairs(redis.call('SMEMBERS', deps)) do
+        if redis.call('HGET', job_key(child), 's') == 'waiting' then
+            table.insert(waiting, child)
+        end
+    end
+    redis.call('DEL', deps)
+    return waiting
+end
+
+-- Count a completed parent off its dependents; those with no parents left
+-- become pending (or scheduled, if their run_at is still ahead).
+local function release_dependents(job_id, now)
+    for _, child in ipairs(take_dependents(job_id)) do
+        local key = job_key(child)
+        if redis.call('HINCRBY', key, 'dp', -1) <= 0 then
+            redis.call('HDEL', key, 'dp')
+            local job = redis.call('HMGET', key, 'q', 'ra')
+            local run_at = tonumber(job[2])
+            if run_at and run_at > now then
+                transition(child, 'scheduled', now)
+                redis.call('ZADD', queue_prefix(job[1]) .. 'scheduled', run_at, child)
+                redis.call('PUBLISH', 'queuectl:control', 'retry')
+            else
+                redis.call('HSET', key, 'qt', now)
+                transition(child, 'pending', now)
+                push_pending(child)
+            end
+        end
+    end
+end
+
+-- Mark a job completed with `result` and release its dependents.
+local function complete_job(job_id, result, now)
+    release_claim(job_id)
+    transition(job_id, 'completed', now)
+    redis.call('HSET', job_key(job_id), 'o', result, 'ct', now)
+    redis.call('ZADD', 'queuectl:finished:completed', now, job_id)
+    redis.call('HINCRBY', 'queuectl:stats', 'completed_total', 1)
+    release_dependents(job_id, now)
+end
+
+-- Result cache: a job enqueued with a cache TTL carries a hash of its data
+-- ('ck') and the TTL ('cl'). COMPLETE stores its result under
+-- queuectl:cache:<hash> for that long; until then, jobs with the same data
+-- complete with the stored result instead of running. Returns whether the
+-- job was completed from the cache.
+local function complete_from_cache(job_id, now)
+    local digest = redis.call('HGET', job_key(job_id), 'ck')
+    if not digest then
+        return false
+    end
+    local cached = redis.call('GET', 'queuectl:cache:' .. digest)
+    if not cached then
+        return false
+    end
+    complete_job(job_id, cached, now)
+    redis.call('HSET', job_key(job_id), 'ch', 1)
+    redis.call('HINCRBY', 'queuectl:stats', 'cache_hits', 1)
+    return true
+end
+
+-- Move a job to its queue's DLQ. Its waiting dependents can never run, so
+-- they follow it, and theirs after them, down the whole graph.
+local function move_to_dlq(job_id, reason, now)
+    local doomed, reasons = {job_id}, {reason}
+    local i = 1
+    while i <= #doomed do
+        local id = doomed[i]
+        -- A dependent reached through two failed parents is only moved once
+        if i == 1 or redis.call('HGET', job_key(id), 's') == 'waiting' then
+            release_claim(id)
+            transition(id, 'dead', now)
+            redis.call('HSET', job_key(id), 'x', reasons[i], 'ft', now)
+            redis.call('LPUSH', queue_prefix(redis.call('HGET', job_key(id), 'q')) .. 'dead_letter', id)
+            redis.call('ZADD', 'queuectl:finished:dead', now, id)
+            redis.call('HINCRBY', 'queuectl:stats', 'dead_total', 1)
+            for _, child in ipairs(take_dependents(id)) do
+                table.insert(doomed, child)
+                table.insert(reasons, 'dependency ' .. id .. ' failed')
+            end
+        end
+        i = i + 1
+    end
+end
+"""
+
+# ARGV = job_id, data, max_retries, backoff_base, backoff_factor, priority,
+#        queue, run_at (epoch seconds), schedule id, workflow id,
+#        idempotency key, its TTL, cache key (hash of the data), cache TTL,
+#        concurrency key, parent job ids...
+# Empty retry/backoff arguments are left out of the hash; FAIL resolves them
+# from queuectl:config, then defaults. An empty priority means normal (5), an
+# empty queue the default queue. Named queues are registered in
+# queuectl:queues. With a run_at still ahead the job waits in the scheduled
+# state, on its queue's scheduled set, until PROMOTE makes it pending. With
+# parents that have not completed it waits in the waiting state until
+# COMPLETE releases it (or goes straight to the DLQ if one of them is dead).
+# Returns the job id; with an idempotency key already used by a job that
+# still exists, nothing is written and that job's id is returned instead.
+ENQUEUE = PRELUDE + """
+local job_id = ARGV[1]
+local now = server_time()
+local run_at = ARGV[8]
+if run_at ~= '' and tonumber(run_at) <= now then
+    run_at = ''
+end
+if ARGV[11] ~= '' then
+    local idempotency = 'queuectl:idempotency:' .. ARGV[11]
+    local existing = redis.call('GET', idempotency)
+    if existing and redis.call('EXISTS', job_key(existing)) == 1 then
+        return existing
+    end
+    redis.call('SET', idempotency, job_id, 'EX', ARGV[12])
+end
+local parents = {}
+for i = 16, #ARGV do
+    table.insert(parents, ARGV[i])
+end
+local unmet, dead_parent = wait_for_parents(job_id, parents)
+local state = run_at ~= '' and 'scheduled' or 'pending'
+if unmet > 0 then
+    state = 'waiting'
+end
+local fields = {'t', string.format('%d', now), 's', state, 'd', ARGV[2], 'qt', now}
+for i, field in ipairs({'mr', 'bb', 'bf', 'p', 'q'}) do
+    if ARGV[2 + i] ~= '' then
+        table.insert(fields, field)
+        table.insert(fields, ARGV[2 + i])
+    end
+end
+if run_at ~= '' then
+    table.insert(fields, 'ra')
+    table.insert(fields, string.format('%d', tonumber(run_at)))
+end
+if ARGV[9] ~= '' then
+    table.insert(fields, 'sc')
+    table.insert(fields, ARGV[9])
+end
+if ARGV[10] ~= '' then
+    table.insert(fields, 'wf')
+    table.insert(fields, ARGV[10])
+end
+if ARGV[11] ~= '' then
+    table.insert(fields, 'ik')
+    table.insert(fields, ARGV[11])
+end
+if ARGV[15] ~= '' then
+    table.insert(fields, 'ky')
+    table.insert(fields, ARGV[15])
+end
+if ARGV[13] ~= '' then
+    table.insert(fields, 'ck')
+    table.insert(fields, ARGV[13])
+    table.insert(fields, 'cl')
+    table.insert(fields, ARGV[14])
+end
+if #parents > 0 then
+    table.insert(fields, 'pa')
+    table.insert(fields, table.concat(parents, ','))
+end
+if unmet > 0 then
+    table.insert(fields, 'dp')
+    table.insert(fields, unmet)
+end
+
+redis.call('HSET', job_key(job_id), unpack(fields))
+redis.call('ZADD', 'queuectl:state:' .. state, now, job_id)
+redis.call('HINCRBY', 'queuectl:stats', state, 1)
+-- The first job ever enqueued marks the store as holding only compact
+-- records, unless an older version left jobs behind (see RECORD_FORMAT in
+-- core/storage.py)
+if redis.call('HINCRBY', 'queuectl:stats', 'enqueued_total', 1) == 1
+        and redis.call('EXISTS', 'queuectl:jobs', 'queuectl:retry', 'queuectl:dead_letter') == 0 then
+    redis.call('SETNX', 'queuectl:format', 'compact')
+end
+redis.call('HINCRBY', 'queuectl:metrics', 'queuectl_jobs_enqueued_total|' .. queue_label(ARGV[7] ~= '' and ARGV[7] or nil), 1)
+if ARGV[7] ~= '' then
+    redis.call('SADD', 'queuectl:queues', ARGV[7])
+end
+if dead_parent then
+    move_to_dlq(job_id, 'dependency ' .. dead_parent .. ' failed', now)
+    return job_id
+end
+if state == 'waiting' then
+    return job_id
+end
+if state == 'pending' then
+    if not complete_from_cache(job_id, now) then
+        push_pending(job_id)
+    end
+    return job_id
+end
+
+local scheduled = queue_prefix(ARGV[7]) .. 'scheduled'
+redis.call('ZADD', scheduled, tonumber(run_at), job_id)
+-- Wake the scheduler early if this is now the first job due on the set
+if redis.call('ZRANGE', scheduled, 0, 0)[1] == job_id then
+    redis.call('PUBLISH', 'queuectl:control', 'retry')
+end
+return job_id
+"""
+
+# KEYS[1] = the worker's claim list
+# ARGV = count, worker, woken (the queue whose wake-up token the caller
+#        already took, or ''), queue names... in order of preference
+# Claims up to `count` jobs for the worker and returns {more, id1, data1, id2,
+# ...}. Each call pops at most count * 2 jobs, parked or claimed; `more` is 1
+# when that budget ran out with jobs still queued, so the caller should call
+# again straight away rather than wait for a wake-up token.
+#
+# Each claim comes from the first listed queue with anything pending. Within
+# a queue, priority_mode=strict in queuectl:config always serves the most
+# urgent non-empty lane. Otherwise (the default) lanes are served by smooth
+# weighted round-robin: each non-empty lane gets a share of claims in
+# proportion to its weight (its level, unless priority_weights overrides it
+# as "level=weight,..."), so low lanes keep moving while higher ones are busy.
+# The round-robin credits persist per queue in <prefix>lanes:credit.
+DEQUEUE = PRELUDE + """
+local now = server_time()
+local count = tonumber(ARGV[1])
+local worker = ARGV[2]
+local woken = ARGV[3]
+local queues = {}
+for i = 4, #ARGV do
+    table.insert(queues, ARGV[i])
+end
+local claimed = {}
+
+-- Rate-limited keys whose next token is due get their parked jobs back first
+for _, key in ipairs(redis.call('ZRANGEBYSCORE', 'queuectl:limits:parked', '-inf', now)) do
+    unpark(key, now)
+end
+
+local depth = {}
+local queued = 0
+for _, queue in ipairs(queues) do
+    depth[queue] = {}
+    for level = 1, 9 do
+        depth[queue][level] = redis.call('LLEN', lane_key(queue, tostring(level)))
+        queued = queued + depth[queue][level]
+    end
+end
+if queued == 0 then
+    return {0}
+end
+
+local config = redis.call('HMGET', 'queuectl:config', 'priority_mode', 'priority_weights')
+local strict = config[1] == 'strict'
+local weights = {}
+for level = 1, 9 do
+    weights[level] = level
+end
+if config[2] then
+    for level, weight in string.gmatch(config[2], '(%d)=(%d+)') do
+        weights[tonumber(level)] = tonumber(weight)
+    end
+end
+
+local credits = {}
+local function lane_credits(queue)
+    if not credits[queue] then
+        local stored = redis.call('HMGET', queue_prefix(queue) .. 'lanes:credit',
+            '1', '2', '3', '4', '5', '6', '7', '8', '9')
+        for level = 1, 9 do
+            stored[level] = tonumber(stored[level]) or 0
+        end
+        credits[queue] = stored
+    end
+    return credits[queue]
+end
+
+local function next_lane(queue)
+    local best, total, credit = nil, 0, nil
+    for level = 9, 1, -1 do
+        if depth[queue][level] > 0 then
+            if strict then
+                return level
+            end
+            credit = credit or lane_credits(queue)
+            credit[level] = credit[level] + weights[level]
+            total = total + weights[level]
+            if not best or credit[level] > credit[best] then
+                best = level
+            end
+        end
+    end
+    if best then
+        credit[best] = credit[best] - total
+    end
+    return best
+end
+
+local function claim(job_id)
+    local job = redis.call('HMGET', job_key(job_id), 'qt', 'q')
+    if job[1] then
+        observe('queuectl_job_queue_wait_seconds', queue_label(job[2]), math.max(0, now - tonumber(job[1])))
+    end
+    transition(job_id, 'processing', now)
+    redis.call('HSET', job_key(job_id), 'w', worker, 'st', now)
+    table.insert(claimed, job_id)
+    table.insert(claimed, redis.call('HGET', job_key(job_id), 'd'))
+end
+
+-- Pops are capped, parked or not, so a backlog on a saturated key is
+-- parked a few jobs per call instead of all at once inside one script
+local taken = {}
+local pops = 0
+while #claimed < count * 2 and pops < count * 2 do
+    local queue, level
+    for _, name in ipairs(queues) do
+        level = next_lane(name)
+        if level then
+            queue = name
+            break
+        end
+    end
+    if not queue then
+        break
+    end
+    local job_id = redis.call('RPOP', lane_key(queue, tostring(level)))
+    pops = pops + 1
+    depth[queue][level] = depth[queue][level] - 1
+    taken[queue] = (taken[queue] or 0) + 1
+    -- Skip ids whose hash has disappeared (e.g. deleted while queued).
+    -- Cacheable jobs whose result is already stored complete right here;
+    -- jobs whose concurrency key is at its limit are parked, not claimed
+    if redis.call('EXISTS', job_key(job_id)) == 1
+            and not complete_from_cache(job_id, now) then
+        local limit = redis.call('HGET', job_key(job_id), 'ky')
+        local admitted, retry_at = true, nil
+        if limit then
+            admitted, retry_at = acquire_limit(limit, job_id, now)
+        end
+        if admitted then
+            redis.call('RPUSH', KEYS[1], job_id)
+            redis.call('SADD', 'queuectl:claimants', worker)
+            claim(job_id)
+        else
+            park(limit, job_id, retry_at)
+        end
+    end
+end
+
+for queue, credit in pairs(credits) do
+    local fields = {}
+    for level = 1, 9 do
+        table.insert(fields, level)
+        table.insert(fields, credit[level])
+    end
+    redis.call('HSET', queue_prefix(queue) .. 'lanes:credit', unpack(fields))
+end
+
+-- Consume the wake-up tokens of the jobs taken
+for queue, n in pairs(taken) do
+    if queue == woken then
+        n = n - 1
+    end
+    if n > 0 then
+        redis.call('LTRIM', queue_prefix(queue) .. 'ready', 0, -n - 1)
+    end
+end
+-- The pop budget ran out before reaching the queue whose token woke us:
+-- its job is still queued, so give the token back
+if woken ~= '' and depth[woken] and not taken[woken] then
+    for level = 1, 9 do
+        if depth[woken][level] > 0 then
+            redis.call('LPUSH', queue_prefix(woken) .. 'ready', 1)
+            break
+        end
+    end
+end
+
+local more = 0
+for _, queue in ipairs(queues) do
+    for level = 1, 9 do
+        if depth[queue][level] > 0 then
+            more = 1
+        end
+    end
+end
+table.insert(claimed, 1, more)
+return claimed
+"""
+
+# KEYS[1] = the worker's claim list, KEYS[2] (optional) = the worker's lease
+# ARGV = worker, job ids... (none: release everything on the claim list)
+# Puts claimed jobs back at the head of their lanes, in the order given, and
+# returns how many were requeued. Only jobs `worker` still holds are
+# requeued; with a lease key, nothing is while the lease is held.
+RELEASE = PRELUDE + """
+local now = server_time()
+local worker = ARGV[1]
+if KEYS[2] and redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+local ids = {}
+for i = 2, #ARGV do
+    ids[#ids + 1] = ARGV[i]
+end
+if #ids == 0 then
+    ids = redis.call('LRANGE', KEYS[1], 0, -1)
+end
+
+local requeued = 0
+for i = #ids, 1, -1 do
+    local job_id = ids[i]
+    local job = redis.call('HMGET', job_key(job_id), 's', 'w')
+    if redis.call('LREM', KEYS[1], 1, job_id) > 0
+            and job[1] == 'processing' and job[2] == worker then
+        redis.call('HDEL', job_key(job_id), 'w')
+        redis.call('HSET', job_key(job_id), 'qt', now)
+        push_pending(job_id, true)
+        transition(job_id, 'pending', now)
+        requeued = requeued + 1
+    end
+end
+unregister_claimant(worker)
+return requeued
+"""
+
+# ARGV = job_id, result, worker ('' to skip the check)
+# A cacheable job that ran (a cache miss) stores its result for later ones.
+# Returns 1, or 0 (and changes nothing) if `worker` no longer holds the job.
+COMPLETE = PRELUDE + """
+local job_id = ARGV[1]
+if ARGV[3] ~= '' and redis.call('HGET', job_key(job_id), 'w') ~= ARGV[3] then
+    return 0
+end
+record_finish(job_id, 'completed')
+complete_job(job_id, ARGV[2], server_time())
+local cache = redis.call('HMGET', job_key(job_id), 'ck', 'cl')
+if cache[1] then
+    redis.call('SET', 'queuectl:cache:' .. cache[1], ARGV[2], 'EX', cache[2])
+    redis.call('HINCRBY', 'queuectl:stats', 'cache_misses', 1)
+end
+return 1
+"""
+
+# ARGV = job_id, reason, worker ('' to skip the check)
+# Schedules the retry on the retry set of the job's queue.
+# Returns {'retry', attempts, delay} or {'dead', attempts}, or {'lost'}
+# (changing nothing) if `worker` no longer holds the job.
+FAIL = PRELUDE + """
+local job_id = ARGV[1]
+local reason = ARGV[2]
+local now = server_time()
+local key = job_key(job_id)
+if ARGV[3] ~= '' and redis.call('HGET', key, 'w') ~= ARGV[3] then
+    return {'lost'}
+end
+local retry = queue_prefix(redis.call('HGET', key, 'q')) .. 'retry'
+
+local attempts = redis.call('HINCRBY', key, 'a', 1)
+redis.call('HINCRBY', 'queuectl:stats', 'failed_total', 1)
+-- Settings the job does not override come from the global config
+local params = redis.call('HMGET', key, 'mr', 'bb', 'bf')
+local config = redis.call('HMGET', 'queuectl:config', 'max_retries', 'backoff_base', 'backoff_factor')
+local max_retries = tonumber(params[1] or config[1]) or 3
+
+if attempts > max_retries then
+    record_finish(job_id, 'dead')
+    move_to_dlq(job_id, reason, now)
+    return {'dead', attempts}
+end
+
+-- Exponential backoff
+record_finish(job_id, 'failed')
+release_claim(job_id)
+local delay = (tonumber(params[2] or config[2]) or 2) * (tonumber(params[3] or config[3]) or 2) ^ (attempts - 1)
+local retry_time = now + delay
+redis.call('ZADD', retry, retry_time, job_id)
+-- Wake the retry scheduler early if this is now the first retry due
+if redis.call('ZRANGE', retry, 0, 0)[1] == job_id then
+    redis.call('PUBLISH', 'queuectl:control', 'retry')
+end
+transition(job_id, 'failed', now)
+redis.call('HSET', key, 'le', reason, 'nr', string.format('%d', retry_time))
+return {'retry', attempts, tostring(delay)}
+"""
+
+# ARGV = job_id, reason
+DLQ = PRELUDE + """
+move_to_dlq(ARGV[1], ARGV[2], server_time())
+return 1
+"""
+
+# KEYS[1] = a queue's retry or scheduled sorted set
+# ARGV = limit
+# Promotes up to `limit` due jobs and returns {promoted ids, next due score}
+# (the score is '' when nothing else is waiting).
+PROMOTE = PRELUDE + """
+local now = server_time()
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, tonumber(ARGV[1]))
+for _, job_id in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job_id)
+    redis.call('HSET', job_key(job_id), 'qt', now)
+    push_pending(job_id)
+    transition(job_id, 'pending', now)
+end
+local head = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {due, head[2] or ''}
+"""
+
+# ARGV = job_id
+# Deletes a job still waiting in the scheduled state; jobs waiting on it are
+# moved to the DLQ. Returns 1, or 0 if the job is not (or no longer)
+# scheduled.
+CANCEL_SCHEDULED = PRELUDE + """
+local job_id = ARGV[1]
+local job = redis.call('HMGET', job_key(job_id), 's', 'q')
+if job[1] ~= 'scheduled' then
+    return 0
+end
+redis.call('ZREM', queue_prefix(job[2]) .. 'scheduled', job_id)
+if redis.call('ZREM', 'queuectl:state:scheduled', job_id) == 1 then
+    redis.call('HINCRBY', 'queuectl:stats', 'scheduled', -1)
+end
+redis.call('DEL', job_key(job_id))
+for _, child in ipairs(take_dependents(job_id)) do
+    move_to_dlq(child, 'dependency ' .. job_id .. ' was cancelled', server_time())
+end
+return 1
+"""
+
+# Returns the parked jobs of rate-limited keys whose next token is due to
+# their lanes. Returns when the next such key is due, or nil.
+UNPARK = PRELUDE + """
+local now = server_time()
+for _, key in ipairs(redis.call('ZRANGEBYSCORE', 'queuectl:limits:parked', '-inf', now)) do
+    unpark(key, now)
+end
+local head = redis.call('ZRANGE', 'queuectl:limits:parked', 0, 0, 'WITHSCORES')
+if head[2] and head[2] ~= 'inf' then
+    return head[2]
+end
+return nil
+"""
+
+# KEYS[1] = lease key
+# ARGV = owner, ttl_ms
+# Extends the lease only if `owner` still holds it. Returns 1 or 0.
+RENEW_LEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS[1] = lease key
+# ARGV = owner
+# Gives the lease up only if `owner` still holds it.
+RELEASE_LEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# ARGV = job_id
+# Returns the job's status before the call (false if it does not exist).
+RETRY_DEAD = PRELUDE + """
+local job_id = ARGV[1]
+local job = redis.call('HMGET', job_key(job_id), 's', 'q')
+local status = job[1]
+if status ~= 'dead' then
+    return status
+end
+local now = server_time()
+
+redis.call('LREM', queue_prefix(job[2]) .. 'dead_letter', 0, job_id)
+redis.call('ZREM', 'queuectl:finished:dead', job_id)
+redis.call('HDEL', job_key(job_id), 'x', 'ft', 'a', 'le', 'nr')
+-- A dependent goes back to waiting on whichever parents have not completed
+-- (including dead ones, which may be retried in turn)
+local parents = {}
+for parent in string.gmatch(redis.call('HGET', job_key(job_id), 'pa') or '', '[^,]+') do
+    table.insert(parents, parent)
+end
+local unmet = wait_for_parents(job_id, parents)
+if unmet > 0 then
+    redis.call('HSET', job_key(job_id), 'dp', unmet)
+    transition(job_id, 'waiting', now)
+    return status
+end
+redis.call('HSET', job_key(job_id), 'qt', now)
+transition(job_id, 'pending', now)
+push_pending(job_id)
+return status
+"""
+
+# KEYS[1] = the state's finished-time index
+# ARGV = state, job ids...
+# Deletes the given jobs that are still in `state` (a dead job may have been
+# retried meanwhile) and returns the ids deleted.
+EXPIRE = PRELUDE + """
+local state = ARGV[1]
+local deleted = {}
+for i = 2, #ARGV do
+    local job_id = ARGV[i]
+    redis.call('ZREM', KEYS[1], job_id)
+    local job = redis.call('HMGET', job_key(job_id), 's', 'q')
+    if job[1] == state then
+        redis.call('DEL', job_key(job_id), 'queuectl:deps:' .. job_id)
+        if redis.call('ZREM', 'queuectl:state:' .. state, job_id) == 1 then
+            redis.call('HINCRBY', 'queuectl:stats', state, -1)
+        end
+        if state == 'dead' then
+            redis.call('LREM', queue_prefix(job[2]) .. 'dead_letter', 1, job_id)
+        end
+        table.insert(deleted, job_id)
+    end
+end
+return deleted
+"""
+
+# ARGV = job_id, status, field, value, ...
+# Rewrites a job hash in the compact format, provided it is still in the
+# given (old-format) status so no concurrent transition is lost. Returns 1
+# if rewritten, 0 if the job changed or is gone.
+MIGRATE = """
+local key = 'queuectl:jobs:' .. ARGV[1]
+if redis.call('HGET', key, 'status') ~= ARGV[2] then
+    return 0
+end
+redis.call('DEL', key)
+redis.call('HSET', key, unpack(ARGV, 3))
+return 1
+"""
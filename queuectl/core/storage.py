@@ -1,176 +1,1103 @@
 # core/storage.py
-import redis
+import hashlib
+import heapq
 import json
+import os
+import socket
 import uuid
-import time
+
+from queuectl.core import connection, metrics, profiling, scripts
+from queuectl.core.schedules import CronSchedule, parse_duration
+from queuectl.core.records import (
+    FIELDS,
+    decode_job,
+    decode_payload,
+    encode_job,
+    encode_payload,
+    parse_timestamp,
+)
+
+# Every job lives in exactly one of these states. Each state has its own
+# sorted set index (queuectl:state:<state>) scored by the job's enqueue time,
+# so listing a state never has to scan the whole keyspace.
+JOB_STATES = ("scheduled", "waiting", "pending", "processing", "failed", "completed", "dead")
+
+
+def state_key(state):
+    return f"queuectl:state:{state}"
+
+
+# Counters kept alongside the indexes: one field per state plus lifetime
+# totals, all updated by the same script as the transition itself.
+STATS_KEY = "queuectl:stats"
+LIFETIME_TOTALS = ("enqueued_total", "completed_total", "failed_total", "dead_total")
+CACHE_COUNTERS = ("cache_hits", "cache_misses")
+
+# Finished jobs are also indexed by when they finished
+# (queuectl:finished:<state>), which is what retention expires them by.
+FINISHED_STATES = ("completed", "dead")
+
+
+def finished_key(state):
+    return f"queuectl:finished:{state}"
+
+
+# Retention settings in queuectl:config; 0 or unset keeps jobs forever.
+RETENTION_TTLS = {"completed": "completed_ttl", "dead": "dead_ttl"}
+MAX_RETAINED = "max_retained"
+ARCHIVE = "archive"
+
+
+# Jobs belong to a named queue; each queue has its own lanes, wake-up list,
+# retry set and DLQ under queuectl:queue:<name>:, except the default queue,
+# which keeps the original top-level keys. Named queues are registered in
+# QUEUES_KEY when their first job is enqueued.
+DEFAULT_QUEUE = "default"
+QUEUES_KEY = "queuectl:queues"
+QUEUE_NAME_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.-")
+
+
+def queue_prefix(queue=DEFAULT_QUEUE):
+    if queue == DEFAULT_QUEUE:
+        return "queuectl:"
+    return f"queuectl:queue:{queue}:"
+
+
+def parse_queue_name(value):
+    name = value.strip()
+    if not name or not set(name) <= QUEUE_NAME_CHARS:
+        raise ValueError(f"Invalid queue name {value!r} (use letters, digits, '_', '.' and '-')")
+    return name
+
+
+def ready_key(queue=DEFAULT_QUEUE):
+    return queue_prefix(queue) + "ready"
+
+
+def retry_key(queue=DEFAULT_QUEUE):
+    return queue_prefix(queue) + "retry"
+
+
+def dead_letter_key(queue=DEFAULT_QUEUE):
+    return queue_prefix(queue) + "dead_letter"
+
+
+# A job enqueued after others waits until they complete: each parent lists
+# its waiting dependents in deps_key(parent), and a workflow maps its job
+# names to job ids in workflow_key(id).
+def deps_key(job_id):
+    return f"queuectl:deps:{job_id}"
+
+
+def workflow_key(workflow_id):
+    return f"queuectl:workflow:{workflow_id}"
+
+
+# An idempotency key maps to the job enqueued with it for this long; enqueues
+# reusing it meanwhile return that job instead of adding another.
+IDEMPOTENCY_TTL = 24 * 3600
+
+
+def cache_digest(data):
+    """Result cache key for job data: a hash of its canonical JSON."""
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def scheduled_key(queue=DEFAULT_QUEUE):
+    """Jobs enqueued with a run time, scored by it (alongside the retry set)."""
+    return queue_prefix(queue) + "scheduled"
+
+
+# Recurring schedules: their definitions (id -> JSON with the cron
+# expression and the job to enqueue) and when each next fires.
+SCHEDULES_KEY = "queuectl:schedules"
+SCHEDULES_DUE_KEY = "queuectl:schedules:due"
+
+
+# Pending jobs wait on one lane (list) per priority level, 9 most urgent;
+# normal jobs on the default queue use the original queue list. See
+# scripts.DEQUEUE for how the lanes are shared out. Every push onto a lane
+# also leaves a token on the queue's wake-up list, so a worker waits for work
+# on all lanes of all its queues with one blocking call.
+PRIORITY_LEVELS = range(9, 0, -1)
+PRIORITY_NAMES = {"high": 9, "normal": 5, "low": 1}
+DEFAULT_PRIORITY = PRIORITY_NAMES["normal"]
+
+# Priority settings in queuectl:config.
+PRIORITY_MODE = "priority_mode"
+PRIORITY_WEIGHTS = "priority_weights"
+PRIORITY_MODES = ("weighted", "strict")
+
+
+def lane_key(priority, queue=DEFAULT_QUEUE):
+    if queue == DEFAULT_QUEUE and int(priority) == DEFAULT_PRIORITY:
+        return "queuectl:jobs"
+    return f"{queue_prefix(queue)}lane:{int(priority)}"
+
+
+def parse_priority(value):
+    """A priority level from a name (high, normal, low) or a number 1-9."""
+    value = str(value).strip().lower()
+    if value in PRIORITY_NAMES:
+        return PRIORITY_NAMES[value]
+    if value.isdigit() and int(value) in PRIORITY_LEVELS:
+        return int(value)
+    raise ValueError(f"Invalid priority {value!r} (use high, normal, low or 1-9)")
+
+
+def parse_weights(value):
+    """
+    Normalize "LEVEL=WEIGHT,..." (levels as names or numbers, weights >= 1)
+    to the "9=8,5=4" form the dequeue script reads.
+    """
+    weights = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        level, sep, weight = item.partition("=")
+        if not sep or not weight.strip().isdigit() or int(weight) < 1:
+            raise ValueError(f"Invalid weight {item!r} (use LEVEL=WEIGHT with WEIGHT >= 1)")
+        weights[parse_priority(level)] = int(weight)
+    return ",".join(f"{level}={weight}" for level, weight in sorted(weights.items(), reverse=True))
+
+
+# Limits shared by all jobs enqueued with the same concurrency key, in every
+# worker process and host: at most `concurrency` of them processing, and at
+# most `rate` starts per `period` seconds. Configured keys are registered in
+# LIMITS_KEY. See scripts.PRELUDE for how jobs over a limit are parked.
+LIMITS_KEY = "queuectl:limits"
+PARKED_KEY = "queuectl:limits:parked"
+
+
+def limit_key(key):
+    return f"queuectl:limit:{key}"
+
+
+def parse_limit_name(value):
+    name = value.strip()
+    if not name or not set(name) <= QUEUE_NAME_CHARS:
+        raise ValueError(f"Invalid concurrency key {value!r} (use letters, digits, '_', '.' and '-')")
+    return name
+
+
+def parse_rate(value):
+    """(count, period seconds) from a rate like "100/s", "5/m" or "20/10s"; "0" clears it."""
+    text = value.strip().lower()
+    if text == "0":
+        return 0, 1.0
+    count, sep, per = text.partition("/")
+    if not sep or not count.isdigit() or int(count) < 1:
+        raise ValueError(f"Invalid rate {value!r} (e.g. 100/s, 5/m, 20/10s)")
+    period = parse_duration(per if per[:1].isdigit() else "1" + per)
+    if period <= 0:
+        raise ValueError(f"Invalid rate {value!r}: the period must be positive")
+    return int(count), period
+
+
+def claimed_key(worker_name):
+    """Jobs a worker has dequeued but not yet finished, kept for recovery."""
+    return f"queuectl:claimed:{worker_name}"
+
+
+# Workers claim under an owner id unique across hosts and processes, and
+# hold worker_lease_key(owner) for as long as they run, renewing it every
+# WORKER_LEASE_TTL / 3. Jobs left on the claim list of an owner whose lease
+# has lapsed belonged to a worker that died; reclaim_abandoned() requeues them.
+# Owners with a non-empty claim list are registered in CLAIMANTS_KEY, so
+# finding them never scans the keyspace.
+WORKER_LEASE_TTL = 30
+CLAIMANTS_KEY = "queuectl:claimants"
+
+# Set to RECORD_FORMAT once no job can be in the pre-compact format: by the
+# first enqueue into a store no older version has written to, or by a
+# migration that converted everything. Workers only start once it is set.
+FORMAT_KEY = "queuectl:format"
+RECORD_FORMAT = "compact"
+
+
+def worker_owner(worker_name):
+    """The owner id `worker_name` claims jobs under in this process: host:pid:name."""
+    return f"{socket.gethostname()}:{os.getpid()}:{worker_name}"
+
+
+def worker_lease_key(owner):
+    return f"queuectl:lease:{owner}"
+
+
+# Maximum number of due retries or scheduled jobs promoted, recurring
+# schedules fired, or finished jobs expired, per batch.
+RETRY_BATCH_SIZE = 500
+SCHEDULE_BATCH_SIZE = 500
+EXPIRE_BATCH_SIZE = 500
+
+# Index entries read, and job hashes fetched, per round trip when iterating.
+SCAN_BATCH_SIZE = 500
+
+
+def encode_cursor(score, job_id):
+    """Resume point after a job: its enqueue-time score plus its id for ties."""
+    return f"{score!r}:{job_id}"
+
+
+def decode_cursor(cursor):
+    score, _, job_id = cursor.partition(":")
+    try:
+        return float(score), job_id
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from None
+
+
+# -----------------------------
+# Script Arguments
+# -----------------------------
+# Shared by RedisStorage and AsyncRedisStorage so both engines drive the
+# exact same transitions.
+def claim_args(worker_name, count, queues=(DEFAULT_QUEUE,), woken=""):
+    return [count, worker_name, woken, *queues]
+
+
+def woken_queue(reply, queues):
+    """The queue whose wake-up list a BRPOP `reply` came from ('' on timeout)."""
+    if not reply:
+        return ""
+    return next(queue for queue in queues if ready_key(queue) == reply[0])
+
+
+def parse_claimed(reply):
+    """
+    Turn the dequeue script's flat {more, id, data, ...} reply into its
+    `more` flag and a list of (id, data) pairs.
+    """
+    return bool(reply[0]), [(reply[i], decode_payload(reply[i + 1])) for i in range(1, len(reply), 2)]
+
+
+def complete_args(job_id, result, worker_name=None):
+    return [job_id, encode_payload(result), worker_name or ""]
+
+
+def fail_args(job_id, reason, worker_name=None):
+    return [job_id, reason, worker_name or ""]
+
+
+def report_lost(job_id):
+    print(f"⚠️ Job {job_id} is no longer held by this worker (it was requeued); outcome discarded")
+
+
+def report_failure(job_id, reason, outcome):
+    if outcome[0] == "lost":
+        report_lost(job_id)
+        return
+    if outcome[0] == "dead":
+        print(f"💀 Job {job_id} moved to DLQ: {reason}")
+        return
+
+    attempts, delay = outcome[1], float(outcome[2])
+    print(f"⏳ Job {job_id} failed (attempt {attempts}), retrying in {delay:.1f}s")
+
 
 class RedisStorage:
-    def __init__(self, host="localhost", port=6379, db=0):
-        self.r = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+    def __init__(self, host=None, port=None, db=None, client=None):
+        """
+        With no arguments, use the process-wide pooled client from
+        core.connection. It is looked up on each access, so settings applied
+        after construction (e.g. --redis-url) still take effect. Pass
+        host/port/db or a client to pin this storage to one server.
+        """
+        if client is None and (host or port or db is not None):
+            import redis
+
+            client = redis.Redis(
+                host=host or "localhost", port=port or 6379, db=db or 0, decode_responses=True
+            )
+        self._client = client
+        self._scripts = {}
+        self._scripts_client = None
+
+    @property
+    def r(self):
+        return self._client if self._client is not None else connection.get_redis()
+
+    def server_time(self):
+        """
+        The Redis server's clock, as epoch seconds. The scripts stamp and
+        compare every time against it, so code comparing with the times
+        they store (due times, finished times) must use it too.
+        """
+        seconds, microseconds = self.r.time()
+        return seconds + microseconds / 1_000_000
+
+    def _script(self, name):
+        """
+        Return script `name` from core.scripts registered on the current
+        client; redis-py calls EVALSHA and reloads it on NOSCRIPT.
+        """
+        client = self.r
+        if client is not self._scripts_client:
+            self._scripts = {}
+            self._scripts_client = client
+        script = self._scripts.get(name)
+        if script is None:
+            script = self._scripts[name] = client.register_script(getattr(scripts, name))
+        # Time it while this process records metrics (see metrics.enable)
+        if metrics.recorder is not None:
+            return metrics.recorder.timed(name.lower(), script)
+        return script
 
     # -----------------------------
     # Job Enqueue
     # -----------------------------
-    def enqueue_job(self, data, max_retries=None, backoff_base=None, backoff_factor=None):
-    # Load global config if not passed explicitly
-        config = self.r.hgetall("queuectl:config")
+    def _enqueue_args(self, data, max_retries, backoff_base, backoff_factor, priority, queue,
+                      run_at=None, schedule_id="", parents=(), workflow_id="", job_id=None,
+                      idempotency_key=None, cache_ttl=None, concurrency_key=None):
+        job_id = job_id or str(uuid.uuid4())
+        priority = parse_priority(priority) if priority is not None else DEFAULT_PRIORITY
+        queue = parse_queue_name(queue) if queue is not None else DEFAULT_QUEUE
+        return job_id, [
+            job_id,
+            encode_payload(data),
+            max_retries or "",
+            backoff_base or "",
+            backoff_factor or "",
+            priority if priority != DEFAULT_PRIORITY else "",
+            queue if queue != DEFAULT_QUEUE else "",
+            run_at if run_at is not None else "",
+            schedule_id,
+            workflow_id,
+            idempotency_key or "",
+            IDEMPOTENCY_TTL if idempotency_key else "",
+            cache_digest(data) if cache_ttl else "",
+            max(1, round(cache_ttl)) if cache_ttl else "",
+            parse_limit_name(concurrency_key) if concurrency_key else "",
+            *parents,
+        ]
 
-        max_retries = max_retries or int(config.get("max_retries", 3))
-        backoff_base = backoff_base or int(config.get("backoff_base", 2))
-        backoff_factor = backoff_factor or int(config.get("backoff_factor", 2))
+    def _check_parents(self, parents):
+        """Deduplicated parent ids; raises ValueError naming any that do not exist."""
+        parents = list(dict.fromkeys(parents or ()))
+        if parents:
+            pipe = self.r.pipeline(transaction=False)
+            for parent in parents:
+                pipe.exists(f"queuectl:jobs:{parent}")
+            missing = [parent for parent, found in zip(parents, pipe.execute()) if not found]
+            if missing:
+                raise ValueError(f"Unknown job(s): {', '.join(missing)}")
+        return parents
 
-        job_id = str(uuid.uuid4())
-        job_key = f"queuectl:jobs:{job_id}"
+    def enqueue_job(self, data, max_retries=None, backoff_base=None, backoff_factor=None,
+                    priority=None, queue=None, run_at=None, after=None, idempotency_key=None,
+                    cache_ttl=None, job_id=None, concurrency_key=None):
+        """
+        Enqueue one job. With `run_at` (epoch seconds) in the future it is
+        held in the scheduled state until then; with `after` (job ids) it
+        waits until all of those jobs have completed.
 
-        self.r.hset(job_key, mapping={
-            "date_added": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
-            "status": "pending",
-            "attempts": 0,
-            "max_retries": max_retries,
-            "backoff_base": backoff_base,
-            "backoff_factor": backoff_factor,
-            "data": json.dumps(data)
-        })
+        An `idempotency_key` already used by an existing job (within
+        IDEMPOTENCY_TTL) makes this a no-op that returns that job's id rather
+        than `job_id` (default: a new uuid). With `cache_ttl` (seconds) the
+        result is kept that long, and jobs with the same data complete with
+        it instead of running. Jobs sharing a `concurrency_key` are held to
+        its limits (see set_limit).
+        """
+        # Unset retry/backoff values are resolved from queuectl:config server-side
+        _, args = self._enqueue_args(
+            data, max_retries, backoff_base, backoff_factor, priority, queue, run_at,
+            parents=self._check_parents(after), job_id=job_id,
+            idempotency_key=idempotency_key, cache_ttl=cache_ttl, concurrency_key=concurrency_key,
+        )
+        return self._script("ENQUEUE")(args=args)
 
-        self.r.lpush("queuectl:jobs", job_id)
-        return job_id
+    def enqueue_many(self, jobs, batch_size=1000, max_retries=None,
+                     backoff_base=None, backoff_factor=None, priority=None, queue=None,
+                     run_at=None, after=None, cache_ttl=None, concurrency_key=None):
+        """
+        Enqueue every job data dict from the `jobs` iterable, consuming it
+        lazily and sending the enqueue script in pipelined batches of
+        `batch_size`. Returns the number of jobs enqueued.
+        """
+        count = 0
+        parents = self._check_parents(after)
+        enqueue = self._script("ENQUEUE")
+        pipe = self.r.pipeline(transaction=False)
+        for data in jobs:
+            _, args = self._enqueue_args(
+                data, max_retries, backoff_base, backoff_factor, priority, queue, run_at,
+                parents=parents, cache_ttl=cache_ttl, concurrency_key=concurrency_key,
+            )
+            enqueue(args=args, client=pipe)
+            count += 1
+            if count % batch_size == 0:
+                pipe.execute()
+        if count % batch_size:
+            pipe.execute()
+        return count
 
 
     # -----------------------------
     # Job Fetch / Complete / Fail
     # -----------------------------
-    def get_next_job(self):
-        """Fetch next available job (FIFO)."""
-        item = self.r.brpop("queuectl:jobs")
-        if item is None:
+    def get_next_job(self, owner, timeout=0, queues=(DEFAULT_QUEUE,)):
+        """
+        Fetch the next job for `owner` (see worker_owner(), whose lease the
+        caller must hold): FIFO within a priority lane, lanes shared out by
+        DEQUEUE.
+        """
+        jobs = self.claim_jobs(owner, 1, timeout=timeout, queues=queues)
+        if not jobs:
             return None, None
-        _, job_id = item
-        job_key = f"queuectl:jobs:{job_id}"
+        return jobs[0]
 
-        self.r.hset(job_key, "status", "processing")
-        data = json.loads(self.r.hget(job_key, "data"))
-        return job_id, data
+    def claim_jobs(self, worker_name, count=1, timeout=0, queues=(DEFAULT_QUEUE,)):
+        """
+        Atomically claim up to `count` pending jobs for `worker_name` from
+        `queues`, preferring them in the order given.
 
-    def mark_completed(self, job_id, result):
-        job_key = f"queuectl:jobs:{job_id}"
-        self.r.hset(job_key, mapping={
-            "status": "completed",
-            "result": json.dumps(result),
-            "completed_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        })
+        Claimed jobs are marked processing and recorded on the worker's claim
+        list until they complete or fail, so release_jobs() can hand them
+        back if the worker dies or stops. When every lane is empty, waits up
+        to `timeout` seconds (0 = forever, None = don't wait) on the queues'
+        wake-up lists with one BRPOP, which returns as soon as a job is
+        queued on any of them, and then claims.
 
-    # -----------------------------
-    # Retry Handling
-    # -----------------------------
-    def mark_failed(self, job_id, reason):
-        """Handle failed jobs: either retry or move to DLQ."""
-        job_key = f"queuectl:jobs:{job_id}"
-        attempts = int(self.r.hincrby(job_key, "attempts", 1))
-        max_retries = int(self.r.hget(job_key, "max_retries"))
-        base = int(self.r.hget(job_key, "backoff_base"))
-        factor = int(self.r.hget(job_key, "backoff_factor"))
+        Returns a list of (job_id, data) tuples.
+        """
+        jobs = self._claim(worker_name, count, queues)
+        if not jobs and timeout is not None:
+            with profiling.phase("idle"):
+                woken = woken_queue(self.r.brpop([ready_key(q) for q in queues], timeout=timeout), queues)
+            if woken:
+                jobs = self._claim(worker_name, count, queues, woken)
+        return jobs
+
+    def _claim(self, worker_name, count, queues, woken=""):
+        """
+        Run DEQUEUE until it claims something or has nothing left to pop. A
+        call that only parked jobs (its pop budget spent on a saturated
+        concurrency key) is repeated at once: the jobs behind them may have
+        had their wake-up tokens taken already.
+        """
+        keys = [claimed_key(worker_name)]
+        while True:
+            with profiling.phase("dequeue"):
+                reply = self._script("DEQUEUE")(keys=keys, args=claim_args(worker_name, count, queues, woken))
+            with profiling.phase("decode"):
+                more, jobs = parse_claimed(reply)
+            if jobs or not more:
+                return jobs
+            woken = ""
+
+    def release_jobs(self, worker_name, job_ids=None):
+        """
+        Return claimed-but-unfinished jobs to the head of their lanes. With no
+        `job_ids`, releases everything on the worker's claim list. Jobs the
+        worker no longer holds are left alone. Returns the number requeued.
+        """
+        return self._script("RELEASE")(
+            keys=[claimed_key(worker_name)],
+            args=[worker_name, *(job_ids or [])],
+        )
 
-        if attempts > max_retries:
-            self.move_to_dlq(job_id, reason)
-            return
+    def hold_worker_lease(self, owner):
+        """Take or extend `owner`'s worker lease for another WORKER_LEASE_TTL seconds."""
+        self.r.set(worker_lease_key(owner), 1, px=int(WORKER_LEASE_TTL * 1000))
 
-        # Calculate exponential backoff delay
-        delay = base * (factor ** (attempts - 1))
-        retry_time = time.time() + delay
+    def drop_worker_lease(self, owner):
+        self.r.delete(worker_lease_key(owner))
 
-        # Move to retry queue (sorted set with timestamp)
-        self.r.zadd("queuectl:retry", {job_id: retry_time})
-        self.r.hset(job_key, mapping={
-            "status": "failed",
-            "last_error": reason,
-            "next_retry_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(retry_time))
-        })
-        print(f"⏳ Job {job_id} failed (attempt {attempts}), retrying in {delay:.1f}s")
+    def reclaim_abandoned(self):
+        """
+        Requeue the jobs on every claim list whose owner's lease has lapsed,
+        i.e. whose worker died mid-job. Returns the number of jobs requeued.
+        """
+        release = self._script("RELEASE")
+        requeued = 0
+        for owner in self.r.sscan_iter(CLAIMANTS_KEY, count=1000):
+            requeued += release(
+                keys=[claimed_key(owner), worker_lease_key(owner)], args=[owner]
+            )
+        return requeued
+
+    def mark_completed(self, job_id, result, worker_name=None):
+        """
+        Complete a job with `result`. Given the worker that claimed it, does
+        nothing and returns False if that worker no longer holds the job.
+        """
+        return bool(self._script("COMPLETE")(args=complete_args(job_id, result, worker_name)))
+
+    # -----------------------------
+    # Retry Handling
+    # -----------------------------
+    def mark_failed(self, job_id, reason, worker_name=None):
+        """Handle failed jobs: either retry with exponential backoff or move to DLQ."""
+        outcome = self._script("FAIL")(args=fail_args(job_id, reason, worker_name))
+        report_failure(job_id, reason, outcome)
 
     # -----------------------------
     # DLQ
     # -----------------------------
     def move_to_dlq(self, job_id, reason):
-        job_key = f"queuectl:jobs:{job_id}"
-        self.r.hset(job_key, mapping={
-            "status": "dead",
-            "reason": reason,
-            "failed_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        })
-        self.r.lpush("queuectl:dead_letter", job_id)
+        self._script("DLQ")(args=[job_id, reason])
         print(f"💀 Job {job_id} moved to DLQ: {reason}")
 
+    def retry_dead_job(self, job_id):
+        """Requeue a DLQ job. Returns its previous status (None if unknown)."""
+        return self._script("RETRY_DEAD")(args=[job_id])
+
     # -----------------------------
     # Retry Processor
     # -----------------------------
     def process_retry_queue(self):
-        """Move ready-to-retry jobs back to main queue."""
-        now = time.time()
-        ready_jobs = self.r.zrangebyscore("queuectl:retry", 0, now)
+        """
+        Move ready-to-retry and due scheduled jobs to their queues, in
+        atomic batches. Returns the time the next one falls due, or None if
+        none are waiting.
+        """
+        next_due = None
+        for queue in self.known_queues():
+            for key, message in ((retry_key(queue), "♻️ Job {} requeued from retry queue"),
+                                 (scheduled_key(queue), "⏰ Job {} is due and queued")):
+                while True:
+                    promoted, due = self._script("PROMOTE")(keys=[key], args=[RETRY_BATCH_SIZE])
+                    for job_id in promoted:
+                        print(message.format(job_id))
+                    if len(promoted) < RETRY_BATCH_SIZE:
+                        break
+                if due:
+                    next_due = min(next_due or float(due), float(due))
+        return next_due
+
+    def known_queues(self):
+        """The default queue followed by every named queue jobs were enqueued to."""
+        return [DEFAULT_QUEUE, *sorted(self.r.smembers(QUEUES_KEY))]
+
+    # -----------------------------
+    # Scheduled & Recurring Jobs
+    # -----------------------------
+    def list_scheduled_jobs(self, queue=None):
+        """Jobs waiting for their run time (of one queue, or all), soonest first."""
+        queues = [queue] if queue else self.known_queues()
+        pipe = self.r.pipeline(transaction=False)
+        for name in queues:
+            pipe.zrange(scheduled_key(name), 0, -1, withscores=True)
+        entries = heapq.merge(*pipe.execute(), key=lambda entry: entry[1])
+        return self.get_jobs([job_id for job_id, _ in entries])
 
-        for job_id in ready_jobs:
-            # Remove from retry set
-            self.r.zrem("queuectl:retry", job_id)
-            # Push back to active queue
-            self.r.lpush("queuectl:jobs", job_id)
-            self.r.hset(f"queuectl:jobs:{job_id}", "status", "pending")
-            print(f"♻️ Job {job_id} requeued from retry queue")
+    def cancel_scheduled_job(self, job_id):
+        """Delete a job that has not reached its run time. Returns whether it was."""
+        return bool(self._script("CANCEL_SCHEDULED")(args=[job_id]))
+
+    def add_schedule(self, cron, data, priority=None, queue=None):
+        """
+        Register a recurring schedule that enqueues `data` each time the
+        `cron` expression matches. Returns (schedule id, first run time).
+        """
+        next_run = CronSchedule(cron).next_after(self.server_time())
+        if priority is not None:
+            priority = parse_priority(priority)
+        if queue is not None:
+            queue = parse_queue_name(queue)
+        schedule_id = str(uuid.uuid4())
+        definition = {"cron": cron, "data": data, "priority": priority, "queue": queue}
+        pipe = self.r.pipeline()
+        pipe.hset(SCHEDULES_KEY, schedule_id, json.dumps(definition))
+        pipe.zadd(SCHEDULES_DUE_KEY, {schedule_id: next_run})
+        # Let the scheduler recompute how long it may sleep
+        pipe.publish("queuectl:control", "retry")
+        pipe.execute()
+        return schedule_id, next_run
+
+    def remove_schedule(self, schedule_id):
+        """Stop a recurring schedule. Returns whether it existed."""
+        pipe = self.r.pipeline()
+        pipe.hdel(SCHEDULES_KEY, schedule_id)
+        pipe.zrem(SCHEDULES_DUE_KEY, schedule_id)
+        return bool(pipe.execute()[0])
+
+    def list_schedules(self):
+        """Recurring schedules, next to fire first, each with its id and next_run."""
+        due = self.r.zrange(SCHEDULES_DUE_KEY, 0, -1, withscores=True)
+        definitions = self.r.hmget(SCHEDULES_KEY, [schedule_id for schedule_id, _ in due]) if due else []
+        schedules = []
+        for (schedule_id, next_run), definition in zip(due, definitions):
+            if definition:
+                schedule = json.loads(definition)
+                schedule.update(id=schedule_id, next_run=next_run)
+                schedules.append(schedule)
+        return schedules
+
+    def fire_schedules(self, batch_size=SCHEDULE_BATCH_SIZE):
+        """
+        Enqueue a job for every recurring schedule that is due and move each
+        to its next run time. Runs missed while no scheduler was up are
+        coalesced into one. Returns when the next schedule fires, or None.
+        """
+        enqueue = self._script("ENQUEUE")
+        while True:
+            now = self.server_time()
+            due = self.r.zrangebyscore(SCHEDULES_DUE_KEY, "-inf", now, start=0, num=batch_size)
+            if not due:
+                break
+            pipe = self.r.pipeline(transaction=False)
+            for schedule_id, definition in zip(due, self.r.hmget(SCHEDULES_KEY, due)):
+                if definition is None:
+                    pipe.zrem(SCHEDULES_DUE_KEY, schedule_id)
+                    continue
+                schedule = json.loads(definition)
+                job_id, args = self._enqueue_args(
+                    schedule["data"], None, None, None, schedule["priority"], schedule["queue"],
+                    schedule_id=schedule_id,
+                )
+                enqueue(args=args, client=pipe)
+                # xx: a schedule removed meanwhile is not brought back
+                next_run = CronSchedule(schedule["cron"]).next_after(now)
+                pipe.zadd(SCHEDULES_DUE_KEY, {schedule_id: next_run}, xx=True)
+                print(f"⏰ Schedule {schedule_id} enqueued job {job_id}")
+            pipe.execute()
+            if len(due) < batch_size:
+                break
+        head = self.r.zrange(SCHEDULES_DUE_KEY, 0, 0, withscores=True)
+        return head[0][1] if head else None
+
+    # -----------------------------
+    # Limits
+    # -----------------------------
+    def set_limit(self, key, concurrency=None, rate=None):
+        """
+        Configure a concurrency key. `concurrency` caps how many of its jobs
+        run at once and `rate` ((count, period seconds), see parse_rate)
+        how many start per period; 0 removes that limit, None leaves it.
+        """
+        key = parse_limit_name(key)
+        pipe = self.r.pipeline()
+        pipe.sadd(LIMITS_KEY, key)
+        if concurrency == 0:
+            pipe.hdel(limit_key(key), "concurrency")
+        elif concurrency is not None:
+            pipe.hset(limit_key(key), "concurrency", concurrency)
+        if rate is not None and rate[0] == 0:
+            pipe.hdel(limit_key(key), "rate", "period", "tokens", "ts")
+        elif rate is not None:
+            pipe.hset(limit_key(key), mapping={"rate": rate[0], "period": rate[1]})
+        # Parked jobs may fit under the new limits
+        pipe.zadd(PARKED_KEY, {key: 0}, xx=True)
+        pipe.execute()
+        self.unpark_due()
+
+    def unpark_due(self):
+        """
+        Requeue parked jobs of keys that can take more now. Returns when the
+        next rate-limited key gets a token, or None.
+        """
+        due = self._script("UNPARK")()
+        return float(due) if due is not None else None
+
+    def get_limits(self):
+        """Each configured concurrency key with its limits, running and parked counts."""
+        keys = sorted(self.r.smembers(LIMITS_KEY))
+        pipe = self.r.pipeline(transaction=False)
+        for key in keys:
+            pipe.hmget(limit_key(key), "concurrency", "rate", "period")
+            pipe.zcard(f"{limit_key(key)}:holders")
+            pipe.llen(f"{limit_key(key)}:parked")
+        replies = pipe.execute()
+        limits = []
+        for i, key in enumerate(keys):
+            (concurrency, rate, period), running, parked = replies[i * 3:i * 3 + 3]
+            limits.append({
+                "key": key,
+                "concurrency": int(concurrency) if concurrency else None,
+                "rate": (int(rate), float(period)) if rate else None,
+                "running": running,
+                "parked": parked,
+            })
+        return limits
+
+    # -----------------------------
+    # Workflows
+    # -----------------------------
+    def submit_workflow(self, plan, batch_size=1000):
+        """
+        Enqueue the jobs of a workflow plan (see workflows.plan_workflow),
+        parents first, so each job's enqueue sees its parents. Returns the
+        workflow id and a name -> job id mapping, kept in workflow_key(id).
+        """
+        workflow_id = str(uuid.uuid4())
+        job_ids = {job["name"]: str(uuid.uuid4()) for job in plan}
+        enqueue = self._script("ENQUEUE")
+        pipe = self.r.pipeline(transaction=False)
+        pipe.hset(workflow_key(workflow_id), mapping=job_ids)
+        for count, job in enumerate(plan, start=1):
+            _, args = self._enqueue_args(
+                job["data"], None, None, None, job["priority"], job["queue"],
+                parents=[job_ids[name] for name in job["after"]],
+                workflow_id=workflow_id, job_id=job_ids[job["name"]],
+            )
+            enqueue(args=args, client=pipe)
+            if count % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
+        return workflow_id, job_ids
+
+    def get_workflow(self, workflow_id):
+        """A workflow's jobs as (name, job) pairs, job None once expired; None if unknown."""
+        job_ids = self.r.hgetall(workflow_key(workflow_id))
+        if not job_ids:
+            return None
+        names = sorted(job_ids)
+        jobs = {job["id"]: job for job in self.get_jobs([job_ids[name] for name in names])}
+        return [(name, jobs.get(job_ids[name])) for name in names]
 
     # -----------------------------
     # Listing Functions
     # -----------------------------
-    def list_jobs(self):
-        keys = self.r.keys("queuectl:jobs:*")
+    def get_jobs(self, job_ids):
+        """
+        Fetch job hashes in one pipelined round trip, decoded to their long
+        form (see records.decode_job) and tagged with their ids.
+        """
+        pipe = self.r.pipeline(transaction=False)
+        pipe.hgetall("queuectl:config")
+        for job_id in job_ids:
+            pipe.hgetall(f"queuectl:jobs:{job_id}")
+        config, *stored = pipe.execute()
         jobs = []
-        for k in keys:
-            jobs.append(self.r.hgetall(k))
+        for job_id, job in zip(job_ids, stored):
+            if job:
+                job = decode_job(job, config)
+                job["id"] = job_id
+                jobs.append(job)
         return jobs
 
-    def list_dlq(self):
-        ids = self.r.lrange("queuectl:dead_letter", 0, -1)
+    def get_job(self, job_id):
+        """One decoded job hash, or None if it does not exist."""
+        jobs = self.get_jobs([job_id])
+        return jobs[0] if jobs else None
+
+    def get_status(self, job_id):
+        """A job's status, in either record format (None if it does not exist)."""
+        status, legacy = self.r.hmget(f"queuectl:jobs:{job_id}", FIELDS["status"], "status")
+        return status or legacy
+
+    def list_state(self, state):
+        """Return all jobs currently in `state`, oldest first."""
+        return self.get_jobs(self.r.zrange(state_key(state), 0, -1))
+
+    def count_states(self):
+        """Return {state: count} straight from the state indexes."""
+        pipe = self.r.pipeline(transaction=False)
+        for state in JOB_STATES:
+            pipe.zcard(state_key(state))
+        return dict(zip(JOB_STATES, pipe.execute()))
+
+    def get_stats(self):
+        """
+        Return per-state counters, lifetime totals and queue depths (in
+        total, per priority lane and per named queue), independent of how
+        many jobs exist.
+        """
+        queues = self.known_queues()
+        pipe = self.r.pipeline(transaction=False)
+        pipe.hgetall(STATS_KEY)
+        pipe.hlen(SCHEDULES_KEY)
+        for queue in queues:
+            pipe.zcard(retry_key(queue))
+            pipe.llen(dead_letter_key(queue))
+            pipe.zcard(scheduled_key(queue))
+            for level in PRIORITY_LEVELS:
+                pipe.llen(lane_key(level, queue))
+        counters, schedules, *depths = pipe.execute()
+
+        by_queue = {}
+        lanes = dict.fromkeys(PRIORITY_LEVELS, 0)
+        per_queue = 3 + len(PRIORITY_LEVELS)
+        for i, queue in enumerate(queues):
+            retrying, dead_letter, scheduled, *lane_depths = depths[i * per_queue:(i + 1) * per_queue]
+            by_queue[queue] = {
+                "queued": sum(lane_depths),
+                "retry": retrying,
+                "dead_letter": dead_letter,
+                "scheduled": scheduled,
+            }
+            for level, depth in zip(PRIORITY_LEVELS, lane_depths):
+                lanes[level] += depth
+        return {
+            "states": {state: int(counters.get(state, 0)) for state in JOB_STATES},
+            "totals": {name: int(counters.get(name, 0)) for name in LIFETIME_TOTALS},
+            "cache": {name: int(counters.get(name, 0)) for name in CACHE_COUNTERS},
+            "queues": {
+                name: sum(depth[name] for depth in by_queue.values())
+                for name in ("queued", "retry", "dead_letter", "scheduled")
+            },
+            "lanes": lanes,
+            "by_queue": by_queue,
+            "schedules": schedules,
+        }
+
+    def metrics_text(self):
+        """Job timing metrics and current counts in the Prometheus text format."""
+        return metrics.render(self.r.hgetall(metrics.METRICS_KEY), self.get_stats())
+
+    def reset_metrics(self):
+        self.r.delete(metrics.METRICS_KEY)
+
+    def _scan_index(self, state, after=None, reverse=False, batch_size=SCAN_BATCH_SIZE):
+        """
+        Yield (score, job_id) from one state index in enqueue order (newest
+        first if `reverse`), strictly after the `after` (score, id) position,
+        reading `batch_size` entries per ZRANGE.
+        """
+        key = state_key(state)
+        bound = after[0] if after else ("+inf" if reverse else "-inf")
+        end = "-inf" if reverse else "+inf"
+        offset = 0
+        while True:
+            rows = self.r.zrange(key, bound, end, desc=reverse, byscore=True,
+                                 offset=offset, num=batch_size, withscores=True)
+            for job_id, score in rows:
+                if after and score == after[0] and (job_id >= after[1] if reverse else job_id <= after[1]):
+                    continue
+                yield score, job_id
+            if len(rows) < batch_size:
+                return
+            # Continue from the last score seen, skipping the entries that
+            # share it which were already returned
+            last = rows[-1][1]
+            ties = sum(1 for _, score in rows if score == last)
+            offset = offset + ties if last == bound else ties
+            bound = last
+
+    def iter_jobs(self, states=JOB_STATES, cursor=None, limit=None, reverse=False,
+                  batch_size=SCAN_BATCH_SIZE):
+        """
+        Stream (cursor, job) for jobs in `states`, ordered by enqueue time
+        across all of them. Index entries are read and job hashes fetched in
+        pipelined batches, so memory use does not grow with the number of
+        jobs. Pass a yielded cursor back in to continue after that job.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        merged = heapq.merge(
+            *(self._scan_index(state, after, reverse, batch_size) for state in states),
+            reverse=reverse,
+        )
+        remaining = limit
+        while remaining is None or remaining > 0:
+            entries = []
+            for entry in merged:
+                entries.append(entry)
+                if len(entries) == min(batch_size, remaining or batch_size):
+                    break
+            if not entries:
+                return
+            scores = dict((job_id, score) for score, job_id in entries)
+            for job in self.get_jobs([job_id for _, job_id in entries]):
+                if remaining is not None:
+                    remaining -= 1
+                yield encode_cursor(scores[job["id"]], job["id"]), job
+
+    def list_jobs(self):
         jobs = []
-        for job_id in ids:
-            jobs.append(self.r.hgetall(f"queuectl:jobs:{job_id}"))
+        for state in JOB_STATES:
+            jobs.extend(self.list_state(state))
         return jobs
-    
+
+    def list_dlq(self, queue=None):
+        """Dead jobs of one queue, or of every queue (default queue first)."""
+        queues = [queue] if queue else self.known_queues()
+        pipe = self.r.pipeline(transaction=False)
+        for name in queues:
+            pipe.lrange(dead_letter_key(name), 0, -1)
+        return self.get_jobs([job_id for ids in pipe.execute() for job_id in ids])
+
     def list_failed(self):
-        keys = self.r.keys("queuectl:jobs:*")
-        jobs = []
-        for k in keys:
-            job = self.r.hgetall(k)
-            if job.get("status") == "failed":
-                jobs.append(job)
-        return jobs
-    
+        return self.list_state("failed")
+
     def list_processing(self):
-        keys = self.r.keys("queuectl:jobs:*")
-        jobs = []
-        for k in keys:
-            job = self.r.hgetall(k)
-            if job.get("status") == "processing":
-                jobs.append(job)
-        return jobs
-    
+        return self.list_state("processing")
+
     def list_completed(self):
-        keys = self.r.keys("queuectl:jobs:*")
-        jobs = []
-        for k in keys:
-            job = self.r.hgetall(k)
-            if job.get("status") == "completed":
-                jobs.append(job)
-        return jobs
-    
+        return self.list_state("completed")
+
     def list_pending(self):
-        pending_jobs = []
-        job_keys = self.r.keys("queuectl:jobs:*")
-        for job_key in job_keys:
-            job = self.r.hgetall(job_key)
-            if job.get("status") == "pending":
-                job_id = job_key.split(":")[-1]
-                job["id"] = job_id  # add job ID for convenience
-                pending_jobs.append(job)
-        return pending_jobs
-    
+        return self.list_state("pending")
+
     def is_retry_queue_empty(self):
-        return self.r.zcard("queuectl:retry") == 0
+        return not any(self.r.zcard(retry_key(queue)) for queue in self.known_queues())
+
+    # -----------------------------
+    # Retention
+    # -----------------------------
+    def retention_settings(self):
+        config = self.r.hgetall("queuectl:config")
+        settings = {field: int(config.get(field) or 0) for field in RETENTION_TTLS.values()}
+        settings[MAX_RETAINED] = int(config.get(MAX_RETAINED) or 0)
+        settings[ARCHIVE] = config.get(ARCHIVE) == "1"
+        return settings
+
+    def _expired_ids(self, state, settings, now, batch_size):
+        key = finished_key(state)
+        ids = []
+        ttl = settings[RETENTION_TTLS[state]]
+        if ttl:
+            ids += self.r.zrangebyscore(key, "-inf", now - ttl, start=0, num=batch_size)
+        max_retained = settings[MAX_RETAINED]
+        if max_retained:
+            excess = self.r.zcard(key) - max_retained
+            if excess > 0:
+                ids += self.r.zrange(key, 0, min(excess, batch_size) - 1)
+        return list(dict.fromkeys(ids))
+
+    def expire_finished(self, archive=None, batch_size=EXPIRE_BATCH_SIZE):
+        """
+        Delete completed and dead jobs that are past their configured TTL or
+        beyond the max retained count (oldest finished first). If archiving
+        is enabled, `archive` is called with each batch of job hashes before
+        they are deleted. Returns the number of jobs deleted.
+        """
+        settings = self.retention_settings()
+        now = self.server_time()
+        expired = 0
+        for state in FINISHED_STATES:
+            while True:
+                ids = self._expired_ids(state, settings, now, batch_size)
+                if not ids:
+                    break
+                if archive is not None and settings[ARCHIVE]:
+                    archive(self.get_jobs(ids))
+                expired += len(self._script("EXPIRE")(
+                    keys=[finished_key(state)], args=[state, *ids]
+                ))
+                if len(ids) < batch_size:
+                    break
+        return expired
+
+    # -----------------------------
+    # Index Maintenance
+    # -----------------------------
+    def rebuild_indexes(self):
+        """
+        Rebuild the state (and finished-time) indexes from the job hashes
+        with an incremental SCAN. Used to adopt jobs written before the
+        indexes existed.
+        """
+        fresh = {state: {} for state in JOB_STATES}
+        finished = {state: {} for state in FINISHED_STATES}
+
+        now = self.server_time()
+
+        def parse_time(value):
+            try:
+                return parse_timestamp(value) or now
+            except ValueError:
+                return now
+
+        # Each field in its compact and its pre-migration form
+        names = ("status", "date_added", "completed_at", "failed_at")
+        fields = [f for name in names for f in (FIELDS[name], name)]
+
+        def index_batch(job_keys):
+            pipe = self.r.pipeline(transaction=False)
+            for job_key in job_keys:
+                pipe.hmget(job_key, *fields)
+            for job_key, values in zip(job_keys, pipe.execute()):
+                status, date_added, completed_at, failed_at = (
+                    values[i] or values[i + 1] for i in range(0, len(values), 2)
+                )
+                if status not in fresh:
+                    continue
+                job_id = job_key.split(":")[-1]
+                fresh[status][job_id] = parse_time(date_added)
+                if status in finished:
+                    finished[status][job_id] = parse_time(completed_at or failed_at)
+
+        batch = []
+        for job_key in self.r.scan_iter("queuectl:jobs:*", count=1000, _type="hash"):
+            batch.append(job_key)
+            if len(batch) >= 1000:
+                index_batch(batch)
+                batch = []
+        if batch:
+            index_batch(batch)
+
+        pipe = self.r.pipeline()
+        for state, members in fresh.items():
+            pipe.delete(state_key(state))
+            if members:
+                pipe.zadd(state_key(state), members)
+        for state, members in finished.items():
+            pipe.delete(finished_key(state))
+            if members:
+                pipe.zadd(finished_key(state), members)
+        pipe.execute()
+        return {state: len(members) for state, members in fresh.items()}
+
+    def migrate_records(self, batch_size=SCAN_BATCH_SIZE):
+        """
+        Rewrite job hashes stored in the pre-compact format (long field
+        names, formatted timestamps, per-job default settings) with an
+        incremental SCAN. Returns (migrated, skipped): skipped jobs changed
+        while being read and are picked up by running the migration again.
+        """
+        config = self.r.hgetall("queuectl:config")
+        migrate = self._script("MIGRATE")
+        migrated = skipped = 0
+
+        def migrate_batch(job_keys):
+            nonlocal migrated, skipped
+            pipe = self.r.pipeline(transaction=False)
+            for job_key in job_keys:
+                pipe.hgetall(job_key)
+            legacy = [(key, job) for key, job in zip(job_keys, pipe.execute()) if "status" in job]
+            if not legacy:
+                return
+            pipe = self.r.pipeline(transaction=False)
+            for job_key, job in legacy:
+                compact = encode_job(job, config)
+                args = [job_key.split(":")[-1], job["status"]]
+                for field, value in compact.items():
+                    args += [field, value]
+                migrate(args=args, client=pipe)
+            for done in pipe.execute():
+                migrated += done
+                skipped += 1 - done
+
+        batch = []
+        for job_key in self.r.scan_iter("queuectl:jobs:*", count=1000, _type="hash"):
+            batch.append(job_key)
+            if len(batch) >= batch_size:
+                migrate_batch(batch)
+                batch = []
+        if batch:
+            migrate_batch(batch)
+        if not skipped:
+            self.r.set(FORMAT_KEY, RECORD_FORMAT)
+        return migrated, skipped
+
+    def records_compact(self):
+        """
+        Whether every job is known to be in the compact format, so workers
+        can run: the store was created by this version or fully migrated.
+        """
+        if self.r.get(FORMAT_KEY) == RECORD_FORMAT:
+            return True
+        # Nothing has been enqueued into the store yet: it starts out compact
+        if not self.r.exists(STATS_KEY, lane_key(DEFAULT_PRIORITY), retry_key(), dead_letter_key()):
+            self.r.setnx(FORMAT_KEY, RECORD_FORMAT)
+            return True
+        return False
 
+    def recount_stats(self):
+        """
+        Rebuild the counters from the job data after they drift. State
+        counts are recomputed exactly; lifetime totals are only raised to
+        at least what is still stored, since expired history is gone.
+        """
+        counts = self.rebuild_indexes()
+        totals = self.r.hgetall(STATS_KEY)
+        floors = {
+            "enqueued_total": sum(counts.values()),
+            "completed_total": counts["completed"],
+            "dead_total": counts["dead"],
+        }
+        mapping = dict(counts)
+        for name, floor in floors.items():
+            mapping[name] = max(int(totals.get(name, 0)), floor)
+        self.r.hset(STATS_KEY, mapping=mapping)
+        return self.get_stats()
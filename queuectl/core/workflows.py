@@ -0,0 +1,116 @@
+# core/workflows.py
+#
+# Workflow specs for `queuectl workflow submit`: a set of named jobs and the
+# dependencies between them, submitted in one go. A spec is JSON, either a
+# list of jobs or {"jobs": [...]}:
+#
+#   {"jobs": [
+#     {"name": "shard", "command": "python shard.py {n}", "count": 500},
+#     {"name": "merge", "command": "python merge.py", "after": ["shard"]}
+#   ]}
+#
+# Each job takes a `command` and optionally `timeout`, `priority`, `queue`
+# and `after` (names of jobs it waits for). With `count` the entry expands
+# to that many jobs, shard-1 ... shard-N, with `{n}` in the command replaced
+# by 1 ... N; naming the entry in `after` waits for all of them.
+from queuectl.core.storage import parse_priority, parse_queue_name
+
+
+def _jobs(spec):
+    jobs = spec.get("jobs") if isinstance(spec, dict) else spec
+    if not isinstance(jobs, list) or not jobs:
+        raise ValueError("A workflow needs a non-empty list of jobs")
+    return jobs
+
+
+def plan_workflow(spec):
+    """
+    Validate a parsed workflow spec and expand it into the jobs to enqueue,
+    parents before children. Returns a list of dicts with `name`, `data`,
+    `after` (expanded job names), `priority` and `queue`. Raises ValueError
+    for unknown or duplicate names (also after `count` expansion), invalid
+    priorities or queue names, and dependency cycles.
+    """
+    groups, entries = {}, {}
+    for index, entry in enumerate(_jobs(spec), start=1):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Job {index} is not an object")
+        name = entry.get("name")
+        if not name or not isinstance(name, str):
+            raise ValueError(f"Job {index} has no name")
+        if not entry.get("command"):
+            raise ValueError(f"Job {name!r} has no command")
+        if name in groups:
+            raise ValueError(f"Duplicate job name {name!r}")
+        count = entry.get("count")
+        if count is None:
+            groups[name] = [name]
+        elif isinstance(count, int) and count > 0:
+            groups[name] = [f"{name}-{n}" for n in range(1, count + 1)]
+        else:
+            raise ValueError(f"Job {name!r} has an invalid count {count!r}")
+        try:
+            if entry.get("priority") is not None:
+                entry = {**entry, "priority": parse_priority(entry["priority"])}
+            if entry.get("queue") is not None:
+                entry = {**entry, "queue": parse_queue_name(entry["queue"])}
+        except ValueError as e:
+            raise ValueError(f"Job {name!r}: {e}") from None
+        entries[name] = entry
+
+    # Expanded names share one namespace: "shard" with a count of 2 and an
+    # explicit "shard-1" would be the same job
+    seen = {}
+    for name, jobs in groups.items():
+        for job_name in jobs:
+            if job_name in seen:
+                raise ValueError(
+                    f"Job name {job_name!r} is used by both {seen[job_name]!r} and {name!r}"
+                )
+            seen[job_name] = name
+
+    # Topological order over the entries (Kahn's algorithm), keeping the
+    # spec's own order among jobs that are ready at the same time
+    after = {}
+    for name, entry in entries.items():
+        parents = entry.get("after") or []
+        if isinstance(parents, str):
+            parents = [parents]
+        for parent in parents:
+            if parent not in entries:
+                raise ValueError(f"Job {name!r} waits for unknown job {parent!r}")
+        after[name] = list(dict.fromkeys(parents))
+    remaining = {name: len(parents) for name, parents in after.items()}
+    children = {name: [] for name in entries}
+    for name, parents in after.items():
+        for parent in parents:
+            children[parent].append(name)
+    ready = [name for name in entries if not remaining[name]]
+    order = []
+    while ready:
+        name = ready.pop(0)
+        order.append(name)
+        for child in children[name]:
+            remaining[child] -= 1
+            if not remaining[child]:
+                ready.append(child)
+    if len(order) != len(entries):
+        cycle = sorted(name for name in entries if remaining[name])
+        raise ValueError(f"Dependency cycle between jobs: {', '.join(cycle)}")
+
+    plan = []
+    for name in order:
+        entry = entries[name]
+        parents = [job for parent in after[name] for job in groups[parent]]
+        for n, job_name in enumerate(groups[name], start=1):
+            command = entry["command"]
+            if entry.get("count") is not None:
+                command = command.replace("{n}", str(n))
+            plan.append({
+                "name": job_name,
+                "data": {"command": command, "timeout": entry.get("timeout")},
+                "after": parents,
+                "priority": entry.get("priority"),
+                "queue": entry.get("queue"),
+            })
+    return plan
@@ -0,0 +1,92 @@
+"""
+Queue benchmarks for pytest-benchmark (pip install queuectl[bench]):
+
+    pytest queuectl/tests/test_benchmarks.py --benchmark-json=bench.json
+    pytest queuectl/tests/test_benchmarks.py --benchmark-compare
+
+Like the rest of the suite they flush the Redis database they run against.
+QUEUECTL_BENCH_SIZES (default 10000) sets the job counts list/status are
+timed at, e.g. 10000,100000,1000000. Skipped without the plugin; pass
+--benchmark-skip to leave them out of a normal test run.
+"""
+import os
+import threading
+import pytest
+from queuectl.core import bench
+from queuectl.core.storage import RedisStorage
+
+pytest.importorskip("pytest_benchmark")
+
+storage = RedisStorage()
+
+SIZES = [int(size) for size in os.environ.get("QUEUECTL_BENCH_SIZES", "10000").split(",")]
+
+
+@pytest.fixture(autouse=True)
+def clean_redis():
+    storage.r.flushdb()
+    yield
+    storage.r.flushdb()
+
+
+def test_enqueue_single(benchmark):
+    benchmark(storage.enqueue_job, bench.NOOP_JOB)
+
+
+def test_enqueue_bulk(benchmark):
+    benchmark.pedantic(
+        storage.enqueue_many, args=([bench.NOOP_JOB] * 1000,), rounds=20, iterations=1
+    )
+    benchmark.extra_info["jobs_per_round"] = 1000
+
+
+def test_claim_and_complete(benchmark):
+    def setup():
+        storage.enqueue_job(bench.NOOP_JOB)
+
+    def cycle():
+        (job_id, _), = storage.claim_jobs("BenchWorker", 1, timeout=None)
+        storage.mark_completed(job_id, "")
+
+    benchmark.pedantic(cycle, setup=setup, rounds=500)
+
+
+def test_pickup_latency(benchmark):
+    """Enqueue to claim, with a consumer already blocked on the queue."""
+    claimed = threading.Event()
+    stop = threading.Event()
+
+    def consume():
+        while not stop.is_set():
+            if storage.claim_jobs("BenchWorker", 1, timeout=1):
+                claimed.set()
+
+    consumer = threading.Thread(target=consume, daemon=True)
+    consumer.start()
+
+    def pickup():
+        claimed.clear()
+        storage.enqueue_job(bench.NOOP_JOB)
+        assert claimed.wait(5)
+
+    try:
+        benchmark.pedantic(pickup, rounds=200, warmup_rounds=5)
+    finally:
+        stop.set()
+        consumer.join()
+
+
+@pytest.mark.parametrize("workers", [1, 4, 16])
+def test_end_to_end_throughput(benchmark, workers):
+    result = benchmark.pedantic(
+        bench.bench_throughput, args=(storage, 200, (workers,)), rounds=1, iterations=1
+    )
+    benchmark.extra_info.update(result[str(workers)])
+
+
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("command", [["status"], ["list", "--limit", "100"], ["list"]],
+                         ids=["status", "list-page", "list"])
+def test_listing(benchmark, size, command):
+    storage.enqueue_many(bench.NOOP_JOB for _ in range(size))
+    benchmark.pedantic(bench.time_command, args=(command,), rounds=3, iterations=1)
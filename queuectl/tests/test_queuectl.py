@@ -1,13 +1,21 @@
+import json
 import time
 import pytest
 import subprocess
 from click.testing import CliRunner
 from queuectl.cli import cli
-from queuectl.core.storage import RedisStorage
+from queuectl.core.storage import RedisStorage, worker_owner
 
 storage = RedisStorage()
 
 
+def leased_owner(worker_name="Worker-1"):
+    """An owner id holding its worker lease, as a running worker's does."""
+    owner = worker_owner(worker_name)
+    storage.hold_worker_lease(owner)
+    return owner
+
+
 @pytest.fixture(autouse=True)
 def clean_redis():
     """Clean Redis before and after each test."""
@@ -55,7 +63,7 @@ def test_worker_processes_job():
     # Verify job completion
     job_keys = storage.r.keys("queuectl:jobs:*")
     assert job_keys, "No job keys found in Redis!"
-    job_data = storage.r.hgetall(job_keys[0])
+    job_data = storage.get_job(job_keys[0].split(":")[-1])
     assert job_data["status"] == "completed"
 
     # Stop worker gracefully
@@ -144,3 +152,995 @@ def test_clear_queues():
     runner.invoke(cli, ["queue", "clear"])
 
     assert storage.r.llen("queuectl:queue") == 0
+
+
+def test_state_indexes_follow_transitions():
+    job_id = storage.enqueue_job({"command": "echo indexed"})
+    assert [j["id"] for j in storage.list_pending()] == [job_id]
+
+    fetched_id, data = storage.get_next_job(leased_owner())
+    assert fetched_id == job_id
+    assert data["command"] == "echo indexed"
+    assert storage.count_states()["processing"] == 1
+
+    storage.mark_completed(job_id, "indexed")
+    counts = storage.count_states()
+    assert counts["completed"] == 1
+    assert counts["pending"] == counts["processing"] == 0
+    assert storage.list_completed()[0]["status"] == "completed"
+
+
+def test_status_counters_and_recount():
+    runner = CliRunner()
+    storage.enqueue_job({"command": "echo one"})
+    storage.enqueue_job({"command": "echo two"})
+    job_id, _ = storage.get_next_job(leased_owner())
+    storage.mark_completed(job_id, "done")
+
+    stats = storage.get_stats()
+    assert stats["states"]["pending"] == 1
+    assert stats["states"]["completed"] == 1
+    assert stats["totals"]["enqueued_total"] == 2
+    assert stats["totals"]["completed_total"] == 1
+
+    # Simulate drift, then let --recount rebuild from the job hashes
+    storage.r.hset("queuectl:stats", mapping={"pending": 42, "completed": 0})
+    result = runner.invoke(cli, ["status", "--recount"])
+    assert result.exit_code == 0
+    assert "pending: 1" in result.output
+    assert "completed: 1" in result.output
+
+
+def test_scripted_fail_backoff_and_dlq(monkeypatch):
+    # Retry times and index scores follow the Redis server's clock, however
+    # far this host's is off
+    client_clock = time.time
+    monkeypatch.setattr(time, "time", lambda: client_clock() + 3600)
+    job_id = storage.enqueue_job({"command": "false"}, max_retries=1, backoff_base=3, backoff_factor=2)
+    owner = leased_owner()
+    storage.get_next_job(owner)
+
+    before = storage.server_time()
+    assert storage.r.zscore("queuectl:state:processing", job_id) <= before
+    storage.mark_failed(job_id, "boom")
+    job = storage.get_job(job_id)
+    assert job["status"] == "failed"
+    assert job["attempts"] == "1"
+    assert job["last_error"] == "boom"
+    retry_at = storage.r.zscore("queuectl:retry", job_id)
+    assert before + 3 <= retry_at <= storage.server_time() + 3
+    assert job["next_retry_at"] == time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(retry_at))
+
+    # Force the retry to be due, promote it, then exhaust retries
+    storage.r.zadd("queuectl:retry", {job_id: 0})
+    storage.process_retry_queue()
+    assert storage.r.zcard("queuectl:retry") == 0
+    assert storage.get_next_job(owner)[0] == job_id
+    storage.mark_failed(job_id, "boom again")
+
+    assert [j["id"] for j in storage.list_dlq()] == [job_id]
+    stats = storage.get_stats()
+    assert stats["states"]["dead"] == 1
+    assert stats["states"]["failed"] == stats["states"]["processing"] == 0
+    assert stats["totals"]["failed_total"] == 2
+    assert stats["totals"]["dead_total"] == 1
+
+
+def test_bulk_enqueue_from_file_and_stdin(tmp_path):
+    runner = CliRunner()
+    jobs_file = tmp_path / "jobs.jsonl"
+    jobs_file.write_text('{"command": "echo one", "timeout": 5}\n\necho two\n{"command": "echo three"}\n')
+
+    result = runner.invoke(cli, ["enqueue", "--from-file", str(jobs_file), "--batch-size", "2"])
+    assert result.exit_code == 0, result.output
+    assert "Enqueued 3 jobs" in result.output
+
+    result = runner.invoke(cli, ["enqueue", "--stdin", "--timeout", "9"], input="echo four\n")
+    assert result.exit_code == 0, result.output
+
+    pending = {json.loads(j["data"])["command"]: json.loads(j["data"]) for j in storage.list_pending()}
+    assert set(pending) == {"echo one", "echo two", "echo three", "echo four"}
+    assert pending["echo one"]["timeout"] == 5
+    assert pending["echo two"]["timeout"] is None
+    assert pending["echo four"]["timeout"] == 9
+    assert storage.get_stats()["totals"]["enqueued_total"] == 4
+    assert storage.r.llen("queuectl:jobs") == 4
+
+
+def test_prefetch_claims_and_releases_jobs():
+    ids = [storage.enqueue_job({"command": f"echo {i}"}) for i in range(5)]
+
+    claimed = storage.claim_jobs("Worker-9", 3)
+    assert [job_id for job_id, _ in claimed] == ids[:3]
+    assert storage.r.lrange("queuectl:claimed:Worker-9", 0, -1) == ids[:3]
+    assert storage.get_stats()["states"]["processing"] == 3
+
+    storage.mark_completed(ids[0], "done")
+    assert storage.r.lrange("queuectl:claimed:Worker-9", 0, -1) == ids[1:3]
+
+    # Claims are only reclaimed once their owner's lease lapses (its worker
+    # died); those jobs are the next ones dequeued, in their original order.
+    # Owners with claims are registered, so recovery never scans for them.
+    assert storage.r.smembers("queuectl:claimants") == {"Worker-9"}
+    storage.hold_worker_lease("Worker-9")
+    assert storage.reclaim_abandoned() == 0
+    storage.drop_worker_lease("Worker-9")
+    assert storage.reclaim_abandoned() == 2
+    assert storage.r.llen("queuectl:claimed:Worker-9") == 0
+    assert storage.r.smembers("queuectl:claimants") == set()
+    assert [job_id for job_id, _ in storage.claim_jobs("Worker-1", 10)] == ids[1:]
+
+    # The previous owner can no longer release, complete or fail them
+    assert storage.release_jobs("Worker-9", ids[1:2]) == 0
+    assert not storage.mark_completed(ids[1], "stale", "Worker-9")
+    storage.mark_failed(ids[2], "stale", "Worker-9")
+    assert storage.get_status(ids[1]) == storage.get_status(ids[2]) == "processing"
+    assert storage.mark_completed(ids[1], "done", "Worker-1")
+    assert storage.r.smembers("queuectl:claimants") == {"Worker-1"}
+    assert storage.release_jobs("Worker-1") == 3
+    assert not storage.r.exists("queuectl:claimants")
+
+
+def wait_for(predicate, timeout=10, interval=0.05):
+    """Polls `predicate` until it is truthy or `timeout` seconds pass."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return False
+
+
+def test_worker_dispatches_back_to_back_and_stops_on_signal():
+    runner = CliRunner()
+    worker_proc = run_in_new_terminal(["queuectl", "worker", "start"])
+    assert wait_for(lambda: storage.r.exists("queuectl:worker:Worker-1"))
+
+    started = time.time()
+    for i in range(5):
+        storage.enqueue_job({"command": f"echo burst {i}"})
+    assert wait_for(lambda: storage.get_stats()["states"]["completed"] == 5, timeout=5)
+    # The old loop slept a full second between jobs
+    assert time.time() - started < 3
+
+    # An idle worker blocked on the queue still notices the stop signal
+    runner.invoke(cli, ["worker", "stop"])
+    assert worker_proc.wait(timeout=5) == 0
+
+
+def test_second_worker_start_leaves_running_jobs_alone(tmp_path):
+    runner = CliRunner()
+    runs = tmp_path / "runs"
+    job_id = storage.enqueue_job({"command": f"echo run >> {runs}; sleep 2"})
+    first = run_in_new_terminal(["queuectl", "worker", "start"])
+    assert wait_for(lambda: runs.exists(), timeout=10)
+
+    # Another `worker start` with the same worker names does not requeue the
+    # job the first one is running, so it runs once
+    second = run_in_new_terminal(["queuectl", "worker", "start"])
+    assert wait_for(lambda: storage.get_status(job_id) == "completed", timeout=10)
+    time.sleep(1)
+    assert runs.read_text() == "run\n"
+    assert storage.r.keys("queuectl:claimed:*") == []
+
+    runner.invoke(cli, ["worker", "stop"])
+    assert first.wait(timeout=5) == 0 and second.wait(timeout=5) == 0
+    assert storage.r.keys("queuectl:lease:*") == []
+
+
+def test_asyncio_engine_runs_jobs_concurrently_with_timeouts():
+    runner = CliRunner()
+    runner.invoke(cli, ["config", "set", "--max-retries", "0"])
+    for i in range(20):
+        storage.enqueue_job({"command": "sleep 1", "timeout": None})
+    slow_id = storage.enqueue_job({"command": "sleep 5", "timeout": 1})
+
+    worker_proc = run_in_new_terminal(
+        ["queuectl", "worker", "start", "--engine", "asyncio", "--concurrency", "50"]
+    )
+    # 20 one-second jobs finish together instead of one after another
+    assert wait_for(lambda: storage.get_stats()["states"]["completed"] == 20, timeout=6)
+
+    assert wait_for(lambda: storage.get_status(slow_id) == "dead", timeout=5)
+    assert "timeout of 1s" in storage.get_job(slow_id)["reason"]
+
+    runner.invoke(cli, ["worker", "stop"])
+    assert worker_proc.wait(timeout=5) == 0
+
+
+def test_supervisor_restarts_dead_worker_processes():
+    import os
+    import signal
+
+    runner = CliRunner()
+    worker_proc = run_in_new_terminal(
+        ["queuectl", "worker", "start", "--processes", "2", "--threads", "2"]
+    )
+
+    def worker_pids():
+        workers = storage.r.keys("queuectl:worker:*")
+        return {name.split(":")[-1]: storage.r.hget(name, "pid") for name in workers}
+
+    assert wait_for(lambda: len(worker_pids()) == 4, timeout=15)
+    pids = worker_pids()
+    assert set(pids) == {"Worker-1-1", "Worker-1-2", "Worker-2-1", "Worker-2-2"}
+    assert len(set(pids.values())) == 2
+
+    status_result = runner.invoke(cli, ["status"])
+    assert "4 worker(s) across 2 process(es)" in status_result.output
+
+    # Kill one child outright; the supervisor brings up a replacement
+    dead_pid = pids["Worker-2-1"]
+    os.kill(int(dead_pid), signal.SIGKILL)
+    assert wait_for(
+        lambda: worker_pids().get("Worker-2-1") not in (None, dead_pid), timeout=15
+    )
+
+    storage.enqueue_job({"command": "echo supervised"})
+    assert wait_for(lambda: storage.get_stats()["states"]["completed"] == 1, timeout=5)
+
+    runner.invoke(cli, ["worker", "stop"])
+    assert worker_proc.wait(timeout=10) == 0
+
+
+def test_supervisor_sigterm_stops_children_after_their_jobs():
+    import os
+    import signal
+
+    worker_proc = run_in_new_terminal(["queuectl", "worker", "start", "--processes", "2"])
+    assert wait_for(lambda: len(storage.r.keys("queuectl:worker:*")) == 2, timeout=15)
+    pids = {int(storage.r.hget(key, "pid")) for key in storage.r.keys("queuectl:worker:*")}
+
+    job_id = storage.enqueue_job({"command": "sleep 1"})
+    # Wait for the job to start running: one claimed but not started yet is
+    # handed back on stop instead
+    running = lambda: any(
+        (storage.r.hget(key, "current_job") or "").startswith(f"Job-{job_id}")
+        for key in storage.r.keys("queuectl:worker:*")
+    )
+    assert wait_for(running, timeout=5)
+    worker_proc.send_signal(signal.SIGTERM)
+    assert worker_proc.wait(timeout=15) == 0
+
+    # The running job finished instead of being cut off, and no child outlived the supervisor
+    assert storage.get_status(job_id) == "completed"
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+def test_retry_scheduler_single_leader_promotes_on_time():
+    import threading
+    from queuectl.core.scheduler import LEASE_KEY, RetryScheduler
+
+    stop_event = threading.Event()
+    wake_event = threading.Event()
+    leader = RetryScheduler(storage, stop_event, wake_event)
+    standby = RetryScheduler(storage, stop_event, threading.Event())
+    standby.owner = "other-host:1"
+
+    threads = [leader.start()]
+    assert wait_for(lambda: storage.r.get(LEASE_KEY) == leader.owner)
+    threads.append(standby.start())
+
+    job_id = storage.enqueue_job({"command": "false"}, max_retries=3, backoff_base=1)
+    storage.get_next_job(leased_owner())
+    storage.mark_failed(job_id, "boom")
+    due = storage.r.zscore("queuectl:retry", job_id)
+    wake_event.set()  # what the control channel does when a sooner retry appears
+
+    status = lambda: storage.get_status(job_id)
+    assert wait_for(lambda: status() == "pending", timeout=3, interval=0.01)
+    assert time.time() - due < 0.25
+    assert storage.r.llen("queuectl:jobs") == 1
+    assert not standby.is_leader
+
+    stop_event.set()
+    wake_event.set()
+    standby.wake_event.set()
+    for t in threads:
+        t.join(timeout=5)
+    assert storage.r.get(LEASE_KEY) is None
+
+
+def test_redis_url_flag_selects_server_and_shares_one_pool():
+    import os
+    from queuectl.core import connection
+    from queuectl.core.storage import RedisStorage as Storage
+
+    # Storages built without arguments all ride on the one pooled client
+    assert Storage().r is storage.r is connection.get_redis()
+
+    runner = CliRunner()
+    other_db = RedisStorage(db=1)
+    other_db.r.flushdb()
+    try:
+        result = runner.invoke(cli, ["--redis-url", "redis://localhost:6379/1", "enqueue", "echo elsewhere"])
+        assert result.exit_code == 0, result.output
+        assert os.environ["QUEUECTL_REDIS_URL"] == "redis://localhost:6379/1"
+        assert other_db.get_stats()["states"]["pending"] == 1
+    finally:
+        connection.configure(url=connection.DEFAULT_URL)
+        other_db.r.flushdb()
+
+    assert storage.get_stats()["states"]["pending"] == 0
+
+
+# Import-time budgets (seconds) for the paths shell scripts hit on every call.
+HELP_IMPORT_BUDGET = 0.25
+ENQUEUE_IMPORT_BUDGET = 0.25
+
+
+def test_cli_startup_is_lazy_and_within_budget():
+    import sys
+    import click
+    from queuectl.cli import COMMANDS
+
+    # The static registry must name every command module, with its real help
+    ctx = click.Context(cli)
+    for name, (_, _, short_help) in COMMANDS.items():
+        command = cli.get_command(ctx, name)
+        assert command is not None and command.get_short_help_str(limit=80) == short_help
+
+    probe = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "from queuectl.cli import cli\n"
+        "try:\n"
+        "    cli(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "help_time = time.perf_counter() - start\n"
+        "help_redis = 'redis' in sys.modules\n"
+        "start = time.perf_counter()\n"
+        "import queuectl.commands.enqueue\n"
+        "print(help_time, help_redis, time.perf_counter() - start, 'redis' in sys.modules)\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    assert "Commands:" in proc.stdout and "enqueue" in proc.stdout
+
+    help_time, help_redis, enqueue_time, enqueue_redis = proc.stdout.splitlines()[-1].split()
+    # Neither listing commands nor loading one should connect or even import redis
+    assert help_redis == "False" and enqueue_redis == "False"
+    assert float(help_time) < HELP_IMPORT_BUDGET
+    assert float(enqueue_time) < ENQUEUE_IMPORT_BUDGET
+
+
+def test_job_output_streams_to_log_while_running_and_compresses():
+    import os
+    from queuectl.core.job_log import job_log_path, segment_paths
+
+    runner = CliRunner()
+    job_id = storage.enqueue_job({"command": "echo first; sleep 3; echo second"})
+    log_path = job_log_path(job_id)
+    read_log = lambda: open(log_path).read() if os.path.exists(log_path) else ""
+
+    worker_proc = run_in_new_terminal(["queuectl", "worker", "start"])
+    # Output is in the log while the command is still running
+    assert wait_for(lambda: "first" in read_log(), timeout=3)
+    assert "\nsecond\n" not in read_log()
+    assert wait_for(lambda: storage.get_status(job_id) == "completed")
+    assert json.loads(storage.get_job(job_id)["result"]) == "first\nsecond"
+    runner.invoke(cli, ["worker", "stop"])
+    assert worker_proc.wait(timeout=5) == 0
+
+    job_id = storage.enqueue_job({"command": "seq 1 2000"})
+    worker_proc = run_in_new_terminal(
+        ["queuectl", "worker", "start", "--engine", "asyncio", "--compress-logs"]
+    )
+    assert wait_for(lambda: storage.get_status(job_id) == "completed")
+    runner.invoke(cli, ["worker", "stop"])
+    assert worker_proc.wait(timeout=5) == 0
+
+    log_path = job_log_path(job_id)
+    assert not os.path.exists(log_path) and segment_paths(log_path)
+    result = runner.invoke(cli, ["logs", job_id])
+    assert "\n1\n2\n" in result.output and "\n2000\n" in result.output
+    assert "Job finished." in result.output
+
+
+def test_logs_tail_since_offset_and_follow():
+    import uuid
+    from queuectl.core.job_log import JobLog
+
+    runner = CliRunner()
+    log_id = f"tail-{uuid.uuid4()}"
+    with JobLog(log_id) as job_log:
+        job_log.write(b"".join(b"row %d\n" % i for i in range(100000)))
+
+    result = runner.invoke(cli, ["logs", log_id, "--tail", "3"])
+    assert result.output.split("-" * 50 + "\n")[1] == "row 99997\nrow 99998\nrow 99999\n\n"
+
+    result = runner.invoke(cli, ["logs", log_id, "--since-offset", "6"])
+    assert result.output.split("-" * 50 + "\n")[1].startswith("row 1\nrow 2\n")
+    size = len(b"".join(b"row %d\n" % i for i in range(100000)))
+    assert f"Next offset: {size}" in result.stderr
+
+    # --follow prints output as the job produces it and returns once it is done
+    job_id = storage.enqueue_job({"command": "echo early; sleep 2; echo late"})
+    worker_proc = run_in_new_terminal(["queuectl", "worker", "start"])
+    started = time.time()
+    result = runner.invoke(cli, ["logs", job_id, "--follow"])
+    assert time.time() - started < 8
+    output = result.output
+    assert output.index("\nearly\n") < output.index("\nlate\n") < output.index("Job finished.")
+
+    runner.invoke(cli, ["worker", "stop"])
+    assert worker_proc.wait(timeout=5) == 0
+
+
+def test_list_pages_with_cursor_and_streams_jsonl():
+    runner = CliRunner()
+    storage.enqueue_many({"command": f"echo {i}"} for i in range(1200))
+    storage.claim_jobs("Worker-1", 5)
+
+    # Pages walk every job exactly once, in enqueue order across states
+    seen, cursor = [], None
+    while True:
+        args = ["list", "--format", "jsonl", "--limit", "500"] + (["--cursor", cursor] if cursor else [])
+        result = runner.invoke(cli, args)
+        assert result.exit_code == 0, result.output
+        rows = [json.loads(line) for line in result.stdout.splitlines()]
+        seen += [row["data"]["command"] for row in rows]
+        if "Next cursor:" not in result.stderr:
+            break
+        cursor = result.stderr.split("Next cursor: ")[1].strip()
+    assert seen == [f"echo {i}" for i in range(1200)]
+
+    result = runner.invoke(cli, ["list", "--state", "processing", "--sort", "-date_added"])
+    assert [line.split()[-1] for line in result.output.splitlines()[2:-1]] == ["4", "3", "2", "1", "0"]
+    assert "Total: 5 jobs" in result.output
+
+    # Piping into head gets the first rows at once, without a traceback
+    proc = subprocess.run("queuectl list --format jsonl | head -1", shell=True, capture_output=True, text=True)
+    assert json.loads(proc.stdout)["data"]["command"] == "echo 0"
+    assert "Error" not in proc.stderr and "Traceback" not in proc.stderr
+
+
+def test_retention_expires_and_archives_finished_jobs(tmp_path, monkeypatch):
+    from queuectl.core.archive import archive_jobs
+
+    monkeypatch.setenv("QUEUECTL_ARCHIVE_DIR", str(tmp_path))
+    runner = CliRunner()
+    result = runner.invoke(cli, ["config", "set", "--max-retries", "0", "--max-retained", "2", "--archive"])
+    assert result.exit_code == 0, result.output
+
+    ids = [storage.enqueue_job({"command": f"echo {i}"}) for i in range(5)]
+    dead_id = storage.enqueue_job({"command": "false"})
+    for job_id, _ in storage.claim_jobs("Worker-1", 6):
+        if job_id == dead_id:
+            storage.mark_failed(job_id, "boom")
+        else:
+            storage.mark_completed(job_id, f"done {job_id}")
+
+    # Only the newest two completed jobs are kept; the rest are archived
+    assert storage.expire_finished(archive=archive_jobs) == 3
+    assert [j["id"] for j in storage.list_completed()] == ids[3:]
+    assert not storage.r.exists(f"queuectl:jobs:{ids[0]}")
+    assert storage.get_stats()["states"]["completed"] == 2
+    assert storage.r.zcard("queuectl:finished:completed") == 2
+
+    result = runner.invoke(cli, ["list", "--archived", "--format", "jsonl"])
+    archived = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [(j["id"], j["result"]) for j in archived] == [(i, f"done {i}") for i in ids[:3]]
+
+    # A TTL expires dead jobs too; a job retried from the DLQ is spared
+    revived_id = storage.enqueue_job({"command": "false"})
+    storage.claim_jobs("Worker-1", 1)
+    storage.mark_failed(revived_id, "boom")
+    storage.retry_dead_job(revived_id)
+    runner.invoke(cli, ["config", "set", "--dead-ttl", "1"])
+    time.sleep(1.1)
+    assert storage.expire_finished() == 1  # archive not passed: deleted only
+    assert storage.r.llen("queuectl:dead_letter") == 0
+    assert storage.get_stats()["states"]["dead"] == 0
+    assert storage.get_status(revived_id) == "pending"
+    assert len(runner.invoke(cli, ["list", "--archived", "--format", "jsonl"]).stdout.splitlines()) == 3
+
+    runner.invoke(cli, ["config", "reset"])
+    assert storage.retention_settings()["max_retained"] == 0
+
+
+def test_compact_records_codecs_and_migration(monkeypatch):
+    from queuectl.core import records
+
+    # New jobs: short fields, epoch timestamps, no copies of default settings
+    job_id = storage.enqueue_job({"command": "echo compact"})
+    stored = storage.r.hgetall(f"queuectl:jobs:{job_id}")
+    assert set(stored) == {"s", "t", "qt", "d"} and stored["t"].isdigit()
+    job = storage.get_job(job_id)
+    assert job["status"] == "pending" and job["attempts"] == "0" and job["max_retries"] == "3"
+    assert job["date_added"] == time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(int(stored["t"])))
+
+    # Large payloads are compressed, and decoded transparently
+    monkeypatch.setenv("QUEUECTL_PAYLOAD_CODEC", "zlib")
+    big = {"command": "echo " + "x" * 5000}
+    big_id = storage.enqueue_job(big)
+    assert len(storage.r.hget(f"queuectl:jobs:{big_id}", "d")) < 200
+    claimed = dict(storage.claim_jobs("Worker-1", 2))
+    assert claimed[big_id] == big
+    storage.mark_completed(big_id, "y" * 5000)
+    assert json.loads(storage.get_job(big_id)["result"]) == "y" * 5000
+
+    # Records written by older versions are readable, and migrated in place
+    legacy = {
+        "date_added": "2024-01-02 03:04:05", "status": "pending", "attempts": "0",
+        "max_retries": "3", "backoff_base": "5", "backoff_factor": "2",
+        "data": json.dumps({"command": "echo legacy"}),
+    }
+    storage.r.hset("queuectl:jobs:legacy-1", mapping=legacy)
+    assert storage.get_job("legacy-1")["date_added"] == "2024-01-02 03:04:05"
+
+    # The store's first enqueue marked it compact. One an older version wrote
+    # to is not marked by later enqueues, and workers refuse to start until
+    # it is migrated
+    assert storage.records_compact()
+    storage.r.delete("queuectl:format")
+    storage.enqueue_job({"command": "true"})
+    assert not storage.records_compact()
+    result = CliRunner().invoke(cli, ["worker", "start"])
+    assert result.exit_code == 1 and "queuectl migrate" in result.output
+
+    result = CliRunner().invoke(cli, ["migrate"])
+    assert "Migrated 1 job(s)" in result.output
+    stored = storage.r.hgetall("queuectl:jobs:legacy-1")
+    assert set(stored) == {"s", "t", "bb", "d"} and stored["bb"] == "5"
+    job = storage.get_job("legacy-1")
+    assert job["date_added"] == legacy["date_added"] and job["backoff_base"] == "5"
+    assert records.decode_payload(stored["d"]) == {"command": "echo legacy"}
+    assert "Migrated 0 job(s)" in CliRunner().invoke(cli, ["migrate"]).output
+    assert storage.records_compact()
+
+
+def test_priority_lanes_strict_weighted_and_blocking_wakeup():
+    import threading
+
+    runner = CliRunner()
+    for priority in ("low", "normal", "high", "7"):
+        for i in range(10):
+            result = runner.invoke(cli, ["enqueue", "--priority", priority, f"echo {priority}"])
+            assert result.exit_code == 0
+    assert runner.invoke(cli, ["enqueue", "--priority", "urgent", "echo x"]).exit_code != 0
+    assert storage.get_stats()["lanes"] == {9: 10, 8: 0, 7: 10, 6: 0, 5: 10, 4: 0, 3: 0, 2: 0, 1: 10}
+    assert "priority 9 (high): 10" in runner.invoke(cli, ["status"]).output
+
+    def claim_priorities(count):
+        return [storage.get_job(job_id)["priority"] for job_id, _ in storage.claim_jobs("Worker-1", count)]
+
+    # Strict: highest lane first; released jobs go back to the front of their lane
+    runner.invoke(cli, ["config", "set", "--priority-mode", "strict"])
+    assert claim_priorities(12) == ["9"] * 10 + ["7"] * 2
+    assert storage.release_jobs("Worker-1") == 12
+    assert claim_priorities(1) == ["9"]
+
+    # Weighted: every non-empty lane gets its share, so none starves
+    result = runner.invoke(cli, ["config", "set", "--priority-mode", "weighted",
+                                 "--priority-weights", "high=4,7=2,normal=1,low=1"])
+    assert storage.r.hget("queuectl:config", "priority_weights") == "9=4,7=2,5=1,1=1"
+    claimed = claim_priorities(16)
+    assert {p: claimed.count(p) for p in set(claimed)} == {"9": 8, "7": 4, "5": 2, "1": 2}
+
+    # A worker blocked on an empty queue wakes as soon as any lane gets a job
+    storage.r.flushdb()
+    woke = {}
+
+    def wait_for_job():
+        started = time.time()
+        woke["jobs"] = storage.claim_jobs("Worker-2", 1, timeout=5)
+        woke["after"] = time.time() - started
+
+    waiter = threading.Thread(target=wait_for_job)
+    waiter.start()
+    time.sleep(0.3)
+    job_id = storage.enqueue_job({"command": "echo late"}, priority="low")
+    waiter.join()
+    assert [j for j, _ in woke["jobs"]] == [job_id] and woke["after"] < 2
+    assert storage.r.llen("queuectl:ready") == 0
+
+
+def test_named_queues_keep_separate_lanes_retries_and_dlqs():
+    import threading
+
+    runner = CliRunner()
+    for i in range(3):
+        runner.invoke(cli, ["enqueue", "--queue", "reports", f"echo report {i}"])
+    hook = runner.invoke(cli, ["enqueue", "--queue", "webhooks", "--priority", "high", "echo hook"])
+    assert hook.exit_code == 0
+    assert runner.invoke(cli, ["enqueue", "--queue", "bad:name", "echo x"]).exit_code != 0
+    assert storage.r.llen("queuectl:queue:reports:lane:5") == 3
+    assert storage.r.llen("queuectl:queue:webhooks:lane:9") == 1
+    assert storage.r.llen("queuectl:jobs") == 0
+    assert storage.known_queues() == ["default", "reports", "webhooks"]
+
+    # A worker only sees its own queues, preferring them in the order given
+    [(hook_id, data)] = storage.claim_jobs("Worker-1", 10, timeout=None, queues=("webhooks",))
+    assert data["command"] == "echo hook"
+    assert storage.claim_jobs("Worker-1", 10, timeout=None, queues=("webhooks", "default")) == []
+    report_id = storage.claim_jobs("Worker-2", 1, timeout=None, queues=("webhooks", "reports"))[0][0]
+    assert storage.get_job(report_id)["queue"] == "reports"
+
+    # Retries and dead jobs stay on their queue's own sets
+    runner.invoke(cli, ["config", "set", "--max-retries", "0"])
+    storage.mark_failed(hook_id, "boom")
+    assert storage.r.lrange("queuectl:queue:webhooks:dead_letter", 0, -1) == [hook_id]
+    assert storage.r.llen("queuectl:dead_letter") == 0
+    assert [job["id"] for job in storage.list_dlq("webhooks")] == [hook_id]
+    assert storage.list_dlq("reports") == []
+    assert storage.retry_dead_job(hook_id) == "dead"
+    assert storage.r.llen("queuectl:queue:webhooks:lane:9") == 1
+    runner.invoke(cli, ["config", "set", "--max-retries", "3"])
+    storage.mark_failed(report_id, "flaky")
+    assert storage.r.zrange("queuectl:queue:reports:retry", 0, -1) == [report_id]
+
+    output = runner.invoke(cli, ["status"]).output
+    assert "reports   2 / 1 / 0" in output and "webhooks  1 / 0 / 0" in output
+
+    # One blocking call covers every subscribed queue
+    storage.claim_jobs("Worker-3", 10, timeout=None, queues=("reports", "webhooks"))
+    woke = {}
+
+    def wait_for_job():
+        woke["jobs"] = storage.claim_jobs("Worker-4", 1, timeout=5, queues=("reports", "webhooks"))
+
+    waiter = threading.Thread(target=wait_for_job)
+    waiter.start()
+    time.sleep(0.3)
+    job_id = storage.enqueue_job({"command": "echo late"}, queue="webhooks")
+    waiter.join(timeout=3)
+    assert [j for j, _ in woke["jobs"]] == [job_id]
+
+
+def test_delayed_and_recurring_jobs_are_promoted_listed_and_cancelled():
+    import threading
+    from queuectl.core.scheduler import RetryScheduler
+    from queuectl.core.schedules import CronSchedule, parse_duration
+
+    assert parse_duration("1h30m") == 5400 and parse_duration("45") == 45
+    assert time.localtime(CronSchedule("*/15 9-17 * * mon-fri").next_after(
+        time.mktime((2026, 10, 17, 12, 0, 0, 0, 0, -1))  # a Saturday
+    ))[:5] == (2026, 10, 19, 9, 0)
+
+    runner = CliRunner()
+    assert runner.invoke(cli, ["enqueue", "--delay", "1s", "echo soon"]).exit_code == 0
+    result = runner.invoke(cli, ["enqueue", "--queue", "nightly", "--run-at", "2099-01-01 00:00", "echo later"])
+    assert "Scheduled to run at 2099-01-01 00:00:00" in result.output
+    assert runner.invoke(cli, ["enqueue", "--delay", "soon", "echo x"]).exit_code != 0
+    soon, later = [job["id"] for job in storage.list_scheduled_jobs()]
+    assert storage.count_states()["scheduled"] == 2
+    assert storage.r.llen("queuectl:jobs") == 0
+
+    result = runner.invoke(cli, ["schedule", "add", "--cron", "0 3 * * *", "--queue", "nightly", "echo cron"])
+    assert result.exit_code == 0
+    assert runner.invoke(cli, ["schedule", "add", "--cron", "61 * * * *", "echo bad"]).exit_code != 0
+    [entry] = storage.list_schedules()
+    output = runner.invoke(cli, ["schedule", "list"]).output
+    assert "'0 3 * * *' → echo cron" in output and f"[{later}] echo later" in output
+
+    # The scheduler promotes the delayed job when it falls due...
+    stop_event, wake_event = threading.Event(), threading.Event()
+    scheduler_thread = RetryScheduler(storage, stop_event, wake_event).start()
+    try:
+        assert wait_for(lambda: storage.get_status(soon) == "pending", timeout=3, interval=0.02)
+        assert storage.r.llen("queuectl:jobs") == 1
+
+        # ...and fires a due recurring schedule onto its queue, rescheduling it
+        storage.r.zadd("queuectl:schedules:due", {entry["id"]: time.time()})
+        wake_event.set()
+        assert wait_for(lambda: storage.r.llen("queuectl:queue:nightly:lane:5") == 1, timeout=3)
+        assert storage.list_schedules()[0]["next_run"] == CronSchedule("0 3 * * *").next_after()
+    finally:
+        stop_event.set()
+        wake_event.set()
+        scheduler_thread.join(timeout=5)
+    fired = storage.claim_jobs("Worker-1", 1, timeout=None, queues=("nightly",))[0][0]
+    assert storage.get_job(fired)["schedule"] == entry["id"]
+
+    # Cancelling removes schedules and not-yet-run jobs, and nothing else
+    assert "Scheduled job" in runner.invoke(cli, ["schedule", "cancel", later]).output
+    assert storage.get_job(later) is None and storage.count_states()["scheduled"] == 0
+    assert "removed" in runner.invoke(cli, ["schedule", "cancel", entry["id"]]).output
+    assert storage.list_schedules() == []
+    assert "No schedule" in runner.invoke(cli, ["schedule", "cancel", soon]).output
+
+
+def test_dependencies_release_on_last_parent_and_propagate_failure(tmp_path):
+    runner = CliRunner()
+    shards = [storage.enqueue_job({"command": f"echo {n}"}) for n in range(3)]
+    after = [arg for shard in shards for arg in ("--after", shard)]
+    assert runner.invoke(cli, ["enqueue", *after, "echo merge"]).exit_code == 0
+    assert "Unknown job" in runner.invoke(cli, ["enqueue", "--after", "nope", "echo x"]).output
+    [merge] = [job["id"] for job in storage.list_state("waiting")]
+    assert storage.get_job(merge)["pending_parents"] == "3"
+
+    # The child is released the moment its last parent completes
+    claimed = [job_id for job_id, _ in storage.claim_jobs("Worker-1", 3, timeout=None)]
+    for job_id in claimed[:2]:
+        storage.mark_completed(job_id, {"ok": True})
+    assert storage.get_status(merge) == "waiting"
+    storage.mark_completed(claimed[2], {"ok": True})
+    assert storage.get_status(merge) == "pending"
+    assert storage.claim_jobs("Worker-1", 1, timeout=None)[0][0] == merge
+    assert not storage.r.keys("queuectl:deps:*")
+
+    # A workflow: two shards, then a merge, then a report; a dead shard
+    # takes the rest of the graph to the DLQ with it
+    spec = tmp_path / "workflow.json"
+    spec.write_text(json.dumps({"jobs": [
+        {"name": "report", "command": "echo report", "after": ["merge"]},
+        {"name": "merge", "command": "echo merge", "after": ["shard"]},
+        {"name": "shard", "command": "echo {n}", "count": 2},
+    ]}))
+    result = runner.invoke(cli, ["workflow", "submit", str(spec)])
+    assert result.exit_code == 0 and "submitted with 4 jobs" in result.output
+    workflow_id = result.output.split()[2]
+    jobs = dict(storage.get_workflow(workflow_id))
+    assert json.loads(jobs["shard-2"]["data"])["command"] == "echo 2"
+    assert jobs["report"]["status"] == "waiting" and jobs["report"]["workflow"] == workflow_id
+
+    storage.r.hset("queuectl:config", "max_retries", 0)
+    storage.claim_jobs("Worker-1", 2, timeout=None)
+    storage.mark_failed(jobs["shard-1"]["id"], "boom")
+    jobs = dict(storage.get_workflow(workflow_id))
+    assert [jobs[name]["status"] for name in ("merge", "report")] == ["dead", "dead"]
+    assert jobs["report"]["reason"] == f"dependency {jobs['merge']['id']} failed"
+    output = runner.invoke(cli, ["workflow", "status", workflow_id]).output
+    assert "dead 3, processing 1" in output
+
+    # Retrying the graph in any order waits on parents again
+    assert storage.retry_dead_job(jobs["merge"]["id"]) == "dead"
+    assert storage.get_status(jobs["merge"]["id"]) == "waiting"
+    storage.retry_dead_job(jobs["shard-1"]["id"])
+    storage.mark_completed(jobs["shard-2"]["id"], {})
+    shard = storage.claim_jobs("Worker-1", 1, timeout=None)[0][0]
+    storage.mark_completed(shard, {})
+    assert storage.get_status(jobs["merge"]["id"]) == "pending"
+
+    bad = tmp_path / "cycle.json"
+    bad.write_text(json.dumps([
+        {"name": "a", "command": "true", "after": ["b"]},
+        {"name": "b", "command": "true", "after": ["a"]},
+    ]))
+    assert "Dependency cycle" in runner.invoke(cli, ["workflow", "submit", str(bad)]).output
+
+    # Bad settings and names colliding after expansion are rejected up front
+    before = storage.r.dbsize()
+    for jobs, error in (
+        ([{"name": "a", "command": "true", "priority": "urgent"}], "Job 'a': Invalid priority 'urgent'"),
+        ([{"name": "a", "command": "true", "queue": "no spaces"}], "Job 'a': Invalid queue name"),
+        ([{"name": "s", "command": "true", "count": 2}, {"name": "s-1", "command": "true"}],
+         "Job name 's-1' is used by both 's' and 's-1'"),
+    ):
+        bad.write_text(json.dumps(jobs))
+        result = runner.invoke(cli, ["workflow", "submit", str(bad)])
+        assert result.exit_code == 1 and error in result.output, result.output
+    assert storage.r.dbsize() == before
+
+
+def test_idempotency_keys_and_result_cache_skip_redundant_runs():
+    runner = CliRunner()
+    for _ in range(2):
+        result = runner.invoke(cli, ["enqueue", "--idempotency-key", "order-1", "echo charge"])
+        assert result.exit_code == 0
+    assert "not enqueued again" in result.output and "Job enqueued" not in result.output
+    [job] = storage.list_pending()
+    assert job["idempotency_key"] == "order-1"
+    assert storage.count_states()["pending"] == 1
+
+    # A once-deleted job frees its key
+    storage.r.delete(f"queuectl:jobs:{job['id']}")
+    assert storage.enqueue_job({"command": "echo charge"}, idempotency_key="order-1") != job["id"]
+    storage.r.flushdb()
+
+    # The first run of a cacheable job misses and stores its result; an
+    # identical job queued meanwhile, and one enqueued later, reuse it
+    data = {"command": "echo render", "timeout": None}
+    first = storage.enqueue_job(data, cache_ttl=60)
+    queued = storage.enqueue_job(data, cache_ttl=60)
+    other = storage.enqueue_job({"command": "echo other"}, cache_ttl=60)
+    assert storage.claim_jobs("Worker-1", 1, timeout=None)[0][0] == first
+    storage.mark_completed(first, {"output": "rendered"})
+    assert storage.claim_jobs("Worker-1", 1, timeout=None)[0][0] == other
+    assert storage.get_status(queued) == "completed"
+    assert json.loads(storage.get_job(queued)["result"]) == {"output": "rendered"}
+
+    assert runner.invoke(cli, ["enqueue", "--cache-ttl", "1m", "echo render"]).exit_code == 0
+    [later] = [job for job in storage.list_completed() if job["id"] not in (first, queued)]
+    assert later["cache_hit"] == "1" and storage.r.llen("queuectl:jobs") == 0
+    assert storage.r.llen("queuectl:ready") == 0
+    assert storage.get_stats()["cache"] == {"cache_hits": 2, "cache_misses": 1}
+    assert "2 hits, 1 misses (67% hit rate)" in runner.invoke(cli, ["status"]).output
+    assert 0 < storage.r.ttl(f"queuectl:cache:{later['cache_key']}") <= 60
+
+
+def test_concurrency_and_rate_limits_park_jobs_and_let_others_through():
+    from queuectl.core.storage import claim_args, claimed_key, parse_claimed, parse_rate
+
+    assert parse_rate("100/s") == (100, 1) and parse_rate("20/10s") == (20, 10)
+    runner = CliRunner()
+    result = runner.invoke(cli, ["enqueue", "--concurrency-key", "db", "--concurrency", "2", "echo db"])
+    assert result.exit_code == 0
+    assert runner.invoke(cli, ["enqueue", "--concurrency", "2", "echo x"]).exit_code != 0
+    db = storage.r.lrange("queuectl:jobs", 0, -1)
+    db += [storage.enqueue_job({"command": "echo db"}, concurrency_key="db") for _ in range(3)]
+    free = [storage.enqueue_job({"command": "echo free"}) for _ in range(2)]
+
+    # Two db jobs fit; the rest are parked and the unconstrained jobs still
+    # flow past them instead of the worker waiting for a slot
+    claimed = [job_id for job_id, _ in storage.claim_jobs("Worker-1", 4, timeout=None)]
+    assert claimed == db[:2] + free
+    assert storage.r.llen("queuectl:limit:db:parked") == 2
+    assert storage.claim_jobs("Worker-2", 1, timeout=None) == []
+    assert storage.r.llen("queuectl:ready") == 0
+
+    # Finishing a db job frees its slot and requeues one parked job, waking
+    # a blocked worker
+    storage.mark_completed(db[0], {})
+    assert storage.claim_jobs("Worker-2", 1, timeout=1)[0][0] == db[2]
+    storage.mark_failed(db[1], "boom")
+    assert storage.claim_jobs("Worker-2", 2, timeout=None)[0][0] == db[3]
+    assert "db: running 2/2, parked 0" in runner.invoke(cli, ["status"]).output
+
+    # A rate limit parks jobs until the bucket refills
+    storage.r.flushdb()
+    storage.set_limit("api", rate=parse_rate("2/s"))
+    api = [storage.enqueue_job({"command": "echo api"}, concurrency_key="api") for _ in range(3)]
+    assert len(storage.claim_jobs("Worker-1", 3, timeout=None)) == 2
+    next_token = storage.unpark_due()
+    assert next_token is not None and 0 < next_token - time.time() <= 0.5
+    time.sleep(next_token - time.time() + 0.05)
+    assert storage.unpark_due() is None
+    assert storage.claim_jobs("Worker-1", 1, timeout=None)[0][0] == api[2]
+
+    # One dequeue script call only pops a bounded number of jobs, however
+    # many a saturated key could park, and reports that more are queued...
+    storage.r.flushdb()
+    storage.set_limit("one", concurrency=1)
+    storage.enqueue_many(({"command": "true"} for _ in range(50)), concurrency_key="one")
+    free = storage.enqueue_job({"command": "echo free"})
+    assert len(storage.claim_jobs("Worker-1", 1, timeout=None)) == 1
+    reply = storage._script("DEQUEUE")(keys=[claimed_key("Worker-2")], args=claim_args("Worker-2", 1))
+    assert parse_claimed(reply) == (True, [])
+    assert storage.r.llen("queuectl:limit:one:parked") == 2
+    assert storage.r.llen("queuectl:jobs") == storage.r.llen("queuectl:ready") == 48
+
+    # ...so the unconstrained job behind the parked ones is claimed in a
+    # single claim_jobs() call, and wake-up tokens stay in step with the lanes
+    claimed = storage.claim_jobs("Worker-2", 1, timeout=1)
+    assert [job_id for job_id, _ in claimed] == [free]
+    assert storage.r.llen("queuectl:limit:one:parked") == 49
+    assert storage.r.llen("queuectl:jobs") == storage.r.llen("queuectl:ready") == 0
+
+
+def test_job_timing_metrics_and_prometheus_exporter(monkeypatch):
+    import socket
+    import urllib.request
+    from queuectl.core import metrics, records
+
+    fast, slow = (storage.enqueue_job({"command": "true"}, queue=queue) for queue in ("default", "etl"))
+    time.sleep(0.03)
+    claimed = storage.claim_jobs("Worker-1", 2, timeout=None, queues=("default", "etl"))
+    assert [job_id for job_id, _ in claimed] == [fast, slow]
+    job = storage.get_job(fast)
+    assert float(job["started_at"]) - float(job["queued_at"]) >= 0.03
+    storage.mark_completed(fast, {})
+    storage.r.hset("queuectl:config", "max_retries", 0)
+    storage.mark_failed(slow, "boom")
+
+    # Redis latency is measured per process and flushed into the same hash
+    recorder = metrics.enable()
+    try:
+        storage.enqueue_job({"command": "true"})
+        recorder.flush(storage.r)
+    finally:
+        metrics.recorder = None
+
+    text = CliRunner().invoke(cli, ["metrics"]).output
+    assert "# TYPE queuectl_job_queue_wait_seconds histogram" in text
+    assert 'queuectl_job_queue_wait_seconds_bucket{queue="default",le="0.025"} 0' in text
+    assert 'queuectl_job_queue_wait_seconds_count{queue="default"} 1' in text
+    assert 'queuectl_job_run_seconds_count{queue="etl",outcome="dead"} 1' in text
+    assert 'queuectl_jobs_finished_total{queue="default",outcome="completed"} 1' in text
+    assert 'queuectl_jobs_enqueued_total{queue="default"} 2' in text
+    assert 'queuectl_redis_op_seconds_count{op="enqueue"} 1' in text
+    assert 'queuectl_jobs{state="pending"} 1' in text and 'queuectl_queue_depth{queue="etl"} 0' in text
+
+    with socket.socket() as probe:
+        probe.bind(("", 0))
+        port = probe.getsockname()[1]
+    server = metrics.serve(port, storage.metrics_text)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert 'queuectl_jobs_enqueued_total{queue="default"} 2' in response.read().decode()
+    finally:
+        server.shutdown()
+    assert "reset" in CliRunner().invoke(cli, ["metrics", "--reset"]).output
+    assert "queuectl_job_run_seconds" not in storage.metrics_text()
+
+    # Job times come from the Redis server's clock: a worker whose clock is
+    # an hour ahead does not skew the histograms. Finish times keep fractions
+    storage.r.flushdb()
+    skewed = storage.enqueue_job({"command": "true"})
+    real_time = time.time
+    with monkeypatch.context() as m:
+        m.setattr(time, "time", lambda: real_time() + 3600)
+        storage.claim_jobs("Worker-1", 1, timeout=None)
+        storage.mark_completed(skewed, {})
+    stored = storage.r.hgetall(f"queuectl:jobs:{skewed}")
+    assert abs(float(stored["st"]) - real_time()) < 60 and "." in stored["ct"]
+    for metric in ("queuectl_job_queue_wait_seconds|queue=\"default\"",
+                   "queuectl_job_run_seconds|queue=\"default\",outcome=\"completed\""):
+        assert float(storage.r.hget("queuectl:metrics", metric + "|sum")) < 60
+    assert storage.get_job(skewed)["completed_at"] == records.format_timestamp(float(stored["ct"]))
+
+
+def test_bench_command_reports_json_and_compares(tmp_path):
+    runner = CliRunner()
+    storage.enqueue_job({"command": "true"})
+    result = runner.invoke(cli, ["bench", "--only", "enqueue"])
+    assert result.exit_code == 1 and "not empty" in result.output
+    storage.r.flushdb()
+
+    output = tmp_path / "bench.json"
+    result = runner.invoke(cli, [
+        "bench", "--jobs", "50", "--latency-samples", "5", "--workers", "1,2",
+        "--throughput-jobs", "10", "--sizes", "20,40", "--output", str(output),
+    ])
+    assert result.exit_code == 0, result.output
+    results = json.loads(output.read_text())["results"]
+    assert results["enqueue"]["single"]["jobs"] == 50 and results["enqueue"]["bulk"]["jobs_per_sec"] > 0
+    assert 0 < results["latency"]["p50_ms"] <= results["latency"]["p99_ms"]
+    assert set(results["throughput"]) == {"1", "2"}
+    assert set(results["listing"]["40"]) == {"status_seconds", "list_page_seconds", "list_seconds"}
+    assert "latency.p99_ms" in result.output
+    assert storage.r.dbsize() == 0
+
+    # A baseline that was ten times as fast makes the comparison fail
+    baseline = json.loads(output.read_text())
+    baseline["results"]["enqueue"]["bulk"]["jobs_per_sec"] *= 10
+    (tmp_path / "baseline.json").write_text(json.dumps(baseline))
+    result = runner.invoke(cli, [
+        "bench", "--only", "enqueue", "--jobs", "50",
+        "--compare", str(tmp_path / "baseline.json"), "--max-regression", "40",
+    ])
+    assert result.exit_code == 1
+    assert "enqueue.bulk.jobs_per_sec" in result.output and "regressed by more than 40.0%" in result.output
+
+
+def test_worker_profile_phase_timers_and_stack_dump(tmp_path):
+    import threading
+    from queuectl.core import profiling
+    from queuectl.core.queue_manager import process_job
+
+    # Disabled, phases are one shared no-op context
+    assert profiling.profiler is None
+    assert profiling.phase("run") is profiling.phase("log")
+
+    profiler = profiling.enable()
+    try:
+        storage.enqueue_job({"command": "echo profiled"})
+        storage.enqueue_job({"command": "exit 3"})
+        for job_id, data in storage.claim_jobs("Worker-1", 2, timeout=None):
+            process_job(job_id, data, worker_name="Worker-1")
+        storage.claim_jobs("Worker-1", 1, timeout=0.1)
+
+        summary = profiler.summary()
+        for name in ("dequeue", "idle", "decode", "registry", "run", "log", "complete", "fail"):
+            assert f"\n  {name} " in summary
+        assert summary.index("  run ") < summary.index("  decode ")  # slowest phases first
+        # A summary starts a new window; the cumulative one keeps everything
+        assert "(no jobs)" in profiler.summary()
+        assert "complete" in profiler.summary(cumulative=True)
+
+        busy = threading.Event()
+        threading.Thread(target=busy.wait, args=(5,), name="Worker-7", daemon=True).start()
+        path = profiling.dump(str(tmp_path), seconds=0.1, echo=lambda message: None)
+        busy.set()
+    finally:
+        profiling.profiler = None
+
+    report = open(path).read()
+    assert "in total over" in report and "--- Thread Worker-7" in report
+    folded = open(path.replace(".txt", ".folded")).read()
+    assert any(line.startswith("Worker-7;") and line.split()[-1].isdigit() for line in folded.splitlines())
@@ -6,6 +6,7 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=["click", "redis"],
+    extras_require={"msgpack": ["msgpack"], "bench": ["pytest-benchmark"]},
     entry_points={
         "console_scripts": [
             "queuectl = queuectl.cli:cli",